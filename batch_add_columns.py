@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Merge consecutive ADD COLUMN statements on one table into a single ALTER TABLE.
+
+Each ALTER TABLE takes its own ACCESS EXCLUSIVE lock and may rewrite the
+table; one ALTER with several ADD COLUMN actions does both once.
+"""
+import os
+import re
+import sys
+import glob
+import argparse
+from collections import namedtuple
+
+from sql_lexer import join_segments, significant_tokens, split_statements, unquote_ident
+
+# One ALTER TABLE ... ADD COLUMN; target is the "TABLE [IF EXISTS] [ONLY] name" part as written
+AddColumn = namedtuple('AddColumn', 'target table column definition')
+
+# One merged run: where it starts, the table and the columns it adds
+Batch = namedtuple('Batch', 'line table columns')
+
+# The information_schema guard make_migrations_idempotent wraps each ADD COLUMN in
+_GUARDED = re.compile(r'''\A\s*BEGIN\s+IF\s+NOT\s+EXISTS\s*\(\s*SELECT\s+1\s+FROM\s+information_schema\.columns\s+
+    WHERE\s+table_name\s*=\s*'(\w+)'\s+AND\s+column_name\s*=\s*'(\w+)'\s*\)\s+THEN\s+
+    (ALTER\s+TABLE\s[\s\S]*?;)\s*END\s+IF\s*;\s*END\s*\Z''', re.IGNORECASE | re.VERBOSE)
+
+
+def _parse_alter(text):
+    """AddColumn for a single-action ALTER TABLE ... ADD [COLUMN] [IF NOT EXISTS] text, or None"""
+    tokens = significant_tokens(text)
+    words = [tok.text.upper() if tok.kind == 'word' else tok.text for tok in tokens]
+    if words[:2] != ['ALTER', 'TABLE'] or words[-1:] != [';']:
+        return None
+    i = 2
+    if words[i:i + 2] == ['IF', 'EXISTS']:
+        i += 2
+    if words[i:i + 1] == ['ONLY']:
+        i += 1
+    name_start = i
+    while i + 2 < len(tokens) and tokens[i + 1].text == '.':
+        i += 2
+    table = unquote_ident(tokens[i].text).lower() if i < len(tokens) else None
+    i += 1
+    if words[i:i + 1] != ['ADD']:
+        return None
+    target = ' '.join(tok.text for tok in tokens[1:name_start]) + ' ' + ''.join(tok.text for tok in tokens[name_start:i])
+    i += 1
+    if words[i:i + 1] == ['COLUMN']:
+        i += 1
+    if words[i:i + 3] == ['IF', 'NOT', 'EXISTS']:
+        i += 3
+    # ADD CONSTRAINT / PRIMARY KEY / UNIQUE ... are not columns
+    if i >= len(tokens) - 2 or tokens[i].kind not in ('word', 'quoted_ident') or words[i] in ('CONSTRAINT', 'PRIMARY', 'UNIQUE', 'CHECK', 'FOREIGN', 'EXCLUDE'):
+        return None
+    depth = 0
+    for tok in tokens[i + 1:-1]:
+        if tok.text == '(':
+            depth += 1
+        elif tok.text == ')':
+            depth -= 1
+        elif tok.text == ',' and depth == 0:
+            # Already several actions in one ALTER
+            return None
+    column = unquote_ident(tokens[i].text)
+    definition = text[tokens[i + 1].start:tokens[-1].start].strip()
+    return AddColumn(target, table, tokens[i].text if column != column.lower() else column, definition)
+
+
+def parse_add_column(stmt):
+    """AddColumn for a plain or information_schema-guarded ADD COLUMN statement, or None"""
+    if stmt.kind == 'statement' and stmt.starts_with('ALTER', 'TABLE'):
+        return _parse_alter(stmt.text)
+    if stmt.kind != 'do' or len(stmt.bodies) != 1 or 'information_schema' not in stmt.text:
+        return None
+    match = _GUARDED.match(stmt.body)
+    if not match:
+        return None
+    guard_table, guard_column, inner = match.groups()
+    add = _parse_alter(inner)
+    if add is None or add.table != guard_table.lower() or add.column.lower() != guard_column.lower():
+        return None
+    return add
+
+
+def _mentions(definition, columns):
+    """True if a column definition refers to one of columns, e.g. in a CHECK or GENERATED expression"""
+    names = {c.lower() for c in columns}
+    return any(tok.kind in ('word', 'quoted_ident') and unquote_ident(tok.text).lower() in names
+               for tok in significant_tokens(definition))
+
+
+def _comment_lines(trivia):
+    """Comments between two merged statements, indented to sit inside the merged ALTER"""
+    return [f'  {line.strip()}' for line in trivia.strip().splitlines() if line.strip()]
+
+
+def render_batch(adds, gaps):
+    """One ALTER TABLE adding every column of adds; gaps are the trivia texts between them"""
+    lines = [f'ALTER {adds[0].target}']
+    for n, add in enumerate(adds):
+        if n:
+            lines.extend(_comment_lines(gaps[n - 1]))
+        end = ';' if n == len(adds) - 1 else ','
+        lines.append(f'  ADD COLUMN IF NOT EXISTS {add.column} {add.definition}{end}')
+    return '\n'.join(lines)
+
+
+def batch_add_columns(content):
+    """Merge runs of consecutive ADD COLUMN statements on one table into a single ALTER TABLE.
+
+    Each ALTER TABLE takes its own ACCESS EXCLUSIVE lock and may rewrite the
+    table; one ALTER with several ADD COLUMN IF NOT EXISTS actions takes the
+    lock once and rewrites at most once. Only statements with nothing but
+    whitespace and comments between them are merged, so indexes, policies and
+    anything else that uses the new columns still runs after them. A column
+    whose definition refers to an earlier column of the run starts a new run.
+    Returns (new content, [Batch]).
+    """
+    segments = split_statements(content)
+    out = []
+    batches = []
+    run = []      # [(Statement, AddColumn)]
+    gaps = []     # trivia between the statements of run
+    pending = []  # trivia after the last statement of run
+
+    def flush():
+        if len(run) > 1:
+            adds = [add for _, add in run]
+            out.append(render_batch(adds, gaps))
+            batches.append(Batch(run[0][0].line, adds[0].table, [a.column for a in adds]))
+        elif run:
+            out.append(run[0][0])
+        out.extend(pending)
+        run.clear()
+        gaps.clear()
+        pending.clear()
+
+    for stmt in segments:
+        if stmt.kind == 'trivia':
+            (pending if run else out).append(stmt)
+            continue
+        add = parse_add_column(stmt)
+        if add is not None and run:
+            columns = [a.column for _, a in run]
+            if (add.target.lower() == run[0][1].target.lower()
+                    and add.column.lower() not in {c.lower() for c in columns}
+                    and not _mentions(add.definition, columns)):
+                gaps.append(''.join(t.text for t in pending))
+                pending.clear()
+                run.append((stmt, add))
+                continue
+        flush()
+        if add is None:
+            out.append(stmt)
+        else:
+            run.append((stmt, add))
+    flush()
+    return join_segments(out), batches
+
+
+def format_report(batches, file_path=None):
+    lines = []
+    for batch in batches:
+        where = f'{file_path}:{batch.line}' if file_path else f'line {batch.line}'
+        lines.append(f'  {where}: {len(batch.columns)} ADD COLUMNs on {batch.table} merged ({", ".join(batch.columns)})')
+    return '\n'.join(lines)
+
+
+def batch_add_columns_sql(content):
+    """Pass form of batch_add_columns: merge and print the report"""
+    content, batches = batch_add_columns(content)
+    if batches:
+        print(format_report(batches))
+    return content
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge consecutive ADD COLUMN statements into one ALTER TABLE per table.")
+    parser.add_argument('files', nargs='*', help="migration files (default: every *.sql in supabase/migrations)")
+    parser.add_argument('--check', action='store_true', help="only report the statements that would be merged")
+    args = parser.parse_args(argv)
+
+    migration_files = sorted(args.files or glob.glob(os.path.join("supabase/migrations", "*.sql")))
+    print(f"Checking {len(migration_files)} migration files for consecutive ADD COLUMN statements")
+
+    total = 0
+    for file_path in migration_files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        new, batches = batch_add_columns(content)
+        if not batches:
+            continue
+        total += len(batches)
+        print(format_report(batches, file_path))
+        if not args.check:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(new)
+
+    print(f"\n{total} ALTER TABLE batches {'would be written' if args.check else 'written'}.")
+    return 1 if args.check and total else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+"""Benchmarks for the migration fixers.
+
+corpus.py generates synthetic migration corpora and run.py times every
+public transform over one, comparing against stored baselines. Run from
+the repository root: python3 -m benchmarks.run --help
+"""
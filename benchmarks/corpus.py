@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Synthetic migration corpora for benchmarking the fixers.
+
+The generated migrations look like the ones the fixers were written for:
+tables and owner policies taken from the policy catalog,
+a mix of bare CREATE POLICY statements and pg_policies-guarded DO blocks
+(with the short policyname checks fix_policy_mapping rewrites), nested
+DO $$ blocks, trigger functions, ADD COLUMN statements and a multi-row seed
+INSERT like the one in 20250101000000_clean_start.sql.
+"""
+import os
+import random
+import argparse
+
+from policy_catalog import standard_policies
+
+DEFAULTS = {
+    'files': 20,
+    'tables': 8,
+    'policies_per_table': 3,
+    'do_depth': 2,
+    'seed_rows': 50,
+}
+
+CATEGORIES = ('Academic', 'Business', 'Creative', 'Research', 'Education', 'Personal')
+WORDS = ('climate', 'research', 'pitch', 'deck', 'notebook', 'analysis', 'story', 'curriculum',
+         'finance', 'trial', 'survey', 'model', "O'Brien", 'semi;colon', '$$dollar$$', '--dash')
+
+
+def _quote(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _table_sql(table):
+    return f"""-- Create {table} table
+CREATE TABLE IF NOT EXISTS {table} (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  user_id uuid REFERENCES auth.users ON DELETE CASCADE,
+  author_id text,
+  payload jsonb DEFAULT '{{}}',
+  created_at timestamptz DEFAULT now(),
+  updated_at timestamptz DEFAULT now()
+);
+
+ALTER TABLE {table} ENABLE ROW LEVEL SECURITY;
+"""
+
+
+def _policies(table, count):
+    """count (short_name, CREATE POLICY ...) pairs, cycling the standard ones"""
+    standard = standard_policies()[table]
+    policies = []
+    for i in range(count):
+        short_name, sql = standard[i % len(standard)]
+        if i >= len(standard):
+            round_no = i // len(standard)
+            short_name = f'{short_name}_{round_no}'
+            sql = sql.replace('" ON', f' #{round_no}" ON', 1)
+        policies.append((short_name, sql))
+    return policies
+
+
+def _guarded_policy(table, short_name, policy_sql, indent=''):
+    lines = [
+        "DO $$",
+        "BEGIN",
+        "    IF NOT EXISTS (",
+        "        SELECT 1 FROM pg_policies ",
+        f"        WHERE tablename = '{table}' ",
+        f"        AND policyname = '{short_name}'",
+        "    ) THEN",
+        f"        {policy_sql}",
+        "    END IF;",
+        "END $$;",
+    ]
+    return '\n'.join(indent + line for line in lines) + '\n'
+
+
+def _nested_do(table, short_name, policy_sql, depth):
+    """depth levels of DO $$ blocks reusing the same tag, the way old migrations nested them"""
+    if depth <= 1:
+        return _guarded_policy(table, short_name, policy_sql)
+    inner = _guarded_policy(table, short_name, policy_sql, indent='  ' * (depth - 1))
+    for level in range(depth - 1, 0, -1):
+        pad = '  ' * (level - 1)
+        inner = f"{pad}DO $$\n{pad}BEGIN\n{inner}{pad}END $$;\n"
+    return inner
+
+
+def _trigger_sql(table):
+    return f"""CREATE OR REPLACE FUNCTION update_updated_at_column()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at = now();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_{table}_updated_at
+  BEFORE UPDATE ON {table}
+  FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+"""
+
+
+def _seed_sql(rng, rows):
+    values = []
+    for i in range(rows):
+        title = ' '.join(rng.choice(WORDS) for _ in range(4)).title()
+        description = ' '.join(rng.choice(WORDS) for _ in range(20))
+        tags = ', '.join(_quote(rng.choice(WORDS)) for _ in range(3))
+        values.append(f"""(
+  {_quote(title)},
+  {_quote(description)},
+  {_quote(rng.choice(CATEGORIES))},
+  ARRAY[{tags}],
+  {_quote(f'Author {i}')},
+  'https://notebooklm.google.com/notebook/example{i}',
+  {'true' if rng.random() < 0.1 else 'false'}
+)""")
+    return ("-- Insert sample data\n"
+            "INSERT INTO notebooks (title, description, category, tags, author, notebook_url, featured) VALUES\n"
+            + ',\n'.join(values) + ';\n')
+
+
+def generate_migration(rng, tables=DEFAULTS['tables'], policies_per_table=DEFAULTS['policies_per_table'],
+                       do_depth=DEFAULTS['do_depth'], seed_rows=DEFAULTS['seed_rows']):
+    """Text of one synthetic migration"""
+    all_tables = list(standard_policies())
+    chosen = rng.sample(all_tables, min(tables, len(all_tables)))
+    parts = []
+    for table in chosen:
+        parts.append(_table_sql(table))
+        for i, (short_name, policy_sql) in enumerate(_policies(table, policies_per_table)):
+            if i % 3 == 0:
+                parts.append(policy_sql + '\n')
+            elif i % 3 == 1:
+                parts.append(_guarded_policy(table, short_name, policy_sql))
+            else:
+                parts.append(_nested_do(table, short_name, policy_sql, do_depth))
+        parts.append(f"ALTER TABLE {table} ADD COLUMN extra_{rng.randrange(1000)} text DEFAULT 'x';\n")
+        parts.append(_trigger_sql(table))
+    if seed_rows:
+        parts.append(_seed_sql(rng, seed_rows))
+    return '\n'.join(parts)
+
+
+def build_corpus(files=DEFAULTS['files'], seed=0, **knobs):
+    """[(file name, sql)] for a synthetic corpus, deterministic for a given seed"""
+    rng = random.Random(seed)
+    return [(f'2025{i:010d}_synthetic.sql', generate_migration(rng, **knobs)) for i in range(files)]
+
+
+def write_corpus(out_dir, files=DEFAULTS['files'], seed=0, **knobs):
+    """Write a synthetic corpus to out_dir and return the file paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for name, sql in build_corpus(files=files, seed=seed, **knobs):
+        path = os.path.join(out_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(sql)
+        paths.append(path)
+    return paths
+
+
+def add_knob_arguments(parser):
+    """Corpus knobs shared by the benchmark command lines"""
+    parser.add_argument('--files', type=int, default=DEFAULTS['files'], help="migration files")
+    parser.add_argument('--tables', type=int, default=DEFAULTS['tables'], help="tables per file")
+    parser.add_argument('--policies-per-table', type=int, default=DEFAULTS['policies_per_table'])
+    parser.add_argument('--do-depth', type=int, default=DEFAULTS['do_depth'], help="nested DO block depth")
+    parser.add_argument('--seed-rows', type=int, default=DEFAULTS['seed_rows'], help="rows in the seed INSERT")
+    parser.add_argument('--seed', type=int, default=0, help="random seed")
+
+
+def knobs_from_args(args):
+    return {
+        'files': args.files,
+        'tables': args.tables,
+        'policies_per_table': args.policies_per_table,
+        'do_depth': args.do_depth,
+        'seed_rows': args.seed_rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic migration corpus.")
+    parser.add_argument('out_dir', help="directory to write the migrations to")
+    add_knob_arguments(parser)
+    args = parser.parse_args()
+    paths = write_corpus(args.out_dir, seed=args.seed, **knobs_from_args(args))
+    print(f"Wrote {len(paths)} synthetic migrations to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
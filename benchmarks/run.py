@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Time every public migration transform over a synthetic corpus.
+
+Results are compared with a stored baseline and the run fails (exit 1)
+when a transform got slower than the baseline by more than --threshold.
+Use --save to record a new baseline after an intended change.
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+
+import nuclear_cleanup
+import restore_rls_policies
+import sql_lexer
+from migrate_fix import PASSES, run_passes, select_passes
+from benchmarks.corpus import add_knob_arguments, build_corpus, knobs_from_args
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# Differences below this many seconds are timer noise, never a regression
+NOISE_FLOOR = 0.002
+
+
+def _extract_and_reinsert(sql):
+    return nuclear_cleanup.insert_clean_policies(sql, nuclear_cleanup.extract_policies(sql))
+
+
+def _default_pipeline(sql):
+    return run_passes(sql, select_passes())
+
+
+def transforms():
+    """[(name, content -> content)] for every public transform, in pipeline order"""
+    named = [(p.name, p.transform) for p in PASSES]
+    # Every default pass over each file in turn, the way migrate_fix runs them
+    named.append(('default_pipeline', _default_pipeline))
+    named += [
+        ('split_statements', sql_lexer.split_statements),
+        ('extract_policies', nuclear_cleanup.extract_policies),
+        ('remove_policy_do_blocks', nuclear_cleanup.remove_policy_do_blocks),
+        ('remove_orphaned_policy_lines', nuclear_cleanup.remove_orphaned_policy_lines),
+        ('insert_clean_policies', _extract_and_reinsert),
+        ('clean_orphaned_statements', restore_rls_policies.clean_orphaned_statements),
+    ]
+    return named
+
+
+def time_transform(fn, corpus, repeat):
+    """Best-of-repeat seconds to run fn over every file of the corpus, with nothing cached from earlier rounds"""
+    best = None
+    for _ in range(repeat):
+        sql_lexer.clear_cache()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for _, sql in corpus:
+                fn(sql)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmarks(corpus, repeat=3, only=None):
+    results = {}
+    for name, fn in transforms():
+        if only and name not in only:
+            continue
+        results[name] = time_transform(fn, corpus, repeat)
+    return results
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_baseline(path, knobs, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'corpus': knobs, 'results': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, threshold):
+    """[(name, seconds, baseline seconds or None, regressed)]"""
+    rows = []
+    for name, seconds in results.items():
+        base = baseline.get(name) if baseline else None
+        regressed = (base is not None and seconds > base * (1 + threshold)
+                     and seconds - base > NOISE_FLOOR)
+        rows.append((name, seconds, base, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the migration transforms.")
+    add_knob_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=3, help="timing rounds per transform (best one counts)")
+    parser.add_argument('--only', help="comma-separated transforms to time")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline JSON file")
+    parser.add_argument('--save', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="allowed slowdown against the baseline, as a fraction (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    knobs = knobs_from_args(args)
+    corpus = build_corpus(seed=args.seed, **knobs)
+    size = sum(len(sql) for _, sql in corpus)
+    print(f"Corpus: {len(corpus)} files, {size / 1024:.0f} KiB "
+          f"({', '.join(f'{k}={v}' for k, v in knobs.items())})")
+
+    only = set(args.only.split(',')) if args.only else None
+    results = run_benchmarks(corpus, repeat=args.repeat, only=only)
+
+    stored = load_baseline(args.baseline)
+    baseline = None
+    if stored and stored.get('corpus') == knobs:
+        baseline = stored.get('results')
+    elif stored:
+        print("Baseline was recorded for a different corpus; not comparing.")
+
+    regressions = 0
+    print("=" * 72)
+    print(f"{'transform':36} {'ms':>10} {'baseline':>10} {'change':>10}")
+    for name, seconds, base, regressed in compare(results, baseline, args.threshold):
+        change = f"{(seconds / base - 1) * 100:+.0f}%" if base else '-'
+        flag = '  REGRESSION' if regressed else ''
+        base_ms = f"{base * 1000:.1f}" if base is not None else '-'
+        print(f"{name:36} {seconds * 1000:10.1f} {base_ms:>10} {change:>10}{flag}")
+        regressions += regressed
+    print("=" * 72)
+
+    if args.save:
+        save_baseline(args.baseline, knobs, results)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if regressions:
+        print(f"{regressions} transform(s) regressed by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Fuzz and stress the migration transforms for crashes and superlinear time.
+
+Two kinds of inputs are thrown at every transform benchmarks.run knows:
+
+* scaling cases - adversarial inputs built at size n and 4n (unterminated
+  DO blocks, an endless seed INSERT, stacked /* comments, ...). A
+  transform whose time grows more than --max-growth times between the two
+  sizes is reported as superlinear.
+* fuzz cases - synthetic corpus files with SQL fragments spliced in at
+  random offsets, which mostly produce malformed migrations.
+
+Every call runs under migrate_fix.pass_budget, so a runaway transform is
+aborted and reported instead of hanging the run. Inputs that fail are
+written to --out for reproduction. Exits 1 if anything failed.
+"""
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import contextlib
+
+import sql_lexer
+from migrate_fix import PassTimeout, pass_budget
+from benchmarks.corpus import build_corpus
+from benchmarks.run import transforms
+
+SCALING_CASES = {
+    'unterminated_do': lambda n: "DO $$\nBEGIN\n  IF NOT EXISTS (SELECT 1) THEN\n" * n,
+    'unterminated_function': lambda n: ("CREATE OR REPLACE FUNCTION f()\nRETURNS trigger AS $$\nBEGIN\n"
+                                        + "  NEW.x = 1;\n" * n),
+    'seed_insert': lambda n: ("INSERT INTO notebooks (title, tags) VALUES\n"
+                              + ",\n".join(f"('Title {i} ''quoted''', ARRAY['a', 'b;c'])" for i in range(n)) + ";\n"),
+    'nested_do': lambda n: "DO $$\nBEGIN\n" * n + "END $$;\n" * n,
+    'begin_run': lambda n: "DO $$\n" + "BEGIN\n" * n + "$$;\n",
+    'if_run': lambda n: "DO $$\nBEGIN\n" + "  IF x THEN\n" * n + "END $$;\n",
+    'end_run': lambda n: "END;\nEND IF;\nEND $$;\n" * n,
+    'policies': lambda n: "".join(f'CREATE POLICY "p{i}" ON notebooks FOR SELECT USING (true);\n' for i in range(n)),
+    'orphaned_if_not_exists': lambda n: "IF NOT EXISTS " + "(x) " * n + "\n",
+    'open_comments': lambda n: "/* a " * n + "*/\n",
+    'open_strings': lambda n: "SELECT 'x" + " ;" * n,
+    'semicolons': lambda n: ";\n" * n,
+}
+
+FRAGMENTS = ("DO $$", "END $$;", "BEGIN", "END;", "END IF;", "IF NOT EXISTS (", ") THEN", "$$", "$body$",
+             "/*", "*/", "--", "'", "E'\\'", '"', ";", "CREATE POLICY \"x\" ON notebooks", "DO $$\nBEGIN\n",
+             "CREATE OR REPLACE FUNCTION f() RETURNS trigger AS $$", "\n")
+
+
+def timed_call(name, fn, sql, budget):
+    """(seconds, error) for one call; error is None, 'timeout' or the exception text"""
+    sql_lexer.clear_cache()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), pass_budget(name, budget):
+            fn(sql)
+    except PassTimeout:
+        return time.perf_counter() - start, 'timeout'
+    except Exception as e:  # a crash on malformed input is exactly what we are looking for
+        return time.perf_counter() - start, f'{type(e).__name__}: {e}'
+    return time.perf_counter() - start, None
+
+
+def mutate(rng, sql, count):
+    """sql with count random fragments spliced in and as many random slices cut out"""
+    for _ in range(count):
+        pos = rng.randrange(len(sql) + 1)
+        if rng.random() < 0.5 and sql:
+            sql = sql[:pos] + sql[pos + rng.randrange(1, 40):]
+        else:
+            sql = sql[:pos] + rng.choice(FRAGMENTS) + sql[pos:]
+    return sql
+
+
+def save_failure(out_dir, label, sql):
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f'{label}.sql')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(sql)
+    return path
+
+
+def run_scaling(funcs, size, max_growth, budget, out_dir, noise_floor=0.02):
+    failures = 0
+    for case, build in SCALING_CASES.items():
+        small, large = build(size), build(size * 4)
+        for name, fn in funcs:
+            t_small, error = timed_call(name, fn, small, budget)
+            if not error:
+                t_large, error = timed_call(name, fn, large, budget)
+            if error:
+                path = save_failure(out_dir, f'{case}-{name}', large)
+                print(f"  ✗ {name} on {case}: {error} (input: {path})")
+                failures += 1
+                continue
+            growth = t_large / max(t_small, 1e-6)
+            if t_large > noise_floor and growth > max_growth:
+                path = save_failure(out_dir, f'{case}-{name}', large)
+                print(f"  ✗ {name} on {case}: {t_small * 1000:.1f}ms -> {t_large * 1000:.1f}ms "
+                      f"for 4x the input ({growth:.1f}x, input: {path})")
+                failures += 1
+    return failures
+
+
+def run_fuzz(funcs, iterations, seed, budget, out_dir):
+    rng = random.Random(seed)
+    corpus = [sql for _, sql in build_corpus(files=4, seed=seed, tables=3, seed_rows=10)]
+    failures = 0
+    for i in range(iterations):
+        sql = mutate(rng, rng.choice(corpus), rng.randrange(1, 30))
+        for name, fn in funcs:
+            _, error = timed_call(name, fn, sql, budget)
+            if error:
+                path = save_failure(out_dir, f'fuzz{i}-{name}', sql)
+                print(f"  ✗ {name} on fuzz case {i}: {error} (input: {path})")
+                failures += 1
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fuzz and stress the migration transforms.")
+    parser.add_argument('--size', type=int, default=500, help="base size n of the scaling cases")
+    parser.add_argument('--max-growth', type=float, default=8.0,
+                        help="largest allowed slowdown for 4x the input (16 = quadratic, default: 8)")
+    parser.add_argument('--fuzz', type=int, default=200, help="random malformed migrations to try")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for the fuzz cases")
+    parser.add_argument('--budget', type=float, default=10.0, help="seconds one call may take before it is aborted")
+    parser.add_argument('--only', help="comma-separated transforms to stress")
+    parser.add_argument('--out', default='benchmarks/failures', help="where failing inputs are written")
+    args = parser.parse_args(argv)
+
+    funcs = transforms()
+    if args.only:
+        wanted = set(args.only.split(','))
+        funcs = [(name, fn) for name, fn in funcs if name in wanted]
+
+    print(f"Scaling {len(SCALING_CASES)} adversarial cases from n={args.size} to n={args.size * 4}")
+    failures = run_scaling(funcs, args.size, args.max_growth, args.budget, args.out)
+    if args.fuzz:
+        print(f"Fuzzing {args.fuzz} malformed migrations (seed {args.seed})")
+        failures += run_fuzz(funcs, args.fuzz, args.seed, args.budget, args.out)
+
+    if failures:
+        print(f"{failures} failure(s); failing inputs are in {args.out}")
+        return 1
+    print("No crashes, timeouts or superlinear growth found.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,42 @@ import os
 import re
 import glob
 
+from sql_lexer import join_segments, split_statements
+
+def _is_guarded_block(stmt):
+    """DO $$ BEGIN IF NOT EXISTS ... END $$; block"""
+    body = stmt.body
+    return stmt.kind == 'do' and body is not None and re.match(r'\s*BEGIN\s*IF NOT EXISTS', body) is not None
+
+def _is_empty_block(stmt):
+    """DO $$ BEGIN END IF; END $$; left behind by earlier cleanups"""
+    body = stmt.body
+    return stmt.kind == 'do' and body is not None and re.fullmatch(r'\s*BEGIN\s*END IF;\s*END\s*', body) is not None
+
+def cleanup_migration_sql(content):
+    """Drop duplicate policy blocks, orphaned END IF; statements and stale comments"""
+    segments = []
+    after_policy_header = False
+    for stmt in split_statements(content):
+        if stmt.kind == 'trivia':
+            text = stmt.text
+            # Remove duplicate RLS policy blocks (keep only the new ones with DO blocks)
+            if '-- RLS Policies' in text:
+                text = re.sub(r'^[ \t]*-- RLS Policies[ \t]*\n?', '', text, flags=re.MULTILINE)
+                after_policy_header = True
+            # Remove policy comments that don't have actual policies
+            text = re.sub(r'^[ \t]*-- Policy for.*\n?', '', text, flags=re.MULTILINE)
+            segments.append(stmt._replace(text=text))
+            continue
+        if after_policy_header and _is_guarded_block(stmt):
+            continue
+        after_policy_header = False
+        # Remove orphaned END IF; statements and empty DO blocks
+        if stmt.head == ('END', 'IF', ';') or _is_empty_block(stmt):
+            continue
+        segments.append(stmt)
+    return join_segments(segments, squeeze=True)
+
 def cleanup_migration_file(file_path):
     """Clean up duplicate policies and orphaned statements"""
     print(f"Cleaning {file_path}...")
@@ -10,22 +46,7 @@ def cleanup_migration_file(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
     
-    # Remove duplicate RLS policy blocks (keep only the new ones with DO blocks)
-    # Pattern to match old-style policy blocks without DO blocks
-    old_policy_pattern = r'-- RLS Policies\s*\n(?:DO \$\$\s*BEGIN\s*IF NOT EXISTS.*?END \$\$;\s*\n)*'
-    content = re.sub(old_policy_pattern, '', content, flags=re.DOTALL)
-    
-    # Remove orphaned END IF; statements
-    content = re.sub(r'^\s*END IF;\s*$', '', content, flags=re.MULTILINE)
-    
-    # Remove policy comments that don't have actual policies
-    content = re.sub(r'^\s*-- Policy for.*$\n', '', content, flags=re.MULTILINE)
-    
-    # Clean up multiple empty lines
-    content = re.sub(r'\n\s*\n\s*\n', '\n\n', content)
-    
-    # Remove any remaining orphaned DO blocks without content
-    content = re.sub(r'DO \$\$\s*BEGIN\s*END IF;\s*END \$\$;\s*\n', '', content, flags=re.MULTILINE)
+    content = cleanup_migration_sql(content)
     
     # Write back to file
     with open(file_path, 'w', encoding='utf-8') as f:
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Wait for files in a directory to be created or modified.
+
+On Linux the kernel's inotify interface is used through ctypes, so a change
+is seen as soon as the editor closes the file. Everywhere else, or when
+inotify is unavailable, the directory is polled for new mtimes and sizes.
+Both watchers report paths only; what the change was is left to the caller.
+"""
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct('iIII')
+
+POLL_INTERVAL = 0.5
+
+
+class InotifyWatcher:
+    """Watch one directory with inotify: files written and closed, or renamed into it"""
+    kind = 'inotify'
+
+    def __init__(self, directory, suffix):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.directory = directory
+        self.suffix = suffix
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        # Editors that save through a temporary file rename it into place
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f'cannot watch {directory}')
+
+    def wait(self, timeout=None):
+        """Paths changed within timeout seconds (None waits for the first change), possibly empty"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if name.endswith(self.suffix):
+                changed.add(os.path.join(self.directory, name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Watch one directory by comparing mtimes and sizes every interval seconds"""
+    kind = 'polling'
+
+    def __init__(self, directory, suffix, interval=POLL_INTERVAL):
+        self.directory = directory
+        self.suffix = suffix
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(self.suffix) and entry.is_file():
+                    st = entry.stat()
+                    snapshot[entry.path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def wait(self, timeout=None):
+        """Paths changed within timeout seconds (None waits for the first change), possibly empty"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {path for path, stamp in snapshot.items() if self.snapshot.get(path) != stamp}
+            self.snapshot = snapshot
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            delay = self.interval if deadline is None else min(self.interval, max(deadline - time.monotonic(), 0))
+            time.sleep(delay)
+
+    def close(self):
+        pass
+
+
+def open_watcher(directory, suffix='.sql', polling=False, interval=POLL_INTERVAL):
+    """An inotify watcher where the platform has one, otherwise a polling watcher"""
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory, suffix)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directory, suffix, interval)
+
+
+def debounced(watcher, delay):
+    """Yield sets of changed paths, each once no further change came in for delay seconds.
+
+    An editor save or a `git checkout` touches a file, or many files, several
+    times in quick succession; they are reported as one batch.
+    """
+    while True:
+        batch = watcher.wait(None)
+        while True:
+            more = watcher.wait(delay)
+            if not more:
+                break
+            batch |= more
+        yield batch
@@ -1,24 +1,29 @@
 #!/usr/bin/env python3
 import os
-import re
 import glob
 
+from sql_lexer import block_balance, rewrite_statements, significant_tokens
+
+def add_missing_function_end(content):
+    """Add END; to update_updated_at_column() bodies that stop after RETURN NEW;"""
+    def fix_function(stmt):
+        if stmt.kind != 'function' or stmt.body is None:
+            return None
+        names = [tok.text.lower() for tok in significant_tokens(stmt.text, limit=6)]
+        if 'update_updated_at_column' not in names:
+            return None
+        # If already ends with END;, do nothing
+        if block_balance(stmt.body)['begin'] <= 0:
+            return None
+        # Otherwise, add END; before $$
+        return stmt.replace_body(stmt.body.rstrip() + '\nEND;\n')
+    return rewrite_statements(content, fix_function)
+
 def fix_update_function(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
     
-    # Regex to match the broken function (missing END;)
-    broken_func = re.compile(r'(CREATE OR REPLACE FUNCTION update_updated_at_column\(\)\s+RETURNS TRIGGER AS \$\$\s*BEGIN[\s\S]*?RETURN NEW;)(\s*)\$\$ language [\'\"]?plpgsql[\'\"]?;?', re.IGNORECASE)
-    
-    def replacer(match):
-        body = match.group(1)
-        # If already ends with END;, do nothing
-        if body.strip().endswith('END;'):
-            return match.group(0)
-        # Otherwise, add END; before $$
-        return f"{body}\nEND;\n$$ language 'plpgsql';"
-    
-    new_content = broken_func.sub(replacer, content)
+    new_content = add_missing_function_end(content)
     
     if new_content != content:
         with open(file_path, 'w', encoding='utf-8') as f:
@@ -3,6 +3,50 @@ import os
 import re
 import glob
 
+from sql_lexer import block_balance, join_segments, rewrite_statements, split_block
+
+def drop_extra_ends(body):
+    """Remove END; statements that close a BEGIN which was never opened"""
+    extra = -block_balance(body)['begin']
+    if extra <= 0:
+        return body
+    segments = []
+    for stmt in reversed(split_block(body)):
+        # Duplicates pile up at the end of the body, so drop from the back
+        if extra and stmt.head == ('END', ';'):
+            extra -= 1
+            # Drop the line break that led up to it as well
+            if segments and segments[-1].kind == 'trivia' and not segments[-1].text.strip():
+                segments.pop()
+            continue
+        segments.append(stmt)
+    return join_segments(reversed(segments))
+
+def tidy_body(body):
+    """Fix functions with proper spacing"""
+    body = re.sub(r'BEGIN[ \t]*\n\s*\n\s*', 'BEGIN\n  ', body)
+    return re.sub(r'\n\s*\n(\s*)END;', r'\n\1END;', body)
+
+def final_nuclear_cleanup_sql(content):
+    """Remove duplicate END; statements and fix remaining syntax"""
+    def clean(stmt):
+        # Remove orphaned END; statements
+        if stmt.head == ('END', ';'):
+            return ''
+        if stmt.kind in ('function', 'do') and stmt.body is not None:
+            body = tidy_body(drop_extra_ends(stmt.body))
+            return None if body == stmt.body else stmt.replace_body(body)
+        return None
+    
+    def tidy_gap(stmt):
+        if stmt.kind != 'trivia' or not stmt.start:
+            return None
+        # Ensure proper semicolons
+        return re.sub(r'\A\s*\n', '\n', stmt.text)
+    
+    content = rewrite_statements(content, clean, squeeze=True)
+    return rewrite_statements(content, tidy_gap)
+
 def final_nuclear_cleanup(file_path):
     """FINAL NUCLEAR CLEANUP: Remove all duplicate END; and fix remaining syntax"""
     print(f"FINAL NUCLEAR CLEANUP: {file_path}...")
@@ -10,21 +54,7 @@ def final_nuclear_cleanup(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
     
-    # Remove duplicate END; statements
-    content = re.sub(r'END;\s*\n\s*END;', 'END;', content)
-    
-    # Remove orphaned END; statements
-    content = re.sub(r'^\s*END;\s*$', '', content, flags=re.MULTILINE)
-    
-    # Fix functions with proper spacing
-    content = re.sub(r'BEGIN\s*\n\s*\n', 'BEGIN\n  ', content)
-    content = re.sub(r'\n\s*\n\s*END;', '\nEND;', content)
-    
-    # Clean up multiple empty lines
-    content = re.sub(r'\n\s*\n\s*\n', '\n\n', content)
-    
-    # Ensure proper semicolons
-    content = re.sub(r';\s*\n', ';\n', content)
+    content = final_nuclear_cleanup_sql(content)
     
     with open(file_path, 'w', encoding='utf-8') as f:
         f.write(content)
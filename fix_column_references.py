@@ -1,8 +1,41 @@
 #!/usr/bin/env python3
 import os
-import re
 import glob
 
+from sql_lexer import rewrite_statements
+
+# Fix notebooks table policies - remove owner-based policies since author is text, not user ID
+# Replace owner_update and owner_delete policies with simpler authenticated policies
+POLICY_REPLACEMENTS = (
+    ('CREATE POLICY "Users can update their own notebooks" ON notebooks FOR UPDATE USING (auth.uid()::text = author_id) WITH CHECK (auth.uid()::text = author_id);',
+     'CREATE POLICY "Authenticated users can update notebooks" ON notebooks FOR UPDATE USING (auth.role() = \'authenticated\') WITH CHECK (auth.role() = \'authenticated\');'),
+    ('CREATE POLICY "Users can delete their own notebooks" ON notebooks FOR DELETE USING (auth.uid()::text = author_id);',
+     'CREATE POLICY "Authenticated users can delete notebooks" ON notebooks FOR DELETE USING (auth.role() = \'authenticated\');'),
+)
+
+# Update policy names in the DO blocks
+POLICYNAME_REPLACEMENTS = (
+    ("policyname = 'owner_update'", "policyname = 'authenticated_update'"),
+    ("policyname = 'owner_delete'", "policyname = 'authenticated_delete'"),
+)
+
+def fix_column_references_sql(content):
+    """Fix incorrect column references in RLS policies"""
+    def fix(stmt):
+        if stmt.kind == 'do':
+            replacements = POLICY_REPLACEMENTS + POLICYNAME_REPLACEMENTS
+        elif stmt.starts_with('CREATE', 'POLICY'):
+            replacements = POLICY_REPLACEMENTS
+        else:
+            return None
+        text = stmt.text
+        for old, new in replacements:
+            text = text.replace(old, new)
+        return text
+    
+    # For notebooks table, replace owner-based policies with authenticated policies
+    return rewrite_statements(content, fix)
+
 def fix_column_references(file_path):
     """Fix incorrect column references in RLS policies"""
     print(f"Fixing {file_path}...")
@@ -10,34 +43,7 @@ def fix_column_references(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
     
-    # Fix notebooks table policies - remove owner-based policies since author is text, not user ID
-    # Replace owner_update and owner_delete policies with simpler authenticated policies
-    
-    # For notebooks table, replace owner-based policies with authenticated policies
-    content = re.sub(
-        r'CREATE POLICY "Users can update their own notebooks" ON notebooks FOR UPDATE USING \(auth\.uid\(\)::text = author_id\) WITH CHECK \(auth\.uid\(\)::text = author_id\);',
-        'CREATE POLICY "Authenticated users can update notebooks" ON notebooks FOR UPDATE USING (auth.role() = \'authenticated\') WITH CHECK (auth.role() = \'authenticated\');',
-        content
-    )
-    
-    content = re.sub(
-        r'CREATE POLICY "Users can delete their own notebooks" ON notebooks FOR DELETE USING \(auth\.uid\(\)::text = author_id\);',
-        'CREATE POLICY "Authenticated users can delete notebooks" ON notebooks FOR DELETE USING (auth.role() = \'authenticated\');',
-        content
-    )
-    
-    # Update policy names in the DO blocks
-    content = re.sub(
-        r'policyname = \'owner_update\'',
-        'policyname = \'authenticated_update\'',
-        content
-    )
-    
-    content = re.sub(
-        r'policyname = \'owner_delete\'',
-        'policyname = \'authenticated_delete\'',
-        content
-    )
+    content = fix_column_references_sql(content)
     
     # Write back to file
     with open(file_path, 'w', encoding='utf-8') as f:
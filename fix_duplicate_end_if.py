@@ -1,8 +1,40 @@
 #!/usr/bin/env python3
 import os
-import re
 import glob
 
+from sql_lexer import block_balance, join_segments, rewrite_statements, split_block
+
+def drop_extra_end_ifs(body):
+    """Remove repeated END IF; statements that close an IF which was never opened"""
+    extra = -block_balance(body)['if']
+    if extra <= 0:
+        return body
+    segments = []
+    previous = None
+    for stmt in split_block(body):
+        if stmt.kind != 'trivia':
+            if extra and stmt.head[:2] == ('END', 'IF') and previous is not None and previous.head[:2] == ('END', 'IF'):
+                extra -= 1
+                # Drop the indentation in front of it as well
+                if segments and segments[-1].kind == 'trivia' and not segments[-1].text.strip():
+                    segments.pop()
+                continue
+            previous = stmt
+        segments.append(stmt)
+    return join_segments(segments)
+
+def fix_duplicate_end_if_sql(content):
+    """Fix duplicate END IF; statements in DO blocks and function bodies"""
+    def fix_block(stmt):
+        if stmt.kind not in ('do', 'function') or stmt.body is None:
+            return None
+        body = drop_extra_end_ifs(stmt.body)
+        if body == stmt.body:
+            return None
+        return stmt.replace_body(body)
+    
+    return rewrite_statements(content, fix_block)
+
 def fix_duplicate_end_if(file_path):
     """Fix duplicate END IF; statements in DO blocks"""
     print(f"Fixing {file_path}...")
@@ -11,7 +43,7 @@ def fix_duplicate_end_if(file_path):
         content = f.read()
     
     # Remove duplicate END IF; statements
-    content = re.sub(r'END IF;\s*END IF;', 'END IF;', content)
+    content = fix_duplicate_end_if_sql(content)
     
     # Write back to file
     with open(file_path, 'w', encoding='utf-8') as f:
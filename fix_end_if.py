@@ -1,8 +1,36 @@
 #!/usr/bin/env python3
 import os
-import re
 import glob
 
+from sql_lexer import block_balance, rewrite_statements, split_block
+
+def close_open_ifs(body):
+    """Add the END IF; statements a block body is missing before its final END"""
+    missing = block_balance(body)['if']
+    if missing <= 0:
+        return body
+    # Look for the block's closing END (the last statement of the body)
+    pieces = [stmt for stmt in split_block(body) if stmt.kind != 'trivia']
+    if not pieces or pieces[-1].head[:1] != ('END',) or pieces[-1].head[1:2] in (('IF',), ('LOOP',), ('CASE',)):
+        return body
+    last = pieces[-1]
+    line_start = body.rfind('\n', 0, last.start) + 1
+    if body[line_start:last.start].strip():
+        return body[:last.start] + 'END IF; ' * missing + body[last.start:]
+    return body[:line_start] + '    END IF;\n' * missing + body[line_start:]
+
+def fix_end_if_sql(content):
+    """Fix missing END IF; statements in DO blocks"""
+    def fix_block(stmt):
+        if stmt.kind != 'do' or stmt.body is None:
+            return None
+        body = close_open_ifs(stmt.body)
+        if body == stmt.body:
+            return None
+        return stmt.replace_body(body)
+    
+    return rewrite_statements(content, fix_block)
+
 def fix_end_if_statements(file_path):
     """Fix missing END IF; statements in DO blocks"""
     print(f"Fixing {file_path}...")
@@ -10,15 +38,8 @@ def fix_end_if_statements(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
     
-    # Pattern to match DO blocks that are missing END IF;
-    # Look for DO blocks that end with just END $$; without END IF;
-    pattern = r'(CREATE POLICY.*?;)\s*\n\s*END \$\$;'
-    
-    def replace_match(match):
-        policy_statement = match.group(1)
-        return f'{policy_statement}\n    END IF;\nEND $$;'
-    
-    content = re.sub(pattern, replace_match, content, flags=re.DOTALL)
+    # Look for DO blocks whose IF ... THEN is never closed before END $$;
+    content = fix_end_if_sql(content)
     
     # Write back to file
     with open(file_path, 'w', encoding='utf-8') as f:
@@ -1,8 +1,34 @@
 #!/usr/bin/env python3
 import os
-import re
 import glob
 
+from make_migrations_idempotent import guard_trigger
+from sql_lexer import join_segments, policy_signature, split_statements
+
+def add_drop_policy(stmt, previous):
+    """Prefix CREATE POLICY with DROP POLICY IF EXISTS - avoid duplicates"""
+    if not stmt.starts_with('CREATE', 'POLICY'):
+        return None
+    signature = policy_signature(stmt)
+    if not signature or (previous is not None and previous.starts_with('DROP', 'POLICY')
+                         and policy_signature(previous) == signature):
+        return None
+    policy_name, table_name = signature
+    return f'DROP POLICY IF EXISTS "{policy_name}" ON {table_name};\n{stmt.text}'
+
+def add_drop_statements(content):
+    """Add DROP ... IF EXISTS before every CREATE POLICY/TRIGGER that lacks one"""
+    segments = []
+    previous = None
+    for stmt in split_statements(content):
+        if stmt.kind == 'trivia':
+            segments.append(stmt)
+            continue
+        new = add_drop_policy(stmt, previous) or guard_trigger(stmt, previous)
+        segments.append(stmt if new is None else new)
+        previous = stmt
+    return join_segments(segments)
+
 def fix_migration_file(file_path):
     """Fix a single migration file by adding DROP statements before CREATE statements."""
     print(f"Processing: {file_path}")
@@ -10,32 +36,10 @@ def fix_migration_file(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
     
-    # Track changes
-    changes_made = False
-    
-    # Fix CREATE POLICY statements - avoid duplicates
-    policy_pattern = r'(?<!DROP POLICY IF EXISTS ")(CREATE POLICY "([^"]+)"\s+ON\s+(\w+))'
-    def add_drop_policy(match):
-        policy_name = match.group(2)
-        table_name = match.group(3)
-        return f'DROP POLICY IF EXISTS "{policy_name}" ON {table_name};\nCREATE POLICY "{policy_name}" ON {table_name}'
-    
-    new_content = re.sub(policy_pattern, add_drop_policy, content)
-    if new_content != content:
-        changes_made = True
-        content = new_content
-    
-    # Fix CREATE TRIGGER statements - avoid duplicates
-    trigger_pattern = r'(?<!DROP TRIGGER IF EXISTS )(CREATE TRIGGER (\w+)\s+ON\s+(\w+))'
-    def add_drop_trigger(match):
-        trigger_name = match.group(2)
-        table_name = match.group(3)
-        return f'DROP TRIGGER IF EXISTS {trigger_name} ON {table_name};\nCREATE TRIGGER {trigger_name} ON {table_name}'
-    
-    new_content = re.sub(trigger_pattern, add_drop_trigger, content)
-    if new_content != content:
-        changes_made = True
-        content = new_content
+    # Fix CREATE POLICY and CREATE TRIGGER statements - avoid duplicates
+    new_content = add_drop_statements(content)
+    changes_made = new_content != content
+    content = new_content
     
     # Write back if changes were made
     if changes_made:
@@ -1,8 +1,29 @@
 #!/usr/bin/env python3
 import os
-import re
 import glob
 
+from sql_lexer import rewrite_statements, significant_tokens
+
+# First statements that show a trigger body was written without BEGIN
+BODY_STARTS = ('INSERT', 'SELECT', 'UPDATE', 'DELETE', 'NEW', 'RETURN')
+
+def _returns_trigger(stmt):
+    tokens = significant_tokens(stmt.text[:stmt.bodies[0][0]])
+    words = [tok.text.upper() for tok in tokens if tok.kind == 'word']
+    return any(a == 'RETURNS' and b == 'TRIGGER' for a, b in zip(words, words[1:]))
+
+def add_missing_begin(content):
+    """Add BEGIN to trigger functions whose body starts straight with a statement"""
+    def fix_function(stmt):
+        if stmt.kind != 'function' or stmt.body is None or not _returns_trigger(stmt):
+            return None
+        body = stmt.body
+        tokens = significant_tokens(body, limit=1)
+        if not tokens or tokens[0].text.upper() not in BODY_STARTS:
+            return None
+        return stmt.replace_body('\nBEGIN\n  ' + body.lstrip())
+    return rewrite_statements(content, fix_function)
+
 def fix_missing_begin(file_path):
     """Fix missing BEGIN statements in functions"""
     print(f"Fixing {file_path}...")
@@ -12,20 +33,7 @@ def fix_missing_begin(file_path):
     
     # Fix functions that are missing BEGIN statements
     # Pattern: RETURNS trigger AS $$ followed by INSERT/SELECT/UPDATE/DELETE without BEGIN
-    content = re.sub(
-        r'RETURNS trigger AS \$\$\s*\n\s*(INSERT|SELECT|UPDATE|DELETE|NEW\.|RETURN)',
-        r'RETURNS trigger AS $$\nBEGIN\n  \1',
-        content,
-        flags=re.MULTILINE
-    )
-    
-    # Also fix RETURNS TRIGGER AS $$ (uppercase)
-    content = re.sub(
-        r'RETURNS TRIGGER AS \$\$\s*\n\s*(INSERT|SELECT|UPDATE|DELETE|NEW\.|RETURN)',
-        r'RETURNS TRIGGER AS $$\nBEGIN\n  \1',
-        content,
-        flags=re.MULTILINE
-    )
+    content = add_missing_begin(content)
     
     # Write back to file
     with open(file_path, 'w', encoding='utf-8') as f:
@@ -2,6 +2,58 @@
 import os
 import re
 import glob
+import functools
+
+import policy_catalog
+from sql_lexer import rewrite_statements
+
+# Short names (and the aliases older fixers used) of every table's policies, from the policy catalog
+TABLE_POLICY_MAPPINGS = {
+    table: {short_name: p.name for p in policies for short_name in (p.short_name,) + p.aliases}
+    for table, policies in policy_catalog.load_catalog().items()
+}
+
+@functools.lru_cache(maxsize=None)
+def _compile_mapping(items):
+    """(pattern, {(table, short_name): actual_name}) for a frozen mapping.
+
+    The pattern is a single alternation over every table and short name, so
+    each DO block is scanned once no matter how many tables the mapping
+    covers. It is cached, so the work is done once per mapping, not per file.
+    """
+    lookup = {(table, short_name): actual_name for table, policies in items for short_name, actual_name in policies}
+    tables = '|'.join(re.escape(table) for table in sorted({t for t, _ in lookup}, key=len, reverse=True))
+    short_names = '|'.join(re.escape(name) for name in sorted({s for _, s in lookup}, key=len, reverse=True))
+    pattern = re.compile(
+        rf"\ADO \$\$\s*BEGIN\s*IF NOT EXISTS \(\s*SELECT 1 FROM pg_policies\s*"
+        rf"WHERE tablename = '(?P<table>{tables})'\s*AND policyname = '(?P<short_name>{short_names})'\s*\) THEN\s*"
+        rf"CREATE POLICY \"[^\"]*\" ON (?P<on>{tables})\b")
+    return pattern, lookup
+
+def _frozen(mapping):
+    return tuple((table, tuple(policies.items())) for table, policies in mapping.items())
+
+_DEFAULT_MAPPING = _frozen(TABLE_POLICY_MAPPINGS)
+
+def apply_policy_mapping(content, mapping=None):
+    """Rewrite short policyname checks and their CREATE POLICY names to the real policy names"""
+    pattern, lookup = _compile_mapping(_DEFAULT_MAPPING if mapping is None else _frozen(mapping))
+
+    def replace(match):
+        table_name = match.group('table')
+        actual_name = lookup.get((table_name, match.group('short_name')))
+        if actual_name is None or match.group('on') != table_name:
+            return match.group(0)
+        # Replace the policyname check with the correct actual name
+        return f"DO $$\nBEGIN\n    IF NOT EXISTS (\n        SELECT 1 FROM pg_policies \n        WHERE tablename = '{table_name}' \n        AND policyname = '{actual_name}'\n    ) THEN\n        CREATE POLICY \"{actual_name}\" ON {table_name}"
+
+    def fix_block(stmt):
+        if stmt.kind != 'do' or 'pg_policies' not in stmt.text:
+            return None
+        return pattern.sub(replace, stmt.text, count=1)
+    
+    # The pattern only ever looks inside a single DO block
+    return rewrite_statements(content, fix_block)
 
 def fix_policy_mapping(file_path):
     """Fix policy name mappings with proper table-specific mappings"""
@@ -10,83 +62,7 @@ def fix_policy_mapping(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
     
-    # Define table-specific policy mappings
-    table_policy_mappings = {
-        'profiles': {
-            'public_read': 'Anyone can read profiles',
-            'authenticated_update': 'Users can update their own profile',
-            'owner_insert': 'Users can insert their own profile'
-        },
-        'saved_notebooks': {
-            'owner_read': 'Users can read their own saved notebooks',
-            'owner_insert': 'Users can insert their own saved notebooks',
-            'authenticated_delete': 'Users can delete their own saved notebooks'
-        },
-        'notebooks': {
-            'public_read': 'Anyone can read notebooks',
-            'authenticated_insert': 'Authenticated users can insert notebooks',
-            'authenticated_update': 'Authenticated users can update notebooks',
-            'authenticated_delete': 'Authenticated users can delete notebooks'
-        },
-        'subscription_plans': {
-            'public_read': 'Anyone can read subscription plans'
-        },
-        'subscriptions': {
-            'owner_read': 'Users can read their own subscriptions',
-            'owner_insert': 'Users can insert their own subscriptions',
-            'authenticated_update': 'Users can update their own subscriptions'
-        },
-        'payments': {
-            'owner_read': 'Users can read their own payments',
-            'owner_insert': 'Users can insert their own payments'
-        },
-        'user_interactions': {
-            'owner_read': 'Users can read their own interactions',
-            'owner_insert': 'Users can insert their own interactions',
-            'authenticated_update': 'Users can update their own interactions'
-        },
-        'scraping_operations': {
-            'owner_read': 'Users can read their own scraping operations',
-            'owner_insert': 'Users can insert their own scraping operations',
-            'authenticated_update': 'Users can update their own scraping operations'
-        },
-        'scraped_items': {
-            'owner_read': 'Users can read their own scraped items',
-            'owner_insert': 'Users can insert their own scraped items'
-        },
-        'user_events': {
-            'owner_read': 'Users can read their own events',
-            'owner_insert': 'Users can insert their own events'
-        },
-        'notebook_analytics': {
-            'owner_read': 'Users can read their own analytics',
-            'owner_insert': 'Users can insert their own analytics'
-        },
-        'search_analytics': {
-            'owner_read': 'Users can read their own search analytics',
-            'owner_insert': 'Users can insert their own search analytics'
-        },
-        'user_preferences': {
-            'owner_read': 'Users can read their own preferences',
-            'owner_insert': 'Users can insert their own preferences',
-            'authenticated_update': 'Users can update their own preferences'
-        },
-        'user_recommendations': {
-            'owner_read': 'Users can read their own recommendations',
-            'owner_insert': 'Users can insert their own recommendations'
-        }
-    }
-    
-    # For each table, fix the policy name checks
-    for table_name, policies in table_policy_mappings.items():
-        for short_name, actual_name in policies.items():
-            # Find DO blocks for this table and short name
-            pattern = rf"DO \$\$\s*BEGIN\s*IF NOT EXISTS \(\s*SELECT 1 FROM pg_policies\s*WHERE tablename = '{table_name}'\s*AND policyname = '[^']*'\s*\) THEN\s*CREATE POLICY \"[^\"]*\" ON {table_name}"
-            
-            # Replace the policyname check with the correct actual name
-            replacement = f"DO $$\nBEGIN\n    IF NOT EXISTS (\n        SELECT 1 FROM pg_policies \n        WHERE tablename = '{table_name}' \n        AND policyname = '{actual_name}'\n    ) THEN\n        CREATE POLICY \"{actual_name}\" ON {table_name}"
-            
-            content = re.sub(pattern, replacement, content, flags=re.DOTALL)
+    content = apply_policy_mapping(content)
     
     # Write back to file
     with open(file_path, 'w', encoding='utf-8') as f:
@@ -2,6 +2,41 @@
 import os
 import re
 import glob
+import functools
+
+import policy_catalog
+from sql_lexer import rewrite_statements
+
+@functools.lru_cache(maxsize=None)
+def _compile_matcher():
+    """One alternation over every tablename check and catalog short name, compiled once"""
+    short_names = sorted({short_name for _, short_name in policy_catalog.short_name_index()}, key=len, reverse=True)
+    alternation = '|'.join(re.escape(name) for name in short_names)
+    return re.compile(rf"tablename = '(?P<table>[^']*)'|policyname = '(?P<short_name>{alternation})'")
+
+def fix_policy_name_mismatch_sql(content):
+    """Fix policy name mismatches between CREATE POLICY and policyname checks"""
+    pattern = _compile_matcher()
+
+    # Fix every policy name mismatch in one scan per block
+    def fix_block(stmt):
+        # policyname checks only live inside DO blocks
+        if stmt.kind != 'do' or "policyname = '" not in stmt.text:
+            return None
+        table = None
+
+        def replace(match):
+            nonlocal table
+            if match.group('table') is not None:
+                table = match.group('table')
+                return match.group(0)
+            # Replace the policyname check with the name of the policy it guards on that table
+            policy = policy_catalog.lookup_short_name(table, match.group('short_name'))
+            return match.group(0) if policy is None else f"policyname = '{policy.name}'"
+
+        return pattern.sub(replace, stmt.text)
+
+    return rewrite_statements(content, fix_block)
 
 def fix_policy_name_mismatch(file_path):
     """Fix policy name mismatches between CREATE POLICY and policyname checks"""
@@ -10,80 +45,7 @@ def fix_policy_name_mismatch(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
     
-    # Define the mapping of short names to actual policy names
-    policy_mapping = {
-        # Profiles table
-        'public_read': 'Anyone can read profiles',
-        'authenticated_update': 'Users can update their own profile',
-        'owner_insert': 'Users can insert their own profile',
-        
-        # Saved notebooks table
-        'owner_read': 'Users can read their own saved notebooks',
-        'owner_insert': 'Users can insert their own saved notebooks',
-        'authenticated_delete': 'Users can delete their own saved notebooks',
-        
-        # Notebooks table
-        'public_read': 'Anyone can read notebooks',
-        'authenticated_insert': 'Authenticated users can insert notebooks',
-        'authenticated_update': 'Authenticated users can update notebooks',
-        'authenticated_delete': 'Authenticated users can delete notebooks',
-        
-        # Subscription plans table
-        'public_read': 'Anyone can read subscription plans',
-        
-        # Subscriptions table
-        'owner_read': 'Users can read their own subscriptions',
-        'owner_insert': 'Users can insert their own subscriptions',
-        'authenticated_update': 'Users can update their own subscriptions',
-        
-        # Payments table
-        'owner_read': 'Users can read their own payments',
-        'owner_insert': 'Users can insert their own payments',
-        
-        # User interactions table
-        'owner_read': 'Users can read their own interactions',
-        'owner_insert': 'Users can insert their own interactions',
-        'authenticated_update': 'Users can update their own interactions',
-        
-        # Scraping operations table
-        'owner_read': 'Users can read their own scraping operations',
-        'owner_insert': 'Users can insert their own scraping operations',
-        'authenticated_update': 'Users can update their own scraping operations',
-        
-        # Scraped items table
-        'owner_read': 'Users can read their own scraped items',
-        'owner_insert': 'Users can insert their own scraped items',
-        
-        # User events table
-        'owner_read': 'Users can read their own events',
-        'owner_insert': 'Users can insert their own events',
-        
-        # Notebook analytics table
-        'owner_read': 'Users can read their own analytics',
-        'owner_insert': 'Users can insert their own analytics',
-        
-        # Search analytics table
-        'owner_read': 'Users can read their own search analytics',
-        'owner_insert': 'Users can insert their own search analytics',
-        
-        # User preferences table
-        'owner_read': 'Users can read their own preferences',
-        'owner_insert': 'Users can insert their own preferences',
-        'authenticated_update': 'Users can update their own preferences',
-        
-        # User recommendations table
-        'owner_read': 'Users can read their own recommendations',
-        'owner_insert': 'Users can insert their own recommendations'
-    }
-    
-    # Fix each policy name mismatch
-    for short_name, actual_name in policy_mapping.items():
-        # Replace the policyname check to match the actual policy name
-        content = re.sub(
-            rf"policyname = '{short_name}'",
-            f"policyname = '{actual_name}'",
-            content
-        )
+    content = fix_policy_name_mismatch_sql(content)
     
     # Write back to file
     with open(file_path, 'w', encoding='utf-8') as f:
@@ -3,27 +3,31 @@ import os
 import re
 import glob
 
+from sql_lexer import rewrite_statements
+
+def match_policyname_to_createpolicy(content):
+    """Set the policyname check of every DO block to its CREATE POLICY name"""
+    def replacer(stmt):
+        if stmt.kind != 'do' or "policyname = '" not in stmt.text:
+            return None
+        # Find the CREATE POLICY name inside the block
+        policy_match = re.search(r'CREATE POLICY\s+"([^"]+)"', stmt.text)
+        if not policy_match:
+            return None  # No CREATE POLICY, skip
+        policy_name = policy_match.group(1).replace("'", "''")
+        # Replace the policyname = '...' with the correct name
+        return re.sub(r"policyname = '(?:[^']|'')*'", lambda m: f"policyname = '{policy_name}'", stmt.text)
+
+    # Each DO $$ ... END $$; block is one statement, so a match can't leak into the next block
+    return rewrite_statements(content, replacer)
+
 def fix_policyname_to_createpolicy(file_path):
     """For every DO block with a policyname check, set policyname to match the CREATE POLICY name exactly."""
     print(f"Fixing {file_path}...")
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
 
-    # Regex to find DO blocks with policyname checks and CREATE POLICY statements
-    def replacer(match):
-        do_block = match.group(0)
-        # Find the CREATE POLICY name inside the block
-        policy_match = re.search(r'CREATE POLICY\s+"([^"]+)"', do_block)
-        if not policy_match:
-            return do_block  # No CREATE POLICY, skip
-        policy_name = policy_match.group(1)
-        # Replace the policyname = '...' with the correct name
-        fixed = re.sub(r"policyname = '[^']*'", f"policyname = '{policy_name}'", do_block)
-        return fixed
-
-    # Pattern: DO $$ ... policyname = '...' ... CREATE POLICY "..." ... END $$;
-    pattern = re.compile(r'DO \$\$.*?policyname = \'[^\']*\'.*?CREATE POLICY\s+\"[^\"]+\".*?END \$\$;', re.DOTALL)
-    content = pattern.sub(replacer, content)
+    content = match_policyname_to_createpolicy(content)
 
     with open(file_path, 'w', encoding='utf-8') as f:
         f.write(content)
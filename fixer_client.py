@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Client for the warm fixer worker (fixer_worker.py).
+
+Only the standard library is imported, so a call costs interpreter start-up
+plus one round trip:
+
+    fixer_client.py fix FILE [--check]   run the passes over a file
+    fixer_client.py validate [FILE]      validate_migrations diagnostics for a file or stdin
+    fixer_client.py report [--dir DIR]   would-change and diagnostics for every migration
+    fixer_client.py ping | stop
+
+Exit status is 1 when there is something to fix, 2 when no worker is running.
+"""
+import os
+import sys
+import json
+import socket
+import argparse
+
+SOCKET_PATH = ".migration_fixer.sock"
+
+
+def request(payload, socket_path=SOCKET_PATH, timeout=None):
+    """Send one request to a running worker and return its response"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(socket_path)
+        conn.sendall(json.dumps(payload).encode('utf-8') + b'\n')
+        with conn.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError('the worker closed the connection without answering')
+    return json.loads(line)
+
+
+def _print_diagnostics(path, diagnostics):
+    for d in diagnostics:
+        print(f"{path or '<stdin>'}:{d['line']}: {d['message']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send requests to the warm migration fixer worker.")
+    parser.add_argument('--socket', default=SOCKET_PATH, help=f"worker socket (default: {SOCKET_PATH})")
+    sub = parser.add_subparsers(dest='command', required=True)
+    fix_parser = sub.add_parser('fix', help="run the passes over a migration file")
+    fix_parser.add_argument('file')
+    fix_parser.add_argument('--check', action='store_true', help="report whether it would change without writing")
+    validate_parser = sub.add_parser('validate', help="check a file, or SQL on stdin, for block-structure problems")
+    validate_parser.add_argument('file', nargs='?')
+    report_parser = sub.add_parser('report', help="would-change and diagnostics for every migration")
+    report_parser.add_argument('--dir', help="migration directory (default: the worker's)")
+    sub.add_parser('ping', help="check that a worker is running")
+    sub.add_parser('stop', help="stop the worker")
+    args = parser.parse_args(argv)
+
+    if args.command == 'fix':
+        payload = {'op': 'fix', 'path': os.path.abspath(args.file), 'check': args.check}
+    elif args.command == 'validate':
+        payload = {'op': 'validate', 'path': os.path.abspath(args.file)} if args.file else \
+            {'op': 'validate', 'sql': sys.stdin.read()}
+    elif args.command == 'report':
+        payload = {'op': 'report', 'dir': args.dir and os.path.abspath(args.dir)}
+    else:
+        payload = {'op': 'shutdown' if args.command == 'stop' else 'ping'}
+    try:
+        response = request(payload, args.socket)
+    except (OSError, ConnectionError) as e:
+        print(f"No fixer worker on {args.socket} ({e}); start one with `fixer_worker.py`")
+        return 2
+    if not response['ok']:
+        print(f"✗ {response['error']}")
+        return 1
+
+    if args.command == 'fix':
+        print(response['log'], end='')
+        verb = 'Would fix' if args.check else '✓ Fixed'
+        print(f"  {verb if response['changed'] else '- No changes needed for'} {args.file}")
+        _print_diagnostics(args.file, response['diagnostics'])
+        return 1 if response['diagnostics'] or (args.check and response['changed']) else 0
+    if args.command == 'validate':
+        _print_diagnostics(args.file, response['diagnostics'])
+        return 1 if response['diagnostics'] else 0
+    if args.command == 'report':
+        problems = 0
+        for entry in response['files']:
+            if entry['would_change']:
+                print(f"  Would fix {entry['path']}")
+            _print_diagnostics(entry['path'], entry['diagnostics'])
+            problems += entry['would_change'] + len(entry['diagnostics'])
+        print(f"{len(response['files'])} migration files, {problems} problems ({response['elapsed_ms']:g} ms)")
+        return 1 if problems else 0
+    if args.command == 'ping':
+        print(f"Fixer worker {response['pid']} up {response['uptime']}s, {response['requests']} requests served")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
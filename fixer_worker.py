@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""Long-running migration fixer that answers requests over a Unix socket.
+
+A migrate_fix.py run spends most of a small job on interpreter start-up,
+imports and regex compilation. This worker pays for that once: it imports
+every pass, builds the policy catalog, runs the pipeline over a sample to
+compile the patterns, and keeps what it learns about each file keyed by its
+sha256. Editor save hooks and pre-commit talk to it through fixer_client.py,
+which only imports the standard library.
+
+The protocol is one JSON object per line each way. A request has an "op"
+("ping", "fix", "validate", "report" or "shutdown") and the op's
+arguments; fix and validate take either a "path" or an in-memory "sql"
+buffer. Every response has "ok" and, on failure, "error". The worker
+handles one request at a time on its main thread, so --pass-timeout
+applies as it does in migrate_fix. Restart it after editing a fixer.
+"""
+import io
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+import contextlib
+import socketserver
+
+import migrate_fix
+import policy_catalog
+import validate_migrations
+from fixer_client import SOCKET_PATH
+
+# Big enough for any migration buffer an editor sends
+MAX_REQUEST = 64 * 1024 * 1024
+
+
+class RequestError(Exception):
+    """A request the worker cannot act on; reported back as {"ok": false}"""
+
+
+def _diagnostics(sql):
+    return [d._asdict() for d in validate_migrations.check_sql(sql)]
+
+
+class Worker:
+    """The warm state and the request handlers"""
+
+    def __init__(self, migration_dir=migrate_fix.MIGRATION_DIR, cache_path=migrate_fix.CACHE_FILE,
+                 budget=migrate_fix.PASS_BUDGET):
+        self.migration_dir = migration_dir
+        self.cache_path = cache_path
+        self.budget = budget
+        self.cache = migrate_fix.load_cache(cache_path) if cache_path else {}
+        self.pass_names = [p.name for p in migrate_fix.select_passes()]
+        self.version = migrate_fix.pipeline_version(migrate_fix.select_passes())
+        # path -> (sha256, pipeline version, would change, diagnostics) for report
+        self.reports = {}
+        self.stopping = False
+        self.started = time.time()
+        self.requests = 0
+        self._warm_up()
+
+    def _warm_up(self):
+        policy_catalog.load_catalog()
+        policy_catalog.standard_policies()
+        sample = next(iter(migrate_fix.find_migrations(self.migration_dir)), None)
+        if sample is None:
+            # No migrations yet: the catalog's own policies still exercise the lexer and the passes
+            sql = ''.join(policy_catalog.plain_policies(table) for table in policy_catalog.load_catalog())
+        else:
+            with open(sample, 'r', encoding='utf-8') as f:
+                sql = f.read()
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate_fix.run_passes(sql, migrate_fix.select_passes(self.pass_names))
+        validate_migrations.check_sql(sql)
+
+    def _passes(self, request):
+        names = request.get('passes') or self.pass_names
+        try:
+            migrate_fix.select_passes(names)
+        except ValueError as e:
+            raise RequestError(str(e))
+        return names
+
+    def _source(self, request):
+        """(path or None, sql) of a request that takes a "path" or a "sql" buffer"""
+        if 'sql' in request:
+            return request.get('path'), request['sql']
+        path = request.get('path')
+        if not path:
+            raise RequestError('request needs a "path" or a "sql" buffer')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return path, f.read()
+        except OSError as e:
+            raise RequestError(f'cannot read {path}: {e.strerror}')
+
+    def handle(self, request):
+        self.requests += 1
+        handler = getattr(self, f"op_{request.get('op')}", None) if isinstance(request, dict) else None
+        if handler is None:
+            return {'ok': False, 'error': f"unknown op {request.get('op') if isinstance(request, dict) else request!r}"}
+        started = time.perf_counter()
+        try:
+            response = handler(request)
+        except RequestError as e:
+            response = {'ok': False, 'error': str(e)}
+        except migrate_fix.PassTimeout as e:
+            response = {'ok': False, 'error': str(e)}
+        else:
+            response['ok'] = True
+        response['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    def op_ping(self, request):
+        return {'pid': os.getpid(), 'uptime': round(time.time() - self.started), 'requests': self.requests,
+                'passes': self.pass_names}
+
+    def op_fix(self, request):
+        names = self._passes(request)
+        check = bool(request.get('check'))
+        if 'sql' in request:
+            log = io.StringIO()
+            with contextlib.redirect_stdout(log):
+                fixed = migrate_fix.run_passes(request['sql'], migrate_fix.select_passes(names), self.budget)
+            return {'changed': fixed != request['sql'], 'sql': fixed, 'log': log.getvalue(),
+                    'diagnostics': _diagnostics(fixed)}
+        path, _ = self._source(request)
+        version = self.version
+        if names != self.pass_names:
+            version = migrate_fix.pipeline_version(migrate_fix.select_passes(names))
+        key = migrate_fix.cache_key(path)
+        result = migrate_fix.process_file(path, names, version, self.cache.get(key), check, self.budget)
+        if result.status == 'timeout':
+            raise RequestError(result.log.strip())
+        if result.status == 'changed' and check:
+            self.cache.pop(key, None)
+        else:
+            self.cache[key] = {'sha256': result.digest, 'passes': version}
+            if self.cache_path:
+                migrate_fix.save_cache(self.cache_path, self.cache)
+        _, sql = self._source({'path': path})
+        return {'status': result.status, 'changed': result.status == 'changed', 'log': result.log,
+                'diagnostics': _diagnostics(sql)}
+
+    def op_validate(self, request):
+        _, sql = self._source(request)
+        return {'diagnostics': _diagnostics(sql)}
+
+    def op_report(self, request):
+        migration_dir = request.get('dir') or self.migration_dir
+        if not os.path.isdir(migration_dir):
+            raise RequestError(f'migration directory {migration_dir} not found')
+        files = []
+        passes = migrate_fix.select_passes(self.pass_names)
+        for path in migrate_fix.find_migrations(migration_dir):
+            with open(path, 'rb') as f:
+                original = f.read()
+            digest = hashlib.sha256(original).hexdigest()
+            known = self.reports.get(path)
+            if known is None or known[:2] != (digest, self.version):
+                sql = original.decode('utf-8')
+                with contextlib.redirect_stdout(io.StringIO()):
+                    would_change = migrate_fix.run_passes(sql, passes, self.budget) != sql
+                known = (digest, self.version, would_change, _diagnostics(sql))
+                self.reports[path] = known
+            files.append({'path': path, 'would_change': known[2], 'diagnostics': known[3]})
+        return {'files': files}
+
+    def op_shutdown(self, request):
+        self.stopping = True
+        return {}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while not self.server.worker.stopping:
+            line = self.rfile.readline(MAX_REQUEST + 1)
+            if not line:
+                return
+            if len(line) > MAX_REQUEST:
+                # The rest of the line would be read as the next request
+                self._respond({'ok': False, 'error': 'request too large'})
+                return
+            try:
+                response = self.server.worker.handle(json.loads(line))
+            except ValueError as e:
+                response = {'ok': False, 'error': f'invalid JSON: {e}'}
+            self._respond(response)
+
+    def _respond(self, response):
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+
+def _claim_socket(path):
+    """Remove a stale socket file left by a worker that died; fail if one is still listening"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        raise RequestError(f'a worker is already listening on {path}')
+    finally:
+        probe.close()
+
+
+def serve(socket_path, worker):
+    _claim_socket(socket_path)
+    server = socketserver.UnixStreamServer(socket_path, _Handler)
+    server.worker = worker
+    os.chmod(socket_path, 0o600)
+    print(f"Fixer worker {os.getpid()} listening on {socket_path} ({len(worker.pass_names)} passes warm)")
+    try:
+        while not worker.stopping:
+            server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with contextlib.suppress(OSError):
+            os.unlink(socket_path)
+    print("Fixer worker stopped.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm migration fixer worker; see fixer_client.py for the client.")
+    parser.add_argument('--socket', default=SOCKET_PATH, help=f"socket to listen on (default: {SOCKET_PATH})")
+    parser.add_argument('--dir', default=migrate_fix.MIGRATION_DIR, help="migration directory to warm up on")
+    parser.add_argument('--cache', default=migrate_fix.CACHE_FILE, help="incremental-mode manifest to share")
+    parser.add_argument('--pass-timeout', type=float, default=migrate_fix.PASS_BUDGET,
+                        help="seconds one pass may spend on one file (0 = no limit)")
+    args = parser.parse_args(argv)
+    try:
+        return serve(args.socket, Worker(args.dir, args.cache, args.pass_timeout or None))
+    except RequestError as e:
+        print(e)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Find foreign keys whose columns no index leads with.
+
+Postgres indexes the referenced side of a foreign key (it must be a primary
+key or unique) but never the referencing side. Without an index that leads
+with the referencing columns, every DELETE or key UPDATE on the parent -
+and every ON DELETE CASCADE - scans the whole child table. This replays the
+migrations with sql_schema, checks every FOREIGN KEY / REFERENCES column
+list against the explicit and implicit indexes of its table and writes the
+missing CREATE INDEX IF NOT EXISTS statements as a new migration.
+"""
+import os
+import sys
+import argparse
+from collections import namedtuple
+
+import policy_catalog
+from sql_schema import MIGRATION_DIR, index_name, load_schema, migration_path
+
+# A foreign key without a covering index
+Finding = namedtuple('Finding', 'table columns ref_table on_delete source')
+
+
+def leading_index(schema, table, columns):
+    """The first btree index whose leading columns are exactly these columns (in any order), or None"""
+    wanted = set(columns)
+    for index in schema.all_indexes(table):
+        if index.method == 'btree' and index.where is None and set(index.columns[:len(columns)]) == wanted:
+            return index
+    return None
+
+
+def find_unindexed_foreign_keys(schema):
+    """[Finding] for every foreign key no index covers, in migration order"""
+    findings = []
+    for table in schema.tables.values():
+        for fk in table.foreign_keys:
+            if leading_index(schema, table.name, fk.columns) is None:
+                findings.append(Finding(table.name, fk.columns, fk.ref_table, fk.on_delete, fk.source))
+    return findings
+
+
+def unmodelled_tables(schema):
+    """Policy catalog tables no migration creates, whose foreign keys cannot be checked"""
+    return [table for table in policy_catalog.load_catalog() if schema.table(table) is None]
+
+
+def render_migration(findings):
+    lines = [
+        "-- Indexes on foreign key columns, so deletes and key updates on the referenced",
+        "-- tables do not scan the referencing ones. Generated by fk_index_checker.py",
+        "",
+    ]
+    for f in findings:
+        cascade = f' ON DELETE {f.on_delete}' if f.on_delete else ''
+        lines.append(f"-- {f.table}({', '.join(f.columns)}) REFERENCES {f.ref_table}{cascade}")
+        lines.append(f"CREATE INDEX IF NOT EXISTS {index_name(f.table, f.columns)} "
+                     f"ON {f.table} ({', '.join(f.columns)});")
+        lines.append("")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index foreign key columns that no index leads with.")
+    parser.add_argument('--dir', default=MIGRATION_DIR, help=f"migration directory (default: {MIGRATION_DIR})")
+    parser.add_argument('--output', help="migration file to write (default: a new timestamped file in --dir)")
+    parser.add_argument('--dry-run', action='store_true', help="print the migration instead of writing it")
+    parser.add_argument('--check', action='store_true', help="write nothing; exit 1 if any foreign key is unindexed")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.dir):
+        print(f"Migration directory {args.dir} not found!")
+        return 1
+
+    schema = load_schema(args.dir)
+    findings = find_unindexed_foreign_keys(schema)
+    foreign_keys = sum(len(t.foreign_keys) for t in schema.tables.values())
+    print(f"Checked {foreign_keys} foreign keys on {len(schema.tables)} tables")
+    for f in findings:
+        print(f"  ✗ {f.source.file}:{f.source.line}: {f.table}({', '.join(f.columns)}) -> {f.ref_table} has no index")
+    missing = unmodelled_tables(schema)
+    if missing:
+        print(f"  - Not created by any migration, not checked: {', '.join(missing)}")
+
+    if not findings:
+        print("Every foreign key is covered by an index.")
+        return 0
+    if args.check:
+        return 1
+    sql = render_migration(findings)
+    if args.dry_run:
+        print()
+        print(sql)
+        return 0
+    output = args.output or migration_path(args.dir, 'index_foreign_keys')
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(sql)
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""Suggest the composite indexes the app's supabase-js queries are missing.
+
+The JavaScript/TypeScript under lib/ and pages/api is scanned statically for
+supabase-js call chains - .from('table') followed by .eq(), .in(), .match(),
+.gte(), .order() and friends, including filters added later through
+`query = query.eq(...)`. Each chain becomes a query shape in a workload
+model. Every shape is turned into a candidate btree index (equality
+columns, then the sort, then one range column) and compared with the
+indexes the migrations create, including the implicit PRIMARY KEY and UNIQUE
+ones. Missing indexes are written as a new idempotent migration, ranked by
+estimated benefit.
+"""
+import os
+import re
+import sys
+import json
+import math
+import glob
+import argparse
+from collections import namedtuple
+
+from sql_schema import MIGRATION_DIR, index_name, load_schema, migration_path
+
+SOURCE_DIRS = ('lib', 'pages/api')
+SOURCE_EXTENSIONS = ('.js', '.jsx', '.ts', '.tsx')
+
+# Rows assumed for a table without a --row-counts entry
+DEFAULT_ROWS = 10000
+
+# A supabase-js call chain: the table and every (method, args, line) after .from()
+Chain = namedtuple('Chain', 'table calls source')
+# One query the app runs, reduced to what an index can serve
+QueryShape = namedtuple('QueryShape', 'table operation equality order ranges source')
+# A missing index and why it is wanted
+Suggestion = namedtuple('Suggestion', 'table columns descending benefit sources known')
+
+EQUALITY_FILTERS = frozenset(('eq', 'in', 'is', 'contains'))
+RANGE_FILTERS = frozenset(('gt', 'gte', 'lt', 'lte'))
+FILTER_METHODS = EQUALITY_FILTERS | RANGE_FILTERS | {'match', 'filter', 'order'}
+OPERATIONS = ('select', 'insert', 'upsert', 'update', 'delete')
+
+_CODE = re.compile(r'''
+    (?P<string>'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"|`(?:[^`\\]|\\.)*`)
+  | (?P<line_comment>//[^\n]*)
+  | (?P<block_comment>/\*.*?\*/)
+''', re.VERBOSE | re.DOTALL)
+
+_FROM = re.compile(r'''\.from\(\s*(['"`])(\w+)\1\s*\)''')
+_METHOD = re.compile(r'\s*\.\s*(\w+)\s*\(')
+_ASSIGNED_TO = re.compile(r'(?:\b(?:let|const|var)\s+)?\b(\w+)\s*=\s*(?:await\s+)?[\w.]+\s*\Z')
+_FIRST_STRING = re.compile(r'''\s*(['"`])(\w+)\1''')
+_MATCH_KEYS = re.compile(r'''(?:^|[{,])\s*['"]?(\w+)['"]?\s*:''')
+
+
+def strip_comments(src):
+    """src with JS comments blanked out; offsets and line numbers are kept"""
+    def blank(m):
+        if m.lastgroup == 'string':
+            return m.group(0)
+        return re.sub(r'[^\n]', ' ', m.group(0))
+    return _CODE.sub(blank, src)
+
+
+def _close_paren(src, pos):
+    """Offset just past the ) closing the ( before pos, skipping strings"""
+    depth = 1
+    n = len(src)
+    while pos < n and depth:
+        ch = src[pos]
+        if ch in '\'"`':
+            m = _CODE.match(src, pos)
+            pos = m.end() if m else pos + 1
+            continue
+        if ch in '([{':
+            depth += 1
+        elif ch in ')]}':
+            depth -= 1
+        pos += 1
+    return pos
+
+
+def read_calls(src, pos):
+    """[(method, args, offset)] of the .method(...) chain starting at pos, and where it ends"""
+    calls = []
+    while True:
+        m = _METHOD.match(src, pos)
+        if not m:
+            return calls, pos
+        end = _close_paren(src, m.end())
+        calls.append((m.group(1), src[m.end():end - 1], m.start()))
+        pos = end
+
+
+def _statement_start(src, pos):
+    return max(src.rfind(c, 0, pos) for c in ';{}') + 1
+
+
+def extract_chains(src, file_path):
+    """Every supabase-js chain in one source file.
+
+    `let query = client.from('t')...` chains also pick up the filters later
+    added with `query = query.eq(...)` or `query.eq(...)`; each of those
+    becomes a chain of its own on top of the base chain, since the app adds
+    them conditionally.
+    """
+    code = strip_comments(src)
+    starts = [m.start() for m in _FROM.finditer(code)]
+    chains = []
+    for k, m in enumerate(_FROM.finditer(code)):
+        table = m.group(2)
+        line = code.count('\n', 0, m.start()) + 1
+        calls, end = read_calls(code, m.end())
+        base = Chain(table, calls, f'{file_path}:{line}')
+        assigned = _ASSIGNED_TO.search(code[_statement_start(code, m.start()):m.start()])
+        if not assigned:
+            chains.append(base)
+            continue
+        # Follow-up filters on the same builder, up to the next .from()
+        var = re.escape(assigned.group(1))
+        limit = starts[k + 1] if k + 1 < len(starts) else len(code)
+        methods = '|'.join(sorted(FILTER_METHODS))
+        continuation = re.compile(rf'\b{var}\s*=\s*{var}(?=\s*\.)|(?<![.\w]){var}(?=\s*\.\s*(?:{methods})\s*\()')
+        extra = []
+        for cont in continuation.finditer(code, end, limit):
+            more, _ = read_calls(code, cont.end())
+            if more:
+                extra.append((more, code.count('\n', 0, cont.start()) + 1))
+        unconditional = [c for more, _ in extra if not _has_filter(more) for c in more]
+        base = base._replace(calls=calls + unconditional)
+        chains.append(base)
+        for more, more_line in extra:
+            if _has_filter(more):
+                chains.append(Chain(table, base.calls + more, f'{file_path}:{more_line}'))
+    return chains
+
+
+def _has_filter(calls):
+    return any(method in FILTER_METHODS - {'order'} for method, _, _ in calls)
+
+
+def _column(args):
+    m = _FIRST_STRING.match(args)
+    return m.group(2) if m else None
+
+
+def to_shape(chain):
+    """QueryShape of a chain, or None if no index could serve it"""
+    operation = 'select'
+    equality, order, ranges = [], [], []
+    for method, args, _ in chain.calls:
+        if method in OPERATIONS:
+            operation = method if method != 'select' or operation == 'select' else operation
+            continue
+        if method == 'filter':
+            m = re.match(r'''\s*(['"])(\w+)\1\s*,\s*(['"])(\w+)\3''', args)
+            if not m:
+                continue
+            operator = m.group(4)
+            method, args = (operator if operator in EQUALITY_FILTERS | RANGE_FILTERS else ''), f"'{m.group(2)}'"
+        if method == 'match':
+            equality.extend(k for k in _MATCH_KEYS.findall(args.strip()[1:]) if k not in equality)
+            continue
+        column = _column(args)
+        if column is None:
+            continue
+        if method in EQUALITY_FILTERS and column not in equality:
+            equality.append(column)
+        elif method in RANGE_FILTERS and column not in ranges:
+            ranges.append(column)
+        elif method == 'order':
+            descending = bool(re.search(r'ascending\s*:\s*false', args))
+            order.append((column, descending))
+    if operation in ('insert', 'upsert') and not (equality or ranges):
+        return None
+    if not (equality or order or ranges):
+        return None
+    return QueryShape(chain.table, operation, tuple(equality), tuple(order), tuple(ranges), chain.source)
+
+
+def build_workload(root='.', source_dirs=SOURCE_DIRS):
+    """[QueryShape] for every indexable supabase-js query under source_dirs"""
+    shapes = []
+    for source_dir in source_dirs:
+        for file_path in sorted(glob.glob(os.path.join(root, source_dir, '**', '*'), recursive=True)):
+            if not file_path.endswith(SOURCE_EXTENSIONS) or not os.path.isfile(file_path):
+                continue
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                src = f.read()
+            for chain in extract_chains(src, os.path.relpath(file_path, root)):
+                shape = to_shape(chain)
+                if shape:
+                    shapes.append(shape)
+    return shapes
+
+
+def candidate_columns(shape):
+    """(columns, descending flags) of the btree index that serves a shape: equality, sort, range"""
+    columns = list(shape.equality)
+    descending = [False] * len(columns)
+    for column, desc in shape.order:
+        if column not in columns:
+            columns.append(column)
+            descending.append(desc)
+    if shape.ranges and shape.ranges[0] not in columns:
+        columns.append(shape.ranges[0])
+        descending.append(False)
+    return tuple(columns[:4]), tuple(descending[:4])
+
+
+def _where_columns(index, table):
+    if not index.where or table is None:
+        return set()
+    return {word for word in re.findall(r'\w+', index.where) if word in table.columns}
+
+
+def is_covered(schema, table_name, equality_count, columns):
+    """True if an existing btree index leads with these columns (equality ones in any order)"""
+    table = schema.table(table_name)
+    for index in schema.all_indexes(table_name):
+        if index.method != 'btree':
+            continue
+        # A partial index only serves queries that filter on its predicate columns
+        if not _where_columns(index, table) <= set(columns[:equality_count]) | ({'true', 'false'}):
+            continue
+        leading = index.columns[:len(columns)]
+        if len(leading) < len(columns):
+            continue
+        if set(leading[:equality_count]) == set(columns[:equality_count]) and \
+                leading[equality_count:] == columns[equality_count:]:
+            return True
+    return False
+
+
+def estimate_benefit(columns, equality_count, call_sites, rows):
+    """Rough benefit score: call sites x log10(table rows) x how much of the query the index serves"""
+    served = equality_count + 0.5 * (len(columns) - equality_count)
+    return round(call_sites * math.log10(max(rows, 10)) * served, 2)
+
+
+def suggest_indexes(shapes, schema, row_counts=None):
+    """[Suggestion] for every candidate index the migrations lack, best first"""
+    row_counts = row_counts or {}
+    grouped = {}
+    for shape in shapes:
+        columns, descending = candidate_columns(shape)
+        # Lookups by id hit the primary key, even on tables no migration creates
+        if not columns or columns == ('id',):
+            continue
+        equality_count = len([c for c in shape.equality if c in columns])
+        if is_covered(schema, shape.table, equality_count, columns):
+            continue
+        key = (shape.table, frozenset(columns[:equality_count]), columns[equality_count:])
+        entry = grouped.setdefault(key, {'columns': columns, 'descending': descending, 'eq': equality_count,
+                                         'sources': []})
+        entry['sources'].append(shape.source)
+
+    suggestions = []
+    for (table_name, _, _), entry in grouped.items():
+        table = schema.table(table_name)
+        known = table is not None and all(c in table.columns for c in entry['columns'])
+        benefit = estimate_benefit(entry['columns'], entry['eq'], len(entry['sources']),
+                                   row_counts.get(table_name, DEFAULT_ROWS))
+        suggestions.append(Suggestion(table_name, entry['columns'], entry['descending'], benefit,
+                                      tuple(entry['sources']), known))
+    suggestions.sort(key=lambda s: (-s.benefit, s.table, s.columns))
+    return _drop_prefixes(suggestions)
+
+
+def _drop_prefixes(suggestions):
+    """Leave out suggestions served by a longer suggestion for the same table"""
+    kept = []
+    for s in suggestions:
+        longer = next((k for k in suggestions if k is not s and k.table == s.table
+                       and len(k.columns) > len(s.columns) and k.columns[:len(s.columns)] == s.columns), None)
+        if longer is None:
+            kept.append(s)
+    return kept
+
+
+def render_index(s):
+    """Idempotent DDL for one suggestion.
+
+    Tables or columns no migration creates are guarded, so the migration
+    still applies where they are missing.
+    """
+    elements = ', '.join(f'{c} DESC' if desc else c for c, desc in zip(s.columns, s.descending))
+    name = index_name(s.table, s.columns)
+    create = f'CREATE INDEX IF NOT EXISTS {name} ON {s.table} ({elements});'
+    if s.known:
+        return create
+    columns = ', '.join(f"'{c}'" for c in s.columns)
+    return f'''DO $$
+BEGIN
+  IF (SELECT count(*) FROM information_schema.columns
+      WHERE table_schema = 'public' AND table_name = '{s.table}' AND column_name IN ({columns})) = {len(s.columns)} THEN
+    EXECUTE '{create[:-1]}';
+  END IF;
+END $$;'''
+
+
+def render_migration(suggestions):
+    lines = [
+        "-- Indexes for the supabase-js query shapes in lib/ and pages/api that no migration indexes",
+        "-- Generated by index_advisor.py, ranked by estimated benefit",
+        "",
+    ]
+    for s in suggestions:
+        lines.append(f"-- benefit {s.benefit}: {', '.join(s.sources)}")
+        if not s.known:
+            lines.append("-- table or columns not created by any migration; only built where they exist")
+        lines.append(render_index(s))
+        lines.append("")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Suggest the indexes the app's supabase-js queries are missing.")
+    parser.add_argument('--root', default='.', help="project root (default: .)")
+    parser.add_argument('--dir', default=MIGRATION_DIR, help=f"migration directory (default: {MIGRATION_DIR})")
+    parser.add_argument('--row-counts', help="JSON file of {table: rows} to weigh the ranking")
+    parser.add_argument('--output', help="migration file to write (default: a new timestamped file in --dir)")
+    parser.add_argument('--dry-run', action='store_true', help="print the migration instead of writing it")
+    args = parser.parse_args(argv)
+
+    row_counts = None
+    if args.row_counts:
+        with open(args.row_counts, 'r', encoding='utf-8') as f:
+            row_counts = json.load(f)
+
+    shapes = build_workload(args.root)
+    schema = load_schema(os.path.join(args.root, args.dir))
+    suggestions = suggest_indexes(shapes, schema, row_counts)
+    print(f"{len(shapes)} query shapes across {len({s.table for s in shapes})} tables, "
+          f"{len(suggestions)} missing indexes")
+    for s in suggestions:
+        print(f"  {s.benefit:8.2f}  {s.table}({', '.join(s.columns)})  x{len(s.sources)}")
+
+    if not suggestions:
+        return 0
+    sql = render_migration(suggestions)
+    if args.dry_run:
+        print()
+        print(sql)
+        return 0
+    output = args.output or migration_path(os.path.join(args.root, args.dir), 'add_missing_indexes')
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(sql)
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
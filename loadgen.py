@@ -0,0 +1,769 @@
+#!/usr/bin/env python3
+"""Synthetic production-scale data for query plan and RLS load tests.
+
+Writes users, profiles, notebooks, saved_notebooks, scraping_operations
+and scraped_items as CSV files in COPY's format, plus a load.sql that
+loads them in dependency order with psql's \\copy and analyzes the
+tables. user_interactions, which the app uses but the migrations do not
+create, is only written when named in --tables and is left out of
+load.sql.
+
+Every per-row draw is a hash of (--seed, column, row number), so a row
+comes out the same whatever the chunk size or --jobs, and a foreign key is
+the id of the referenced row recomputed from its row number instead of
+looked up. Memory is bounded by --chunk-rows plus a few numbers per user
+and notebook: save counts, activity weights, the popularity ranking and,
+up to ID_CACHE_ROWS, their formatted ids.
+
+The rows follow the migrations: columns the model of supabase/migrations
+does not have are left out, CHECK (column IN (...)) lists give the values
+drawn, saves are distinct per (user_id, notebook_id), and every reference
+points at a generated row created before the referencing one. Popularity
+is Zipfian: a few notebooks collect most saves and interactions, and
+popularity_score follows the same ranking. Tags come from a per-category
+vocabulary, also Zipf-weighted, one to five distinct ones per notebook.
+
+Profiles are created by the on_auth_user_created trigger when auth.users
+is loaded; load.sql fills in the rest of each profile from its file with
+one INSERT ... ON CONFLICT. Needs NumPy.
+"""
+import os
+import re
+import sys
+import time
+import zlib
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("loadgen.py needs NumPy to generate data: pip install numpy") from e
+
+from seed_copy import copy_command, quote_ident
+from sql_schema import MIGRATION_DIR, load_schema
+
+OUT_DIR = "loadgen_data"
+CHUNK_ROWS = 500_000
+ZIPF_EXPONENT = 1.1
+UNTIL = '2025-07-01'
+DAYS = 365
+
+# Rows per table at --scale 1
+ROWS = {
+    'auth.users': 100_000,
+    'notebooks': 50_000,
+    'saved_notebooks': 1_000_000,
+    'user_interactions': 2_000_000,
+    'scraping_operations': 5_000,
+    'scraped_items': 200_000,
+}
+
+CATEGORY_WEIGHTS = {'Academic': 25, 'Business': 20, 'Creative': 10, 'Research': 20, 'Education': 15, 'Personal': 10}
+INTERACTION_WEIGHTS = {'view': 70, 'like': 12, 'bookmark': 8, 'share': 5, 'download': 5}
+SOURCE_WEIGHTS = {'github': 35, 'arxiv': 30, 'reddit': 25, 'notebooklm': 10}
+STATUS_WEIGHTS = {'completed': 85, 'failed': 5, 'running': 5, 'pending': 5}
+SAVES_PER_USER_SIGMA = 1.2
+SAVE_ROUNDS = 32
+POPULAR_ROUNDS = 3
+# Users and notebooks up to this many get their UUID strings formatted once and kept (36 bytes each)
+ID_CACHE_ROWS = 2_000_000
+
+FIRST_NAMES = ('Sarah', 'Mike', 'Emma', 'James', 'Lisa', 'Alex', 'Priya', 'Wei', 'Fatima', 'Carlos', 'Olga', 'Kenji',
+               'Amara', 'Lucas', 'Noor', 'Hannah', 'Diego', 'Mei', 'Tom', 'Aisha', 'Jonas', 'Sofia', 'Ravi', 'Grace')
+LAST_NAMES = ('Chen', 'Rodriguez', 'Thompson', 'Wilson', 'Park', 'Kim', 'Patel', 'Nguyen', 'Okafor', 'Garcia',
+              'Ivanova', 'Tanaka', "O'Brien", 'Schmidt', 'Haddad', 'Müller', 'Silva', 'Cohen', 'Novak', 'Singh')
+INSTITUTIONS = ('Stanford University', 'MIT', 'Johns Hopkins', 'Y Combinator Alumni', 'Independent Writer',
+                'Personal Project', 'ETH Zürich', 'University of Toronto', 'Google Research', 'Oxford University',
+                'IIT Bombay', 'Tsinghua University', 'Open University', 'Freelance', 'Mayo Clinic', 'UC Berkeley')
+KINDS = ('Assistant', 'Analyzer', 'Workshop', 'Synthesis', 'Designer', 'Optimizer', 'Guide', 'Explorer', 'Notes',
+         'Companion')
+TOPICS = {
+    'Academic': ('Literature Review', 'Thesis', 'Citation', 'Peer Review', 'Grant Proposal', 'Lecture'),
+    'Business': ('Pitch Deck', 'Market Sizing', 'Sales Call', 'Board Memo', 'Pricing', 'Hiring'),
+    'Creative': ('Short Story', 'Screenplay', 'Poetry', 'Worldbuilding', 'Songwriting', 'Character'),
+    'Research': ('Clinical Trial', 'Climate Model', 'Genomics', 'Survey Data', 'Meta-Analysis', 'Lab Notebook'),
+    'Education': ('Curriculum', 'Lesson Plan', 'Exam Prep', 'Flashcard', 'Homework', 'Reading List'),
+    'Personal': ('Budget', 'Travel', 'Fitness', 'Recipe', 'Journal', 'Investment'),
+}
+TAGS = {
+    'Academic': ('Literature Review', 'Research', 'Citations', 'Thesis', 'Humanities', 'Peer Review', 'STEM',
+                 'Philosophy', 'History', 'Linguistics'),
+    'Business': ('Entrepreneurship', 'Business Strategy', 'Pitch Decks', 'Marketing', 'Sales', 'Finance',
+                 'Product', 'Leadership', 'Startups', 'Operations'),
+    'Creative': ('Creative Writing', 'Storytelling', 'Literature', 'Poetry', 'Screenwriting', 'Fiction', 'Music',
+                 'Art', 'Worldbuilding', 'Fan Fiction'),
+    'Research': ('Clinical Trials', 'Medical Research', 'Climate Science', 'Data Analysis', 'COVID-19',
+                 'Genomics', 'Statistics', 'Neuroscience', 'Physics', 'Ecology'),
+    'Education': ('Curriculum Design', 'Online Learning', 'Computer Science', 'K-12', 'Exam Prep', 'Language Learning',
+                  'Mathematics', 'Pedagogy', 'Study Guide', 'Higher Education'),
+    'Personal': ('Personal Finance', 'Investment', 'Budgeting', 'Health', 'Travel', 'Cooking', 'Productivity',
+                 'Journaling', 'Fitness', 'Parenting'),
+}
+GENERAL_TAGS = ('AI', 'Productivity', 'Summaries', 'Audio Overview', 'Beginner')
+GENERAL_TAG_SHARE = 0.15
+MAX_TAGS = 5
+TAG_COUNT_WEIGHTS = (10, 25, 35, 20, 10)
+QUERIES = ('transformer architectures', 'climate adaptation', 'notebooklm examples', 'rag pipelines', 'protein folding',
+           'study techniques', 'startup metrics', 'open source llm', 'sleep research', 'python data tools')
+
+# rows names the ROWS entry that sizes the table; generate(plan, lo, hi) returns {column: values}
+Generator = namedtuple('Generator', 'name rows columns generate')
+
+_CHECK_IN = r'CHECK \(\s*{}\s+IN\s*\(([^)]*)\)\s*\)'
+
+_UINT64 = np.uint64
+# Two hex digits per byte value, and where runs of a UUID's 32 digits go between its dashes
+_HEX = np.array([f'{i:02x}'.encode() for i in range(256)], dtype='S2').view(np.uint16)
+_UUID_GROUPS = ((0, 8, 0), (9, 13, 8), (14, 18, 12), (19, 23, 16), (24, 36, 20))
+
+
+def _mix(x):
+    """splitmix64's finalizer: a bijection of uint64 that scrambles every bit"""
+    x = (x ^ (x >> _UINT64(30))) * _UINT64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> _UINT64(27))) * _UINT64(0x94D049BB133111EB)
+    return x ^ (x >> _UINT64(31))
+
+
+def _strings(values):
+    """Fixed-width bytes array of a tuple of str"""
+    return np.array([v.encode('utf-8') for v in values])
+
+
+class Draws:
+    """Uniform numbers and ids that are pure functions of (seed, stream, row number)"""
+
+    def __init__(self, seed):
+        self.seed = seed
+        self._keys = {}
+
+    def key(self, stream):
+        if stream not in self._keys:
+            base = _UINT64(self.seed & 0xFFFFFFFF) << _UINT64(32) | _UINT64(zlib.crc32(stream.encode()))
+            with np.errstate(over='ignore'):
+                self._keys[stream] = _mix(np.array([base], dtype=np.uint64))[0]
+        return self._keys[stream]
+
+    def bits(self, stream, idx):
+        with np.errstate(over='ignore'):
+            return _mix(np.asarray(idx, dtype=np.uint64) ^ self.key(stream))
+
+    def uniform(self, stream, idx):
+        """Floats in [0, 1), one per idx"""
+        return (self.bits(stream, idx) >> _UINT64(11)).astype(np.float64) * 2.0 ** -53
+
+    def choice(self, stream, idx, cdf):
+        """Index into the weights behind cdf, one per idx"""
+        return np.searchsorted(cdf, self.uniform(stream, idx), side='right')
+
+    def uuids(self, stream, idx):
+        """Version 4 UUID strings, distinct for distinct idx within a stream"""
+        halves = np.empty((len(idx), 2), dtype='>u8')
+        halves[:, 0] = self.bits(stream, idx)
+        halves[:, 1] = self.bits(stream + '#2', idx)
+        raw = halves.view(np.uint8).reshape(-1, 16)
+        raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+        raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+        digits = _HEX[raw].view(np.uint8)
+        out = np.full((len(idx), 36), ord('-'), dtype=np.uint8)
+        for lo, hi, start in _UUID_GROUPS:
+            out[:, lo:hi] = digits[:, start:start + hi - lo]
+        return out.view('S36').ravel()
+
+
+def cdf(weights):
+    weights = np.asarray(weights, dtype=np.float64)
+    cumulative = np.cumsum(weights / weights.sum())
+    cumulative[-1] = 1.0
+    return cumulative
+
+
+def zipf_cdf(n, exponent):
+    return cdf(1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent)
+
+
+def timestamps(seconds):
+    """ISO 8601 UTC timestamps of epoch seconds, YYYY-MM-DDTHH:MM:SSZ"""
+    if not len(seconds):
+        return np.empty(0, dtype='S20')
+    days, clock = np.divmod(seconds, 86400)
+    first = days.min()
+    # Format each day once; the time of day is plain digit arithmetic
+    dates = np.datetime_as_string(np.arange(first, days.max() + 1).astype('datetime64[D]')).astype('S10')
+    out = np.empty((len(seconds), 20), dtype=np.uint8)
+    out[:, :10] = dates.view(np.uint8).reshape(-1, 10)[days - first]
+    out[:, [10, 13, 16, 19]] = np.frombuffer(b'T::Z', dtype=np.uint8)
+    for column, value in ((11, clock // 3600), (14, clock // 60 % 60), (17, clock % 60)):
+        out[:, column] = ord('0') + value // 10
+        out[:, column + 1] = ord('0') + value % 10
+    return out.view('S20').ravel()
+
+
+def numbers(values, decimals=None):
+    return (np.round(values, decimals) if decimals is not None else values).astype('S')
+
+
+def csv_quote(values):
+    """Quote every value for COPY's CSV format"""
+    return np.char.add(np.char.add(b'"', np.char.replace(values, b'"', b'""')), b'"')
+
+
+def null_where(mask, values):
+    """NULL (an unquoted empty field) where mask is set"""
+    return np.where(mask, b'', values)
+
+
+def concat(*parts):
+    out = parts[0]
+    for part in parts[1:]:
+        out = np.char.add(out, part)
+    return out
+
+
+def pick(values, index):
+    return _strings(values)[index]
+
+
+def check_values(schema, table, column, weights):
+    """(values, cdf) drawn for a column: its CHECK (column IN (...)) list if it has one, weighted where known"""
+    t = schema.table(table)
+    allowed = None
+    for check in t.checks if t is not None else ():
+        m = re.search(_CHECK_IN.format(re.escape(column)), check, re.IGNORECASE)
+        if m:
+            allowed = tuple(v.strip().strip("'") for v in m.group(1).split(','))
+    values = allowed or tuple(weights)
+    share = sum(weights.values()) / len(weights)
+    return values, cdf([weights.get(v, share) for v in values])
+
+
+class Plan:
+    """Row counts, time span and the few whole-run arrays every table draws from"""
+
+    def __init__(self, schema, rows, seed=0, until=UNTIL, days=DAYS, zipf=ZIPF_EXPONENT):
+        self.schema = schema
+        self.rows = dict(rows)
+        self.draws = Draws(seed)
+        self.end = int(np.datetime64(until, 's').astype(np.int64))
+        self.start = self.end - days * 86400
+        self.users = rows['auth.users']
+        self.notebooks = rows['notebooks']
+        self.operations = rows['scraping_operations']
+        self._ids = {}
+
+        # Zipf rank r is notebook popular[r]; rank_of is the inverse
+        rng = np.random.default_rng(seed)
+        self.popular = rng.permutation(self.notebooks)
+        self.rank_of = np.empty(self.notebooks, dtype=np.int64)
+        self.rank_of[self.popular] = np.arange(self.notebooks)
+        self.notebook_cdf = zipf_cdf(self.notebooks, zipf)
+
+        # Lognormal activity: a minority of users do most of the saving and clicking
+        activity = rng.lognormal(0.0, SAVES_PER_USER_SIGMA, self.users)
+        self.user_cdf = cdf(activity)
+        self.saves = _apportion(rows['saved_notebooks'], activity, self.notebooks // 2)
+        self.save_offsets = np.concatenate(([0], np.cumsum(self.saves)))
+        self.rows['saved_notebooks'] = int(self.save_offsets[-1])
+
+        self.categories, self.category_cdf = check_values(schema, 'notebooks', 'category', CATEGORY_WEIGHTS)
+        self.sources, self.source_cdf = check_values(schema, 'scraping_operations', 'source', SOURCE_WEIGHTS)
+        self.statuses, self.status_cdf = check_values(schema, 'scraping_operations', 'status', STATUS_WEIGHTS)
+
+    def ids(self, stream, idx, count):
+        """UUIDs of rows idx of a table of count rows, formatted once per run if the table is small enough"""
+        if count > ID_CACHE_ROWS:
+            return self.draws.uuids(stream, idx)
+        if stream not in self._ids:
+            self._ids[stream] = self.draws.uuids(stream, np.arange(count))
+        return self._ids[stream][idx]
+
+    def user_ids(self, idx):
+        return self.ids('users', idx, self.users)
+
+    def notebook_ids(self, idx):
+        return self.ids('notebooks', idx, self.notebooks)
+
+    def created(self, stream, idx, count, share=0.9):
+        """Creation times spread over the first share of the span in row order, so older rows come first"""
+        position = (idx + self.draws.uniform(f'{stream}.created', idx)) / count
+        return self.start + (position * share * (self.end - self.start)).astype(np.int64)
+
+    def after(self, stream, idx, earliest):
+        """A time between earliest and the end of the span"""
+        return earliest + (self.draws.uniform(stream, idx) * (self.end - earliest)).astype(np.int64)
+
+    def popular_notebooks(self, stream, idx):
+        return self.popular[self.draws.choice(stream, idx, self.notebook_cdf)]
+
+    def operation_of(self, item):
+        return item * self.operations // self.rows['scraped_items']
+
+    def items_of(self, op):
+        """Number of scraped items operation_of() assigns to each operation"""
+        items = self.rows['scraped_items']
+        return -(-(op + 1) * items // self.operations) - -(-op * items // self.operations)
+
+
+def _apportion(total, weights, cap):
+    """Integers proportional to weights that sum to total, each at most cap (the sum falls short if it must)"""
+    share = total * weights / weights.sum()
+    counts = np.minimum(np.floor(share).astype(np.int64), cap)
+    short = min(total - int(counts.sum()), int((counts < cap).sum()))
+    if short > 0:
+        remainder = np.where(counts < cap, share - np.floor(share), -1.0)
+        counts[np.argpartition(-remainder, short - 1)[:short]] += 1
+    return counts
+
+
+def user_names(plan, idx):
+    draws = plan.draws
+    first = pick(FIRST_NAMES, (draws.uniform('users.first', idx) * len(FIRST_NAMES)).astype(np.int64))
+    last = pick(LAST_NAMES, (draws.uniform('users.last', idx) * len(LAST_NAMES)).astype(np.int64))
+    return concat(first, b' ', last)
+
+
+def gen_users(plan, lo, hi):
+    idx = np.arange(lo, hi)
+    name = user_names(plan, idx)
+    created = timestamps(plan.created('users', idx, plan.users))
+    metadata = csv_quote(concat(b'{"full_name": "', name, b'"}'))
+    email = concat(b'loadgen.', str(plan.draws.seed).encode(), b'.', idx.astype('S'), b'@example.com')
+    n = len(idx)
+    return {
+        'id': plan.user_ids(idx),
+        'instance_id': np.full(n, b'00000000-0000-0000-0000-000000000000'),
+        'aud': np.full(n, b'authenticated'),
+        'role': np.full(n, b'authenticated'),
+        'email': email,
+        'raw_user_meta_data': metadata,
+        'created_at': created,
+        'updated_at': created,
+    }
+
+
+def gen_profiles(plan, lo, hi):
+    idx = np.arange(lo, hi)
+    draws = plan.draws
+    institution = pick(INSTITUTIONS, (draws.uniform('profiles.institution', idx) * len(INSTITUTIONS)).astype(np.int64))
+    topic = pick(TAGS['Research'] + TAGS['Education'], (draws.uniform('profiles.bio', idx) * 20).astype(np.int64))
+    bio = csv_quote(concat(b'Working on ', topic, b' with NotebookLM.'))
+    return {
+        'id': plan.user_ids(idx),
+        'full_name': csv_quote(user_names(plan, idx)),
+        'bio': null_where(draws.uniform('profiles.bio.null', idx) < 0.4, bio),
+        'institution': null_where(draws.uniform('profiles.institution.null', idx) < 0.3, csv_quote(institution)),
+        'website': null_where(draws.uniform('profiles.website.null', idx) < 0.7,
+                              concat(b'https://example.com/u/', idx.astype('S'))),
+        'created_at': timestamps(plan.created('users', idx, plan.users)),
+    }
+
+
+def notebook_tags(plan, idx, category):
+    """Postgres array literals of one to MAX_TAGS distinct Zipf-weighted tags from each row's category"""
+    vocabulary = np.array([[t.encode() for t in TAGS.get(c, TAGS['Personal'])] + [t.encode() for t in GENERAL_TAGS]
+                           for c in plan.categories])
+    size = vocabulary.shape[1]
+    specific = size - len(GENERAL_TAGS)
+    weights = np.concatenate((1.0 / np.arange(1, specific + 1) ** ZIPF_EXPONENT,
+                              np.full(len(GENERAL_TAGS), GENERAL_TAG_SHARE / len(GENERAL_TAGS))))
+    # Gumbel top-k: sorting log(weight) plus Gumbel noise samples without replacement
+    slots = idx[:, None].astype(np.uint64) * _UINT64(size) + np.arange(size, dtype=np.uint64)
+    noise = -np.log(-np.log(np.maximum(plan.draws.uniform('notebooks.tags', slots), 1e-300)))
+    order = np.argsort(-(np.log(weights) + noise), axis=1)
+    count = plan.draws.choice('notebooks.tag_count', idx, cdf(TAG_COUNT_WEIGHTS)) + 1
+    literal = np.full(len(idx), b'{')
+    for slot in range(MAX_TAGS):
+        tag = vocabulary[category, order[:, slot]]
+        element = concat(b',' if slot else b'', b'"', tag, b'"')
+        literal = np.char.add(literal, np.where(slot < count, element, b''))
+    return csv_quote(np.char.add(literal, b'}'))
+
+
+def gen_notebooks(plan, lo, hi):
+    idx = np.arange(lo, hi)
+    draws = plan.draws
+    category = draws.choice('notebooks.category', idx, plan.category_cdf)
+    names = _strings(plan.categories)[category]
+    topic = np.array([[t.encode() for t in TOPICS.get(c, TOPICS['Personal'])] for c in plan.categories])[
+        category, (draws.uniform('notebooks.topic', idx) * 6).astype(np.int64)]
+    kind = pick(KINDS, (draws.uniform('notebooks.kind', idx) * len(KINDS)).astype(np.int64))
+    sources = (draws.uniform('notebooks.sources', idx) * 95 + 5).astype(np.int64).astype('S')
+    ids = plan.notebook_ids(idx)
+    rank = plan.rank_of[idx]
+    popularity = 1.0 - np.log1p(rank) / np.log1p(plan.notebooks)
+    author = pick(FIRST_NAMES, (draws.uniform('notebooks.first', idx) * len(FIRST_NAMES)).astype(np.int64))
+    author = concat(author, b' ', pick(LAST_NAMES, (draws.uniform('notebooks.last', idx) * len(LAST_NAMES)).astype(
+        np.int64)))
+    institution = pick(INSTITUTIONS, (draws.uniform('notebooks.institution', idx) * len(INSTITUTIONS)).astype(np.int64))
+    created = plan.created('notebooks', idx, plan.notebooks)
+    return {
+        'id': ids,
+        'title': csv_quote(concat(topic, b' ', kind)),
+        'description': csv_quote(concat(b'Analysis of ', sources, b' ', np.char.lower(topic),
+                                        b' sources, summarised for ', np.char.lower(names), b' work.')),
+        'category': names,
+        'tags': notebook_tags(plan, idx, category),
+        'author': csv_quote(author),
+        'institution': null_where(draws.uniform('notebooks.institution.null', idx) < 0.2, csv_quote(institution)),
+        'notebook_url': concat(b'https://notebooklm.google.com/notebook/', ids),
+        'featured': np.where(rank < max(plan.notebooks // 100, 1), b'true', b'false'),
+        'popularity_score': numbers(popularity, 4),
+        'created_at': timestamps(created),
+        'updated_at': timestamps(plan.after('notebooks.updated', idx, created)),
+    }
+
+
+def group_rank(groups):
+    """Position of each element within its run of equal values in a sorted array"""
+    index = np.arange(len(groups))
+    starts = np.concatenate(([True], groups[1:] != groups[:-1])) if len(groups) else np.empty(0, dtype=bool)
+    return index - np.maximum.accumulate(np.where(starts, index, 0))
+
+
+def saved_pairs(plan, first_user, last_user):
+    """(user, notebook, row number) of the saves of users [first_user, last_user), distinct per pair.
+
+    Each round draws a few more candidates than the users still need and
+    keeps the distinct (user, notebook) keys; sorted keys are grouped by
+    user, so the surplus is cut per user without another sort. Users who save a
+    large share of the catalogue run out of popular notebooks and draw
+    uniformly after POPULAR_ROUNDS.
+    """
+    n = plan.notebooks
+    wanted = plan.saves[first_user:last_user]
+    active = np.flatnonzero(wanted) + first_user
+    missing = wanted[active - first_user]
+    kept = np.empty(0, dtype=np.int64)
+    done = []
+    for attempt in range(SAVE_ROUNDS):
+        if not len(active):
+            break
+        draw = missing + missing // 4 + 2
+        user = np.repeat(active, draw)
+        position = np.arange(len(user)) - np.repeat(np.cumsum(draw) - draw, draw)
+        slot = (user.astype(np.uint64) << _UINT64(36)) | _UINT64(attempt << 30) | position.astype(np.uint64)
+        if attempt < POPULAR_ROUNDS:
+            notebook = plan.popular_notebooks('saved.notebook', slot)
+        else:
+            notebook = (plan.draws.uniform('saved.notebook.any', slot) * n).astype(np.int64)
+        keys = np.concatenate((kept, user * n + notebook))
+        keys.sort()
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        user = keys // n
+        keys = keys[group_rank(user) < wanted[user - first_user]]
+        got = np.bincount(keys // n - first_user, minlength=len(wanted))
+        finished = got >= wanted
+        settled = finished[keys // n - first_user]
+        done.append(keys[settled])
+        kept = keys[~settled]
+        active = active[~finished[active - first_user]]
+        missing = wanted[active - first_user] - got[active - first_user]
+    keys = np.sort(np.concatenate(done + [kept]))
+    user = keys // n
+    return user, keys % n, plan.save_offsets[user] + group_rank(user)
+
+
+def gen_saved_notebooks(plan, first_user, last_user):
+    user, notebook, rows = saved_pairs(plan, first_user, last_user)
+    earliest = np.maximum(plan.created('users', user, plan.users), plan.created('notebooks', notebook, plan.notebooks))
+    return {
+        'id': plan.draws.uuids('saved_notebooks', rows),
+        'user_id': plan.user_ids(user),
+        'notebook_id': plan.notebook_ids(notebook),
+        'created_at': timestamps(plan.after('saved.created', rows, earliest)),
+    }
+
+
+def gen_user_interactions(plan, lo, hi):
+    idx = np.arange(lo, hi)
+    draws = plan.draws
+    user = draws.choice('interactions.user', idx, plan.user_cdf)
+    notebook = plan.popular_notebooks('interactions.notebook', idx)
+    kinds, kind_cdf = tuple(INTERACTION_WEIGHTS), cdf(list(INTERACTION_WEIGHTS.values()))
+    kind = pick(kinds, draws.choice('interactions.type', idx, kind_cdf))
+    earliest = np.maximum(plan.created('users', user, plan.users), plan.created('notebooks', notebook, plan.notebooks))
+    metadata = np.where(draws.uniform('interactions.metadata', idx) < 0.3, b'"{""source"": ""search""}"',
+                        b'"{""source"": ""browse""}"')
+    return {
+        'id': draws.uuids('user_interactions', idx),
+        'user_id': plan.user_ids(user),
+        'content_id': plan.notebook_ids(notebook),
+        'interaction_type': kind,
+        'created_at': timestamps(plan.after('interactions.created', idx, earliest)),
+        'metadata': metadata,
+    }
+
+
+def operation_ids(op):
+    return concat(b'loadgen_', op.astype('S'))
+
+
+def operation_sources(plan, op):
+    return plan.draws.choice('operations.source', op, plan.source_cdf)
+
+
+def operation_started(plan, op):
+    return plan.created('operations', op, plan.operations, share=0.98)
+
+
+def gen_scraping_operations(plan, lo, hi):
+    op = np.arange(lo, hi)
+    draws = plan.draws
+    status = draws.choice('operations.status', op, plan.status_cdf)
+    status_name = _strings(plan.statuses)[status]
+    started = operation_started(plan, op)
+    finished = (status_name == b'completed') | (status_name == b'failed')
+    completed = timestamps(started + (draws.uniform('operations.duration', op) * 600 + 5).astype(np.int64))
+    query = pick(QUERIES, (draws.uniform('operations.query', op) * len(QUERIES)).astype(np.int64))
+    return {
+        'operation_id': operation_ids(op),
+        'source': _strings(plan.sources)[operation_sources(plan, op)],
+        'query': csv_quote(query),
+        'max_results': pick(('10', '25', '50', '100'), (draws.uniform('operations.max', op) * 4).astype(np.int64)),
+        'status': status_name,
+        'started_at': timestamps(started),
+        'completed_at': null_where(~finished, completed),
+        'items_found': plan.items_of(op).astype('S'),
+        'error_message': null_where(status_name != b'failed', b'"rate limited by source"'),
+        'created_at': timestamps(started),
+        'updated_at': timestamps(started),
+    }
+
+
+def gen_scraped_items(plan, lo, hi):
+    idx = np.arange(lo, hi)
+    draws = plan.draws
+    op = plan.operation_of(idx)
+    source = _strings(plan.sources)[operation_sources(plan, op)]
+    query = pick(QUERIES, (draws.uniform('operations.query', op) * len(QUERIES)).astype(np.int64))
+    # Triangular on [0, 1]: most items are middling, a few are very good or very bad
+    quality = (draws.uniform('items.quality.a', idx) + draws.uniform('items.quality.b', idx)) / 2
+    created = operation_started(plan, op) + (draws.uniform('items.created', idx) * 300).astype(np.int64)
+    author = pick(FIRST_NAMES, (draws.uniform('items.author', idx) * len(FIRST_NAMES)).astype(np.int64))
+    return {
+        'operation_id': operation_ids(op),
+        'title': csv_quote(concat(np.char.capitalize(query), b' #', idx.astype('S'))),
+        'description': csv_quote(concat(b'Result for "', query, b'" from ', source, b'.')),
+        'url': concat(b'https://', source, b'.example.com/item/', idx.astype('S')),
+        'author': null_where(draws.uniform('items.author.null', idx) < 0.25, np.char.lower(author)),
+        'quality_score': numbers(quality, 3),
+        'source': source,
+        'metadata': np.full(len(idx), b'"{""rank"": 0}"'),
+        'featured': np.where(quality > 0.95, b'true', b'false'),
+        'created_at': timestamps(created),
+        'updated_at': timestamps(created),
+    }
+
+
+TABLES = (
+    Generator('auth.users', 'auth.users',
+          ('id', 'instance_id', 'aud', 'role', 'email', 'raw_user_meta_data', 'created_at', 'updated_at'), gen_users),
+    Generator('profiles', 'auth.users', ('id', 'full_name', 'bio', 'institution', 'website', 'created_at'), gen_profiles),
+    Generator('notebooks', 'notebooks', ('id', 'title', 'description', 'category', 'tags', 'author', 'institution',
+                                     'notebook_url', 'featured', 'popularity_score', 'created_at', 'updated_at'),
+          gen_notebooks),
+    Generator('saved_notebooks', 'saved_notebooks', ('id', 'user_id', 'notebook_id', 'created_at'), gen_saved_notebooks),
+    # Not created by the migrations; columns as lib/recommendation-engine.ts reads and writes them
+    Generator('user_interactions', 'user_interactions',
+          ('id', 'user_id', 'content_id', 'interaction_type', 'created_at', 'metadata'), gen_user_interactions),
+    Generator('scraping_operations', 'scraping_operations',
+          ('operation_id', 'source', 'query', 'max_results', 'status', 'started_at', 'completed_at', 'items_found',
+           'error_message', 'created_at', 'updated_at'), gen_scraping_operations),
+    Generator('scraped_items', 'scraped_items',
+          ('operation_id', 'title', 'description', 'url', 'author', 'quality_score', 'source', 'metadata', 'featured',
+           'created_at', 'updated_at'), gen_scraped_items),
+)
+
+
+def table_columns(schema, table):
+    """The columns of a Table the migrations have; raises ValueError if a required one is not generated"""
+    if table.name.startswith('auth.'):
+        return table.columns
+    model = schema.table(table.name)
+    if model is None:
+        return table.columns
+    columns = tuple(c for c in table.columns if c in model.columns)
+    missing = [c.name for c in model.columns.values() if c.not_null and c.default is None and not c.generated
+               and c.name not in columns]
+    if missing:
+        raise ValueError(f"{table.name}: no generator for required columns {', '.join(missing)}")
+    return columns
+
+
+def chunks(plan, table, chunk_rows):
+    """(lo, hi) row ranges of a table; saved_notebooks is chunked by user so each user's saves stay together"""
+    if table.name == 'saved_notebooks':
+        bounds = np.searchsorted(plan.save_offsets, np.arange(0, plan.rows['saved_notebooks'], chunk_rows),
+                                 side='right') - 1
+        bounds = list(dict.fromkeys([0] + [int(b) for b in bounds[1:]] + [plan.users]))
+        return list(zip(bounds, bounds[1:]))
+    rows = plan.rows[table.rows]
+    return [(lo, min(lo + chunk_rows, rows)) for lo in range(0, rows, chunk_rows)]
+
+
+def csv_lines(values):
+    """The CSV lines of one chunk of columns, as bytes or a byte matrix"""
+    if not len(values[0]):
+        return b''
+    if all((np.char.str_len(v) == v.dtype.itemsize).all() for v in values):
+        # Every field fills its width (ids, timestamps): lay the bytes out in one matrix
+        widths = [v.dtype.itemsize for v in values]
+        out = np.empty((len(values[0]), sum(widths) + len(widths)), dtype=np.uint8)
+        at = 0
+        for value, width in zip(values, widths):
+            out[:, at:at + width] = value.view(np.uint8).reshape(-1, width)
+            out[:, at + width] = ord(',')
+            at += width + 1
+        out[:, -1] = ord('\n')
+        return out
+    line = values[0]
+    for value in values[1:]:
+        line = np.char.add(np.char.add(line, b','), value)
+    return b'\n'.join(line.tolist()) + b'\n'
+
+
+_worker_plan = None
+
+
+def _init_worker(plan):
+    global _worker_plan
+    _worker_plan = plan
+
+
+def chunk_lines(table, columns, lo, hi, plan=None):
+    """(CSV lines, row count) of rows [lo, hi) of a table"""
+    generated = table.generate(plan or _worker_plan, lo, hi)
+    values = [generated[c] for c in columns]
+    return csv_lines(values), len(values[0])
+
+
+def write_table(plan, table, columns, path, chunk_rows, pool=None):
+    """Write a table's CSV file chunk by chunk, in order, and return its row count.
+
+    With a pool (whose workers were started with _init_worker) the chunks
+    are generated in parallel; they come out the same either way.
+    """
+    ranges = chunks(plan, table, chunk_rows)
+    if pool is None:
+        results = (chunk_lines(table, columns, lo, hi, plan) for lo, hi in ranges)
+    else:
+        n = len(ranges)
+        results = pool.map(chunk_lines, [table] * n, [columns] * n, [lo for lo, _ in ranges], [hi for _, hi in ranges])
+    written = 0
+    with open(path, 'wb') as f:
+        f.write(','.join(columns).encode() + b'\n')
+        for lines, count in results:
+            f.write(lines)
+            written += count
+    return written
+
+
+def render_loader(files):
+    """psql script loading the files in order: profiles through a staging table, then ANALYZE"""
+    tables = ', '.join(f"'{table}'" for _, table, _ in files)
+    lines = ['-- Written by loadgen.py; run from the directory it was written in, e.g.',
+             '--   psql "$DATABASE_URL" -v ON_ERROR_STOP=1 --single-transaction -f load.sql',
+             '-- Fails before loading anything if the migrations have not created every table',
+             'DO $$',
+             'DECLARE',
+             '  missing text;',
+             'BEGIN',
+             f"  SELECT string_agg(t, ', ') INTO missing FROM unnest(ARRAY[{tables}]) t WHERE to_regclass(t) IS NULL;",
+             '  IF missing IS NOT NULL THEN',
+             "    RAISE EXCEPTION 'loadgen: missing tables %; apply the migrations first', missing;",
+             '  END IF;',
+             'END $$;']
+    for path, table, columns in files:
+        name = os.path.basename(path)
+        if table == 'profiles':
+            # The on_auth_user_created trigger has already made a bare profile for every user
+            updates = ', '.join(f'{quote_ident(c)} = EXCLUDED.{quote_ident(c)}' for c in columns if c != 'id')
+            column_list = ', '.join(quote_ident(c) for c in columns)
+            lines += ['CREATE TEMP TABLE loadgen_profiles (LIKE profiles INCLUDING DEFAULTS) ON COMMIT DROP;',
+                      copy_command('loadgen_profiles', columns, name),
+                      f'INSERT INTO profiles ({column_list}) SELECT {column_list} FROM loadgen_profiles',
+                      f'  ON CONFLICT (id) DO UPDATE SET {updates};']
+        else:
+            lines.append(copy_command(table, columns, name))
+    lines.append(f"ANALYZE {', '.join(table for _, table, _ in files)};")
+    return '\n'.join(lines) + '\n'
+
+
+def parse_rows(values):
+    rows = {}
+    for value in values or ():
+        table, _, count = value.partition('=')
+        if table not in ROWS or not count.isdigit():
+            raise argparse.ArgumentTypeError(f"--rows takes TABLE=N with TABLE one of {', '.join(ROWS)}")
+        rows[table] = int(count)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate production-scale synthetic data as COPY CSV files.")
+    parser.add_argument('--dir', default=MIGRATION_DIR, help=f"migration directory (default: {MIGRATION_DIR})")
+    parser.add_argument('--out', default=OUT_DIR, help=f"where the files go (default: {OUT_DIR})")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply every row count (default: 1)")
+    parser.add_argument('--rows', nargs='+', metavar='TABLE=N', help="row count of one table, e.g. saved_notebooks=10000000")
+    parser.add_argument('--tables', nargs='+', metavar='TABLE', help="only write these tables' files")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help=f"rows per chunk (default: {CHUNK_ROWS})")
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="worker processes to generate chunks in (0 = one per CPU, default: 1)")
+    parser.add_argument('--zipf', type=float, default=ZIPF_EXPONENT,
+                        help=f"popularity exponent of saves and interactions (default: {ZIPF_EXPONENT})")
+    parser.add_argument('--until', default=UNTIL, help=f"newest timestamp, YYYY-MM-DD (default: {UNTIL})")
+    parser.add_argument('--days', type=int, default=DAYS, help=f"days of history before --until (default: {DAYS})")
+    args = parser.parse_args(argv)
+
+    try:
+        rows = {table: max(int(count * args.scale), 1) for table, count in ROWS.items()}
+        rows.update(parse_rows(args.rows))
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if not os.path.exists(args.dir):
+        print(f"Migration directory {args.dir} not found!")
+        return 1
+    schema = load_schema(args.dir)
+    try:
+        columns = {table.name: table_columns(schema, table) for table in TABLES}
+    except ValueError as e:
+        print(f"✗ {e}")
+        return 1
+    # Tables the migrations do not create are opt-in, and never in load.sql: \copy into them would abort the load
+    unmigrated = {table.name for table in TABLES if not table.name.startswith('auth.') and schema.table(table.name) is None}
+    wanted = set(args.tables) if args.tables else {table.name for table in TABLES} - unmigrated
+    unknown = wanted - {table.name for table in TABLES}
+    if unknown:
+        parser.error(f"unknown table(s) {', '.join(sorted(unknown))}; choose from {', '.join(t.name for t in TABLES)}")
+    for name in sorted(wanted & unmigrated):
+        print(f"  - {name} is not created by the migrations: columns follow the app code, left out of load.sql")
+
+    started = time.perf_counter()
+    plan = Plan(schema, rows, args.seed, args.until, args.days, args.zipf)
+    os.makedirs(args.out, exist_ok=True)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(plan,)) if jobs > 1 else None
+    files = []
+    try:
+        for number, table in enumerate(TABLES, 1):
+            path = os.path.join(args.out, f'{number:02d}_{table.name}.csv')
+            if table.name in wanted:
+                table_started = time.perf_counter()
+                count = write_table(plan, table, columns[table.name], path, args.chunk_rows, pool)
+                elapsed = time.perf_counter() - table_started
+                print(f"  ✓ {table.name}: {count} rows in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)")
+            if os.path.exists(path) and table.name not in unmigrated:
+                files.append((path, table.name, columns[table.name]))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    with open(os.path.join(args.out, 'load.sql'), 'w', encoding='utf-8') as f:
+        f.write(render_loader(files))
+    print(f"Wrote {args.out} in {time.perf_counter() - started:.1f}s; load it with psql -f load.sql from there.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""Classify migration statements by the locks they take on live tables.
+
+Every table DDL statement of the migrations is classified by the lock it
+takes (and so whether it blocks reads, writes or neither while it runs) and
+by what it does to the existing rows: nothing, a full scan, an index build
+or a table rewrite. Statements on tables created earlier in the same
+migration are skipped, since nobody else can be using those yet. With a
+--row-counts file ({table: rows}, the format index_advisor reads) the time
+each lock is held is estimated.
+
+Blocking statements with a safe equivalent get one: CREATE INDEX becomes
+CREATE INDEX CONCURRENTLY, CHECK and FOREIGN KEY constraints are added
+NOT VALID and validated later, UNIQUE/PRIMARY KEY constraints are built on a
+concurrent index, and SET NOT NULL goes through a validated CHECK. --fix
+applies them. CONCURRENTLY cannot run inside a transaction, so each such
+statement is moved to a migration of its own, and the VALIDATE steps go
+into a follow-up migration, so that the long scans do not run under the
+locks the original migration takes. An index build stays where it is when
+a later statement of its migration needs the index (by name, or a unique
+one through ON CONFLICT or REFERENCES).
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import itertools
+from collections import namedtuple
+
+from sql_lexer import join_segments, policy_signature, significant_tokens, split_statements, trigger_signature, unquote_ident
+from sql_schema import (MIGRATION_DIR, Schema, Source, alter_table_actions, apply_statement, find_migrations,
+                        iter_ddl, normalize_name)
+
+ACCESS_EXCLUSIVE = 'ACCESS EXCLUSIVE'
+SHARE_ROW_EXCLUSIVE = 'SHARE ROW EXCLUSIVE'
+SHARE = 'SHARE'
+SHARE_UPDATE_EXCLUSIVE = 'SHARE UPDATE EXCLUSIVE'
+# Weakest first
+LOCK_ORDER = (SHARE_UPDATE_EXCLUSIVE, SHARE, SHARE_ROW_EXCLUSIVE, ACCESS_EXCLUSIVE)
+BLOCKS = {
+    ACCESS_EXCLUSIVE: 'blocks reads and writes',
+    SHARE_ROW_EXCLUSIVE: 'blocks writes',
+    SHARE: 'blocks writes',
+    SHARE_UPDATE_EXCLUSIVE: 'does not block reads or writes',
+}
+
+# What a statement does to the rows already in the table, cheapest first
+IMPACTS = (None, 'scan', 'index build', 'rewrite')
+# Rough rows per second, to turn row counts into lock durations
+THROUGHPUT = {'scan': 1000000, 'index build': 250000, 'rewrite': 100000}
+
+# Defaults Postgres has to evaluate once per existing row, which rewrites the table
+VOLATILE_DEFAULTS = frozenset(('gen_random_uuid', 'uuid_generate_v1', 'uuid_generate_v4', 'random',
+                               'clock_timestamp', 'timeofday', 'nextval'))
+SERIAL_TYPES = frozenset(('SMALLSERIAL', 'SERIAL', 'BIGSERIAL', 'SERIAL2', 'SERIAL4', 'SERIAL8'))
+
+# Leading words that name a statement in the report
+STATEMENT_WORDS = frozenset(('CREATE', 'ALTER', 'DROP', 'OR', 'REPLACE', 'UNIQUE', 'INDEX', 'CONCURRENTLY', 'TABLE',
+                             'POLICY', 'TRIGGER'))
+
+# A safer form of a statement. inline replaces the statement in its migration ('' drops it),
+# each of concurrent becomes a migration of its own, after goes into one follow-up migration.
+Fix = namedtuple('Fix', 'inline concurrent after', defaults=((), ()))
+Classification = namedtuple('Classification', 'lock impact advice fix', defaults=(None, '', None))
+Finding = namedtuple('Finding', 'source table statement lock impact advice fix start')
+
+
+def _words(tokens):
+    return [tok.text.upper() if tok.kind == 'word' else tok.text for tok in tokens]
+
+
+def _text(sql, tokens):
+    return sql[tokens[0].start:tokens[-1].start + len(tokens[-1].text)] if tokens else ''
+
+
+def _name_after(tokens, i):
+    """Possibly schema-qualified name starting at tokens[i], normalized"""
+    parts = [unquote_ident(tokens[i].text)]
+    while i + 2 < len(tokens) and tokens[i + 1].text == '.':
+        parts.append(unquote_ident(tokens[i + 2].text))
+        i += 2
+    return normalize_name('.'.join(parts))
+
+
+def _strongest(classifications):
+    lock = max((c.lock for c in classifications), key=LOCK_ORDER.index)
+    impact = max((c.impact for c in classifications), key=IMPACTS.index)
+    advice = '; '.join(c.advice for c in classifications if c.advice)
+    return Classification(lock, impact, advice)
+
+
+def _statement(sql):
+    """sql ending in exactly one semicolon"""
+    return sql.rstrip().rstrip(';').rstrip() + ';'
+
+
+def _add_column(table, tokens):
+    words = _words(tokens)
+    impact = None
+    advice = []
+    if len(words) > 1 and words[1] in SERIAL_TYPES or 'IDENTITY' in words or ('GENERATED' in words and 'STORED' in words):
+        impact = 'rewrite'
+        advice.append('fills every existing row: add a plain column, backfill it in batches, then switch it over')
+    if 'DEFAULT' in words:
+        default = words[words.index('DEFAULT') + 1:]
+        if any(w.lower() in VOLATILE_DEFAULTS for w in default):
+            impact = 'rewrite'
+            advice.append('a volatile DEFAULT rewrites the table: add the column without it, SET DEFAULT, '
+                          'then backfill existing rows in batches')
+    elif 'NOT' in words and 'NULL' in words[words.index('NOT'):]:
+        advice.append('NOT NULL without a DEFAULT fails on a non-empty table')
+    if impact is None and ('PRIMARY' in words or 'UNIQUE' in words):
+        impact = 'index build'
+        advice.append('builds its index under the lock: add the column, then the constraint on a concurrent index')
+    if impact is None and 'CHECK' in words:
+        impact = 'scan'
+        advice.append('checks every row under the lock: add the column, then the CHECK as NOT VALID')
+    if 'REFERENCES' in words:
+        ref = _name_after(tokens, words.index('REFERENCES') + 1)
+        advice.append(f'also locks {ref} against writes')
+    return Classification(ACCESS_EXCLUSIVE, impact, '; '.join(advice))
+
+
+def _add_constraint(sql, table, tokens, single):
+    """ADD [CONSTRAINT name] CHECK/FOREIGN KEY/UNIQUE/PRIMARY KEY/EXCLUDE"""
+    words = _words(tokens)
+    name = None
+    k = 1
+    if words[1:2] == ['CONSTRAINT']:
+        name = tokens[2].text
+        k = 3
+    kind = words[k] if k < len(words) else None
+    not_valid = words[-2:] == ['NOT', 'VALID']
+    if kind in ('CHECK', 'FOREIGN'):
+        lock = SHARE_ROW_EXCLUSIVE if kind == 'FOREIGN' else ACCESS_EXCLUSIVE
+        if not_valid:
+            return Classification(lock, None, 'existing rows are checked later by VALIDATE CONSTRAINT')
+        also = f' and locks {_name_after(tokens, words.index("REFERENCES") + 1)} against writes' \
+            if 'REFERENCES' in words else ''
+        fix = None
+        if single and name:
+            fix = Fix(_statement(sql)[:-1] + ' NOT VALID;', (), (f'ALTER TABLE {table} VALIDATE CONSTRAINT {name};',))
+        return Classification(lock, 'scan', f'checks every row under the lock{also}: add it NOT VALID, '
+                                            'then VALIDATE CONSTRAINT in a later migration', fix)
+    if kind in ('UNIQUE', 'PRIMARY'):
+        if 'USING' in words and words[words.index('USING') + 1:words.index('USING') + 2] == ['INDEX']:
+            return Classification(ACCESS_EXCLUSIVE, None, 'attaches an existing index')
+        fix = None
+        open_paren = words.index('(', k) if '(' in words[k:] else None
+        if single and name and open_paren is not None and words[-1] == ')':
+            columns = _text(sql, tokens[open_paren + 1:-1])
+            constraint = 'PRIMARY KEY' if kind == 'PRIMARY' else 'UNIQUE'
+            fix = Fix('', (f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns});',),
+                      (f'ALTER TABLE {table} ADD CONSTRAINT {name} {constraint} USING INDEX {name};',))
+        return Classification(ACCESS_EXCLUSIVE, 'index build', 'builds its index under the lock: '
+                              'CREATE UNIQUE INDEX CONCURRENTLY, then ADD CONSTRAINT ... USING INDEX', fix)
+    if kind == 'EXCLUDE':
+        return Classification(ACCESS_EXCLUSIVE, 'index build', 'builds its index under the lock')
+    return Classification(ACCESS_EXCLUSIVE)
+
+
+def _alter_column(table, tokens, single, validated):
+    words = _words(tokens)
+    j = 2 if words[1:2] == ['COLUMN'] else 1
+    column = tokens[j].text
+    rest = words[j + 1:]
+    if 'TYPE' in rest[:3]:
+        return Classification(ACCESS_EXCLUSIVE, 'rewrite', 'rewrites the table and its indexes unless the new type '
+                              'is binary-coercible (e.g. varchar(n) to text)')
+    if rest[:3] == ['SET', 'NOT', 'NULL']:
+        check = f'{table}_{unquote_ident(column)}_not_null'[:63]
+        if (table, check) in validated:
+            return Classification(ACCESS_EXCLUSIVE, None, f'skips the scan: {check} is validated')
+        fix = None
+        if single:
+            fix = Fix(f'ALTER TABLE {table} ADD CONSTRAINT {check} CHECK ({column} IS NOT NULL) NOT VALID;', (), (
+                f'ALTER TABLE {table} VALIDATE CONSTRAINT {check};',
+                f'ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL;',
+                f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check};',
+            ))
+        return Classification(ACCESS_EXCLUSIVE, 'scan', 'checks every row under the lock: validate a '
+                              'CHECK (... IS NOT NULL) NOT VALID first, then SET NOT NULL skips the scan', fix)
+    if rest[:1] == ['SET'] and rest[1:2] in (['STATISTICS'], ['STORAGE']):
+        return Classification(SHARE_UPDATE_EXCLUSIVE)
+    return Classification(ACCESS_EXCLUSIVE)
+
+
+def classify_alter_table(sql, tokens, validated):
+    """(table, Classification) of an ALTER TABLE statement.
+
+    validated holds the (table, constraint) pairs VALIDATE CONSTRAINT has
+    run for, so SET NOT NULL after a validated IS NOT NULL check is not
+    reported as a scan.
+    """
+    table, actions = alter_table_actions(tokens)
+    single = len(actions) == 1
+    classifications = []
+    for action in actions:
+        words = _words(action[:4])
+        if words[:1] == ['ADD']:
+            j = 2 if words[1:2] == ['COLUMN'] else 1
+            if j == 1 and words[1:2] and words[1] in ('CONSTRAINT', 'CHECK', 'FOREIGN', 'UNIQUE', 'PRIMARY', 'EXCLUDE'):
+                classifications.append(_add_constraint(sql, table, action, single))
+                continue
+            if _words(action[j:j + 3]) == ['IF', 'NOT', 'EXISTS']:
+                j += 3
+            classifications.append(_add_column(table, action[j:]))
+        elif words[:1] == ['ALTER'] and words[1:2] != ['CONSTRAINT']:
+            classifications.append(_alter_column(table, action, single, validated))
+        elif words[:2] == ['VALIDATE', 'CONSTRAINT']:
+            validated.add((table, action[2].text))
+            classifications.append(Classification(SHARE_UPDATE_EXCLUSIVE, 'scan'))
+        else:
+            classifications.append(Classification(ACCESS_EXCLUSIVE))
+    if not classifications:
+        return table, Classification(ACCESS_EXCLUSIVE)
+    if single:
+        return table, classifications[0]
+    return table, _strongest(classifications)
+
+
+def classify_create_index(sql, tokens):
+    words = _words(tokens)
+    on = words.index('ON') if 'ON' in words else None
+    if on is None:
+        return None, None
+    i = on + 2 if words[on + 1:on + 2] == ['ONLY'] else on + 1
+    table = _name_after(tokens, i)
+    if 'CONCURRENTLY' in words[:on]:
+        return table, Classification(SHARE_UPDATE_EXCLUSIVE, 'index build')
+    fix = None
+    named = words[on - 1] not in ('INDEX', 'CONCURRENTLY', 'EXISTS')
+    if named:
+        text = re.sub(r'\A(CREATE\s+(?:UNIQUE\s+)?INDEX)\s+(?!IF\s)', r'\1 IF NOT EXISTS ', _statement(sql), flags=re.I)
+        text = re.sub(r'\A(CREATE\s+(?:UNIQUE\s+)?INDEX)\s+', r'\1 CONCURRENTLY ', text, flags=re.I)
+        fix = Fix('', (text,))
+    return table, Classification(SHARE, 'index build', 'builds the index under the lock: '
+                                 'CREATE INDEX CONCURRENTLY in a migration of its own', fix)
+
+
+def classify(stmt, schema, validated):
+    """(table, Classification) for a table DDL statement, or (None, None)"""
+    head = stmt.head
+    if head[:2] == ('ALTER', 'TABLE'):
+        return classify_alter_table(stmt.text, significant_tokens(stmt.text), validated)
+    if head[:1] == ('CREATE',) and 'INDEX' in head[1:3]:
+        table, c = classify_create_index(stmt.text, significant_tokens(stmt.text))
+        parent = schema.tables.get(table)
+        if c is not None and c.fix and parent is not None and parent.partition_by:
+            # A partitioned table cannot be indexed concurrently as a whole
+            c = c._replace(advice='builds the index on every partition under the lock: CREATE INDEX ON ONLY the '
+                                  'parent, CONCURRENTLY on each partition, then ALTER INDEX ... ATTACH PARTITION',
+                           fix=None)
+        return table, c
+    if head[:2] == ('DROP', 'INDEX'):
+        tokens = significant_tokens(stmt.text)
+        words = _words(tokens)
+        if 'CONCURRENTLY' in words:
+            return None, None
+        i = 4 if words[2:4] == ['IF', 'EXISTS'] else 2
+        index = schema.indexes.get(_name_after(tokens, i))
+        fix = None
+        if ',' not in words and words[-1:] == [';']:
+            fix = Fix('', (f'DROP INDEX CONCURRENTLY IF EXISTS {_text(stmt.text, tokens[i:-1])};',))
+        return (index.table if index else None), Classification(
+            ACCESS_EXCLUSIVE, None, 'queues behind every running query on the table: DROP INDEX CONCURRENTLY', fix)
+    if head[:2] == ('DROP', 'TABLE'):
+        tokens = significant_tokens(stmt.text)
+        i = 4 if _words(tokens[2:4]) == ['IF', 'EXISTS'] else 2
+        return _name_after(tokens, i), Classification(ACCESS_EXCLUSIVE)
+    if head[:2] == ('CREATE', 'TRIGGER') or head[:4] == ('CREATE', 'OR', 'REPLACE', 'TRIGGER'):
+        signature = trigger_signature(stmt)
+        return (normalize_name(signature[1]) if signature else None), Classification(SHARE_ROW_EXCLUSIVE)
+    if head[:2] == ('CREATE', 'POLICY'):
+        signature = policy_signature(stmt)
+        return (normalize_name(signature[1]) if signature else None), Classification(ACCESS_EXCLUSIVE)
+    if head[:1] in (('DROP',), ('ALTER',)) and head[1:2] in (('POLICY',), ('TRIGGER',)) and 'ON' in head:
+        tokens = significant_tokens(stmt.text)
+        on = _words(tokens).index('ON')
+        return _name_after(tokens, on + 1), Classification(ACCESS_EXCLUSIVE)
+    return None, None
+
+
+def _top_level_ddl(sql):
+    """Yield (Statement, line, top_level) for every statement that runs at migration time"""
+    for stmt in split_statements(sql):
+        if stmt.kind in ('trivia', 'function'):
+            continue
+        if stmt.kind == 'do' or stmt.head[:1] in (('BEGIN',), ('IF',), ('ELSE',), ('ELSIF',)):
+            for inner, line in iter_ddl(stmt.text, stmt.line):
+                yield inner, line, False
+        else:
+            yield stmt, stmt.line, True
+
+
+def analyze(migration_dir=MIGRATION_DIR, files=None):
+    """{file: [Finding]} for every table DDL statement on a table that already existed.
+
+    Every migration is replayed for context; only files (default: all of
+    them) are reported.
+    """
+    schema = Schema()
+    validated = set()
+    report = set(files) if files is not None else None
+    results = {}
+    for file_path in find_migrations(migration_dir):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            sql = f.read()
+        # By identity: a table renamed away and created again under its name is new
+        existing = {id(t) for t in schema.tables.values()}
+        findings = []
+        for stmt, line, top_level in _top_level_ddl(sql):
+            table, c = classify(stmt, schema, validated)
+            new_table = table is not None and table in schema.tables and id(schema.tables[table]) not in existing
+            if c is not None and not new_table:
+                statement = ' '.join(itertools.takewhile(STATEMENT_WORDS.__contains__, stmt.head))
+                findings.append(Finding(Source(file_path, line), table or '?', statement, c.lock, c.impact,
+                                        c.advice, c.fix if top_level else None, stmt.start if top_level else None))
+            apply_statement(schema, stmt, Source(file_path, line))
+        if report is None or file_path in report:
+            results[file_path] = findings
+    return results
+
+
+def is_blocking(finding):
+    """Blocks reads or writes for longer than a catalog update"""
+    return finding.lock != SHARE_UPDATE_EXCLUSIVE and finding.impact is not None
+
+
+def estimate_seconds(finding, row_counts):
+    rows = (row_counts or {}).get(finding.table)
+    if rows is None or finding.impact is None:
+        return None
+    return rows / THROUGHPUT[finding.impact]
+
+
+def format_finding(finding, row_counts=None):
+    mark = '✗' if is_blocking(finding) else '-'
+    impact = f', {finding.impact}' if finding.impact else ''
+    line = (f"  {mark} {finding.source.file}:{finding.source.line}: {finding.statement} on {finding.table}: "
+            f"{finding.lock} ({BLOCKS[finding.lock]}){impact}")
+    seconds = estimate_seconds(finding, row_counts)
+    if seconds is not None:
+        line += f", ~{row_counts[finding.table]:,} rows, ~{seconds:.1f}s"
+    lines = [line]
+    if finding.advice:
+        lines.append(f"      {finding.advice}")
+    if finding.fix:
+        for sql in finding.fix.concurrent + ((finding.fix.inline,) if finding.fix.inline else ()) + finding.fix.after:
+            lines.append(f"      -> {sql}")
+    return '\n'.join(lines)
+
+
+def _version(file_path):
+    match = re.match(r'(\d+)_(.*)\.sql\Z', os.path.basename(file_path))
+    return (match.group(1), match.group(2)) if match else (None, None)
+
+
+def _index_user(stmt, table, index, unique):
+    """True if a statement needs the index being built to exist already.
+
+    It does if it names the index (USING INDEX, ON CONFLICT ON CONSTRAINT,
+    ALTER INDEX, ...), or, for a unique index, if it is an INSERT ... ON
+    CONFLICT into the table or a REFERENCES to it, which need a unique index
+    to infer or point at.
+    """
+    tokens = significant_tokens(stmt.text)
+    if any(tok.kind in ('word', 'quoted_ident') and normalize_name(unquote_ident(tok.text)) == index for tok in tokens):
+        return True
+    if not unique:
+        return False
+    words = _words(tokens)
+    if words[:2] == ['INSERT', 'INTO'] and 'CONFLICT' in words and _name_after(tokens, 2) == table:
+        return True
+    return any(word == 'REFERENCES' and i + 1 < len(tokens) and _name_after(tokens, i + 1) == table
+               for i, word in enumerate(words))
+
+
+def held_back(sql, findings):
+    """[(Finding, line)] for fixes that would move an index build out from under a later statement.
+
+    line is that of the first later statement in the file that needs the
+    index. --fix leaves these findings as they are.
+    """
+    held = []
+    for finding in findings:
+        if finding.fix is None or finding.start is None or not finding.fix.concurrent:
+            continue
+        tokens = significant_tokens(finding.fix.concurrent[0])
+        words = _words(tokens)
+        index = normalize_name(unquote_ident(tokens[words.index('ON') - 1].text))
+        unique = 'UNIQUE' in words[:words.index('ON')]
+        later = ((stmt, top.line + line - 1) for top in split_statements(sql)
+                 if top.kind != 'trivia' and top.start > finding.start for stmt, line in iter_ddl(top.text))
+        line = next((line for stmt, line in later if _index_user(stmt, finding.table, index, unique)), None)
+        if line is not None:
+            held.append((finding, line))
+    return held
+
+
+def plan_fix(file_path, sql, findings, later_versions):
+    """(new sql, [(path, sql)] of follow-up migrations), or None if no finding has a fix.
+
+    Raises ValueError if the file name has no version or the follow-ups
+    would collide with a later migration.
+    """
+    fixes = {f.start: f.fix for f in findings if f.fix is not None and f.start is not None}
+    if not fixes:
+        return None
+    version, name = _version(file_path)
+    if version is None:
+        raise ValueError("file name does not start with a migration version (<digits>_<name>.sql)")
+    concurrent = [sql for fix in fixes.values() for sql in fix.concurrent]
+    after = [sql for fix in fixes.values() for sql in fix.after]
+    needed = len(concurrent) + (1 if after else 0)
+    taken = sorted(v for v in later_versions if int(version) < int(v) <= int(version) + needed)
+    if taken:
+        raise ValueError(f"no free migration versions after it for the {needed} split-out migration(s): "
+                         f"{', '.join(taken)} already taken")
+
+    out = []
+    for stmt in split_statements(sql):
+        fix = fixes.get(stmt.start) if stmt.kind != 'trivia' else None
+        out.append(stmt if fix is None or fix.inline is None else fix.inline)
+
+    directory = os.path.dirname(file_path)
+    basename = os.path.basename(file_path)
+    follow_ups = []
+    for n, statement in enumerate(concurrent, 1):
+        path = os.path.join(directory, f'{int(version) + n:0{len(version)}d}_{name}_concurrently_{n}.sql')
+        note = ("-- so this migration holds this one statement. If it fails, drop the INVALID index it leaves\n"
+                "-- behind before re-running.\n" if statement.upper().startswith('CREATE')
+                else "-- so this migration holds this one statement.\n")
+        follow_ups.append((path, (
+            f"-- Split out of {basename} by lock_analyzer.py. CONCURRENTLY cannot run inside a transaction,\n"
+            f"{note}{statement}\n")))
+    if after:
+        path = os.path.join(directory, f'{int(version) + needed:0{len(version)}d}_{name}_validate.sql')
+        body = '\n'.join(after)
+        follow_ups.append((path, (
+            f"-- Deferred from {basename} by lock_analyzer.py, so the scans below run in their own\n"
+            f"-- transaction instead of under the locks taken there.\n{body}\n")))
+    return join_segments(out), follow_ups
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify migration statements by the locks they take on live tables.")
+    parser.add_argument('files', nargs='*', help="migrations to analyze (default: every *.sql in --dir)")
+    parser.add_argument('--dir', default=MIGRATION_DIR, help=f"migration directory (default: {MIGRATION_DIR})")
+    parser.add_argument('--row-counts', help="JSON file of {table: rows} to estimate how long locks are held")
+    parser.add_argument('--all', action='store_true', help="also list statements that only lock briefly")
+    parser.add_argument('--fix', action='store_true', help="rewrite blocking statements into their safe forms")
+    parser.add_argument('--check', action='store_true', help="exit 1 if any statement blocks reads or writes")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.dir):
+        print(f"Migration directory {args.dir} not found!")
+        return 1
+    row_counts = None
+    if args.row_counts:
+        with open(args.row_counts, 'r', encoding='utf-8') as f:
+            row_counts = json.load(f)
+
+    files = [os.path.normpath(p) for p in args.files] or None
+    results = analyze(args.dir, files and [p for p in find_migrations(args.dir) if os.path.normpath(p) in files])
+    blocking = 0
+    total = 0
+    for file_path, findings in results.items():
+        total += len(findings)
+        for finding in findings:
+            if is_blocking(finding):
+                blocking += 1
+            if is_blocking(finding) or args.all:
+                print(format_finding(finding, row_counts))
+    print(f"\n{total} statements on existing tables, {blocking} block reads or writes while they scan, "
+          f"build or rewrite.")
+
+    if args.fix:
+        for file_path, findings in results.items():
+            with open(file_path, 'r', encoding='utf-8') as f:
+                sql = f.read()
+            # Every version in the directory, including follow-ups written for earlier files
+            later = [v for v in (_version(p)[0] for p in os.listdir(os.path.dirname(file_path) or '.')) if v]
+            # Only what was reported above as blocking gets rewritten
+            blocking_findings = [f for f in findings if is_blocking(f)]
+            held = held_back(sql, blocking_findings)
+            for finding, line in held:
+                print(f"  - {finding.source.file}:{finding.source.line}: {finding.statement} on {finding.table} "
+                      f"left as is: the statement at line {line} needs its index")
+            held = {finding for finding, _ in held}
+            try:
+                plan = plan_fix(file_path, sql, [f for f in blocking_findings if f not in held], later)
+            except ValueError as e:
+                print(f"  ✗ {file_path}: {e}")
+                continue
+            if plan is None:
+                continue
+            new_sql, follow_ups = plan
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(new_sql)
+            print(f"  ✓ Rewrote {file_path}")
+            for path, content in follow_ups:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                print(f"  ✓ Wrote {path}")
+    return 1 if args.check and blocking else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,32 +3,61 @@ import os
 import re
 import glob
 
+from sql_lexer import join_segments, split_statements, trigger_signature
+
+def add_if_not_exists(stmt):
+    """CREATE TABLE/INDEX text with IF NOT EXISTS added, or None if not applicable"""
+    if stmt.starts_with('CREATE', 'TABLE') and not stmt.starts_with('CREATE', 'TABLE', 'IF'):
+        return re.sub(r'\ACREATE TABLE ', 'CREATE TABLE IF NOT EXISTS ', stmt.text)
+    if stmt.starts_with('CREATE', 'INDEX') and not stmt.starts_with('CREATE', 'INDEX', 'IF'):
+        return re.sub(r'\ACREATE INDEX ', 'CREATE INDEX IF NOT EXISTS ', stmt.text)
+    return None
+
+def guard_trigger(stmt, previous):
+    """Prefix CREATE TRIGGER with DROP TRIGGER IF EXISTS unless previous already drops it"""
+    if not stmt.starts_with('CREATE', 'TRIGGER'):
+        return None
+    signature = trigger_signature(stmt)
+    if not signature or (previous is not None and previous.starts_with('DROP', 'TRIGGER')
+                         and trigger_signature(previous) == signature):
+        return None
+    trigger_name, table_name = signature
+    return f'DROP TRIGGER IF EXISTS {trigger_name} ON {table_name};\n{stmt.text}'
+
+def guard_policy(stmt):
+    """Wrap a top-level CREATE POLICY in a pg_policies-guarded DO block"""
+    if not stmt.starts_with('CREATE', 'POLICY'):
+        return None
+    match = re.match(r'CREATE POLICY "([^"]+)" ON (\w+)([\s\S]*?);\Z', stmt.text)
+    if not match:
+        return None
+    policy_name, table_name, rest = match.groups()
+    literal = policy_name.replace("'", "''")
+    return f'''DO $$\nBEGIN\n  IF NOT EXISTS (SELECT 1 FROM pg_policies WHERE schemaname = 'public' AND tablename = '{table_name}' AND policyname = '{literal}') THEN\n    CREATE POLICY "{policy_name}" ON {table_name} {rest.strip()};\n  END IF;\nEND $$;'''
+
+def guard_add_column(stmt):
+    """Wrap ALTER TABLE ... ADD COLUMN in an information_schema-guarded DO block"""
+    if stmt.head[:1] != ('ALTER',) or stmt.head[3:5] != ('ADD', 'COLUMN') or stmt.head[5:6] == ('IF',):
+        return None
+    match = re.match(r'ALTER TABLE (\w+) ADD COLUMN (\w+) ([\s\S]+);\Z', stmt.text)
+    if not match:
+        return None
+    table, col, rest = match.groups()
+    return f'''DO $$\nBEGIN\n  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = '{table}' AND column_name = '{col}') THEN\n    ALTER TABLE {table} ADD COLUMN {col} {rest};\n  END IF;\nEND $$;'''
+
 def make_idempotent_sql(sql):
-    # CREATE TABLE
-    sql = re.sub(r'CREATE TABLE (?!IF NOT EXISTS)', 'CREATE TABLE IF NOT EXISTS', sql)
-    # CREATE INDEX
-    sql = re.sub(r'CREATE INDEX (?!IF NOT EXISTS)', 'CREATE INDEX IF NOT EXISTS', sql)
-    # CREATE TRIGGER
-    def trigger_repl(match):
-        trigger_name = match.group(1)
-        table_name = match.group(2)
-        return f'DROP TRIGGER IF EXISTS {trigger_name} ON {table_name};\nCREATE TRIGGER {trigger_name} ON {table_name}'
-    sql = re.sub(r'CREATE TRIGGER (\w+)\s+ON\s+(\w+)', trigger_repl, sql)
-    # CREATE POLICY
-    def policy_repl(match):
-        policy_name = match.group(1)
-        table_name = match.group(2)
-        rest = match.group(3)
-        return f'''DO $$\nBEGIN\n  IF NOT EXISTS (SELECT 1 FROM pg_policies WHERE polname = '{policy_name}' AND tablename = '{table_name}') THEN\n    CREATE POLICY "{policy_name}" ON {table_name} {rest};\n  END IF;\nEND $$;'''
-    sql = re.sub(r'CREATE POLICY "([^"]+)" ON (\w+)([\s\S]*?);', policy_repl, sql)
-    # ALTER TABLE ... ADD COLUMN
-    def add_column_repl(match):
-        table = match.group(1)
-        col = match.group(2)
-        rest = match.group(3)
-        return f'''DO $$\nBEGIN\n  IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = '{table}' AND column_name = '{col}') THEN\n    ALTER TABLE {table} ADD COLUMN {col} {rest};\n  END IF;\nEND $$;'''
-    sql = re.sub(r'ALTER TABLE (\w+) ADD COLUMN (\w+) ([^;]+);', add_column_repl, sql)
-    return sql
+    segments = []
+    previous = None
+    for stmt in split_statements(sql):
+        if stmt.kind == 'trivia':
+            segments.append(stmt)
+            continue
+        # CREATE TABLE / CREATE INDEX, CREATE TRIGGER, CREATE POLICY, ALTER TABLE ... ADD COLUMN
+        new = (add_if_not_exists(stmt) or guard_trigger(stmt, previous)
+               or guard_policy(stmt) or guard_add_column(stmt))
+        segments.append(stmt if new is None else new)
+        previous = stmt
+    return join_segments(segments)
 
 def main():
     migrations_dir = 'supabase/migrations'
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""Run the migration fixers as ordered in-memory passes over each file.
+
+Every migration is read once, the selected passes run one after another on
+its text, and the file is written back once - only if the bytes changed.
+"""
+import io
+import os
+import sys
+import ast
+import glob
+import json
+import time
+import signal
+import hashlib
+import argparse
+import threading
+import contextlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import batch_add_columns
+import cleanup_duplicates
+import file_watch
+import fix_column_references
+import fix_duplicate_end_if
+import fix_end_if
+import fix_migrations
+import fix_migrations_properly
+import fix_missing_begin
+import fix_policy_mapping
+import fix_policy_name_mismatch
+import fix_policyname_to_createpolicy
+import final_function_fix
+import final_nuclear_cleanup
+import make_migrations_idempotent
+import nuclear_cleanup
+import nuclear_migration_fix
+import pass_profile
+import restore_rls_policies
+import rls_initplan
+import trigger_audit
+import ultimate_migration_fixer
+import validate_migrations
+
+MIGRATION_DIR = "supabase/migrations"
+CACHE_FILE = ".migration_fixer_cache.json"
+
+# Bump when the cache layout changes
+CACHE_FORMAT = 1
+
+# Seconds a single pass may spend on one file before it is aborted
+PASS_BUDGET = 30.0
+
+# Seconds --watch waits for a burst of saves to settle before it runs
+DEBOUNCE = 0.3
+
+# Bump a pass's version when its output changes without its module changing
+Pass = namedtuple('Pass', 'name transform default version', defaults=(1,))
+
+# Passes always run in this order; --passes only selects which of them run
+PASSES = [
+    Pass('fix_create_table', ultimate_migration_fixer.fix_create_table, True),
+    Pass('wrap_orphaned_if_not_exists', ultimate_migration_fixer.wrap_orphaned_if_not_exists, True),
+    Pass('cleanup_duplicates', cleanup_duplicates.cleanup_migration_sql, False),
+    Pass('fix_missing_begin', fix_missing_begin.add_missing_begin, True),
+    Pass('fix_functions_and_triggers', ultimate_migration_fixer.fix_functions_and_triggers, True),
+    Pass('fix_update_function', final_function_fix.add_missing_function_end, True),
+    Pass('fix_end_if', fix_end_if.fix_end_if_sql, True),
+    Pass('fix_duplicate_end_if', fix_duplicate_end_if.fix_duplicate_end_if_sql, True),
+    Pass('final_nuclear_cleanup', final_nuclear_cleanup.final_nuclear_cleanup_sql, False),
+    Pass('make_idempotent_sql', make_migrations_idempotent.make_idempotent_sql, True),
+    Pass('fix_migrations_properly', fix_migrations_properly.fix_migration_sql, False),
+    # After the passes that guard each ADD COLUMN on its own
+    Pass('batch_add_columns', batch_add_columns.batch_add_columns_sql, True),
+    Pass('add_drop_statements', fix_migrations.add_drop_statements, False),
+    Pass('fix_triggers', ultimate_migration_fixer.fix_triggers, True),
+    Pass('guard_update_triggers', trigger_audit.guard_update_triggers_sql, True),
+    Pass('nuclear_cleanup', nuclear_cleanup.nuclear_cleanup_sql, False),
+    Pass('nuclear_migration_fix', nuclear_migration_fix.nuclear_fix_sql, False),
+    Pass('restore_rls_policies', restore_rls_policies.restore_rls_policies_sql, False),
+    Pass('fix_column_references', fix_column_references.fix_column_references_sql, False),
+    Pass('fix_policy_mapping', fix_policy_mapping.apply_policy_mapping, False),
+    Pass('fix_policy_name_mismatch', fix_policy_name_mismatch.fix_policy_name_mismatch_sql, False),
+    Pass('fix_policyname_to_createpolicy', fix_policyname_to_createpolicy.match_policyname_to_createpolicy, True),
+    Pass('rls_initplan', rls_initplan.rls_initplan_sql, True),
+    Pass('fix_semicolons_and_spaces', ultimate_migration_fixer.fix_semicolons_and_spaces, False),
+]
+
+PASSES_BY_NAME = {p.name: p for p in PASSES}
+
+
+def select_passes(names=None):
+    """Passes to run, in registry order. None selects the default pipeline."""
+    if names is None:
+        return [p for p in PASSES if p.default]
+    unknown = [name for name in names if name not in PASSES_BY_NAME]
+    if unknown:
+        raise ValueError(f"Unknown pass(es): {', '.join(unknown)}")
+    wanted = set(names)
+    return [p for p in PASSES if p.name in wanted]
+
+
+def module_path(name):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), f'{name}.py')
+
+
+def local_imports(name, seen=None):
+    """Module name plus every module of this repository it imports, directly or through another"""
+    seen = set() if seen is None else seen
+    path = module_path(name)
+    if name in seen or not os.path.exists(path):
+        return seen
+    seen.add(name)
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                local_imports(alias.name, seen)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            local_imports(node.module, seen)
+    return seen
+
+
+def pipeline_version(passes):
+    """Fingerprint of the selected passes: names, versions and the code behind them"""
+    digest = hashlib.sha256()
+    modules = set()
+    for p in passes:
+        digest.update(f'{p.name}:{p.version}\n'.encode('utf-8'))
+        local_imports(p.transform.__module__, modules)
+    for name in sorted(modules):
+        with open(module_path(name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def load_cache(cache_path):
+    """{path: {'sha256': ..., 'passes': ...}} from the manifest, or {} if unusable"""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('format') != CACHE_FORMAT:
+        return {}
+    return cache.get('files', {})
+
+
+def save_cache(cache_path, files):
+    tmp_path = f'{cache_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'format': CACHE_FORMAT, 'files': files}, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, cache_path)
+
+
+def cache_key(file_path):
+    return os.path.relpath(os.path.abspath(file_path)).replace(os.sep, '/')
+
+
+class PassTimeout(Exception):
+    """A pass ran past its time budget on one migration"""
+
+    def __init__(self, pass_name, budget):
+        super().__init__(f"pass {pass_name} exceeded its {budget:g}s budget")
+        self.pass_name = pass_name
+        self.budget = budget
+
+
+@contextlib.contextmanager
+def pass_budget(pass_name, budget):
+    """Raise PassTimeout inside the block once budget seconds have passed.
+
+    Uses SIGALRM, so the budget is only enforced in the main thread on
+    platforms that have setitimer; elsewhere (and with a falsy budget) the
+    block just runs.
+    """
+    if not budget or not hasattr(signal, 'setitimer') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expired(signum, frame):
+        raise PassTimeout(pass_name, budget)
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, budget)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def run_passes(content, passes, budget=None, recorder=None):
+    """Run passes over one migration's text and return the result.
+
+    With a budget, each pass is aborted with PassTimeout after that many
+    seconds. With a pass_profile.Recorder, each pass is measured into it.
+    """
+    for p in passes:
+        with pass_budget(p.name, budget):
+            content = p.transform(content) if recorder is None else recorder.run(p.name, p.transform, content)
+    return content
+
+
+def fix_file(file_path, passes, check=False, original=None, budget=None, recorder=None):
+    """Load a migration once, run every pass in memory and write it once if it changed.
+
+    original is the file's bytes if the caller already read them. Returns
+    (changed, sha256 of the file as it is left on disk). A PassTimeout
+    propagates before anything is written, so the file is left as it was.
+    """
+    if original is None:
+        with open(file_path, 'rb') as f:
+            original = f.read()
+    fixed = run_passes(original.decode('utf-8'), passes, budget, recorder).encode('utf-8')
+    if fixed == original:
+        return False, hashlib.sha256(original).hexdigest()
+    if check:
+        return True, hashlib.sha256(original).hexdigest()
+    with open(file_path, 'wb') as f:
+        f.write(fixed)
+    return True, hashlib.sha256(fixed).hexdigest()
+
+
+# profile is the pass_profile.Recorder of a profiled run
+FileResult = namedtuple('FileResult', 'file_path status digest log profile', defaults=(None,))
+
+
+def process_file(file_path, pass_names, version, entry=None, check=False, budget=None, profile=False):
+    """Per-file unit of work, safe to run in a worker process.
+
+    Passes are looked up by name so only strings cross the process boundary.
+    Anything the passes print is captured and handed back in the result, so
+    the parent can report it in file order. status is 'skipped', 'changed',
+    'unchanged' or 'timeout'.
+    """
+    with open(file_path, 'rb') as f:
+        original = f.read()
+    digest = hashlib.sha256(original).hexdigest()
+    # Files that were already run through this exact pipeline and not touched since
+    if entry and entry.get('passes') == version and entry.get('sha256') == digest:
+        return FileResult(file_path, 'skipped', digest, '')
+    log = io.StringIO()
+    recorder = pass_profile.Recorder(file_path) if profile else None
+    try:
+        with contextlib.redirect_stdout(log):
+            was_changed, digest = fix_file(file_path, select_passes(pass_names), check=check,
+                                           original=original, budget=budget, recorder=recorder)
+    except PassTimeout as e:
+        return FileResult(file_path, 'timeout', digest, f"{log.getvalue()}  ✗ {e}; {file_path} left unchanged\n",
+                          recorder)
+    return FileResult(file_path, 'changed' if was_changed else 'unchanged', digest, log.getvalue(), recorder)
+
+
+def process_files(migration_files, pass_names, version, cache, check=False, jobs=1, budget=None, profile=False):
+    """Yield a FileResult per file, in the order of migration_files.
+
+    With jobs > 1 the files are spread over a process pool; each file is
+    still read and written by exactly one worker, so the output does not
+    depend on scheduling.
+    """
+    entries = [cache.get(cache_key(file_path)) for file_path in migration_files]
+    if jobs <= 1 or len(migration_files) < 2:
+        for file_path, entry in zip(migration_files, entries):
+            yield process_file(file_path, pass_names, version, entry, check, budget, profile)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        n = len(migration_files)
+        chunksize = max(1, n // (jobs * 4))
+        yield from pool.map(process_file, migration_files, [pass_names] * n, [version] * n,
+                            entries, [check] * n, [budget] * n, [profile] * n, chunksize=chunksize)
+
+
+def find_migrations(migration_dir, files=None):
+    """Migration files to process, in chronological order"""
+    if files:
+        return sorted(files)
+    return sorted(glob.glob(os.path.join(migration_dir, "*.sql")))
+
+
+def report_results(results, cache, version, check=False):
+    """Print each FileResult and record it in cache; returns (changed, skipped, timed out) counts"""
+    changed = skipped = timed_out = 0
+    for result in results:
+        key = cache_key(result.file_path)
+        if result.status == 'skipped':
+            skipped += 1
+            continue
+        if result.log:
+            print(result.log, end='')
+        if result.status == 'timeout':
+            timed_out += 1
+            cache.pop(key, None)
+            continue
+        if result.status == 'changed':
+            changed += 1
+            print(f"  {'Would fix' if check else '✓ Fixed'} {result.file_path}")
+        else:
+            print(f"  - No changes needed for {result.file_path}")
+        if result.status == 'changed' and check:
+            cache.pop(key, None)
+        else:
+            cache[key] = {'sha256': result.digest, 'passes': version}
+    return changed, skipped, timed_out
+
+
+def own_write(file_path, cache):
+    """True if file_path holds exactly the bytes the last run left there, e.g. after its own write"""
+    entry = cache.get(cache_key(file_path))
+    if not entry:
+        return False
+    try:
+        with open(file_path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest() == entry['sha256']
+    except OSError:
+        return False
+
+
+def watch(args, migration_files, pass_names, version, cache, jobs):
+    """Re-run the passes on every migration file that is created or saved, until interrupted"""
+    wanted = {os.path.abspath(f) for f in migration_files} if args.files else None
+    directories = {os.path.dirname(os.path.abspath(f)) for f in migration_files} if args.files else {args.dir}
+    if len(directories) != 1:
+        print("--watch needs the migration files to be in one directory")
+        return 2
+    directory = directories.pop()
+    watcher = file_watch.open_watcher(directory, polling=args.poll)
+    print(f"Watching {directory} for changes ({watcher.kind}); Ctrl-C to stop")
+    try:
+        for batch in file_watch.debounced(watcher, args.debounce):
+            files = sorted(f for f in batch if os.path.isfile(f) and (wanted is None or os.path.abspath(f) in wanted))
+            # Our own writes come back as events too; their bytes match the cache entry we just made
+            files = [f for f in files if not own_write(f, cache)]
+            if not files:
+                continue
+            print(f"\n{time.strftime('%H:%M:%S')} {len(files)} changed: {', '.join(os.path.basename(f) for f in files)}")
+            results = process_files(files, pass_names, version, cache, check=args.check, jobs=jobs,
+                                    budget=args.pass_timeout)
+            report_results(results, cache, version, args.check)
+            for file_path in files:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    for diagnostic in validate_migrations.check_sql(f.read()):
+                        print(f"  ✗ {file_path}:{diagnostic.line}: {diagnostic.message}")
+            if not args.no_cache:
+                save_cache(args.cache, cache)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        watcher.close()
+    return 0
+
+
+def write_profile(prefix, recorders, wall, cprofile=False):
+    """Write the --profile reports for the files that ran and print the per-pass totals"""
+    records = [record for recorder in recorders for record in recorder.records]
+    if not records:
+        print("Nothing was profiled: every file was skipped (use --no-cache to profile them all).")
+        return
+    print("\nPer-pass totals:")
+    print(pass_profile.format_table(records))
+    pass_profile.write_json(f'{prefix}.json', records)
+    pass_profile.write_prometheus(f'{prefix}.prom', records, wall)
+    print(f"Wrote {prefix}.json and {prefix}.prom")
+    if cprofile:
+        worst = pass_profile.slowest(records)
+        recorder = next(r for r in recorders if r.file_path == worst.file and pass_profile.slowest(r.records) is worst)
+        print(f"\nSlowest pass: {worst.name} on {worst.file} ({worst.wall * 1000:.1f} ms)")
+        print(pass_profile.dump_cprofile(f'{prefix}.pstats', PASSES_BY_NAME[worst.name].transform,
+                                         recorder.slowest_input), end='')
+        print(f"Wrote {prefix}.pstats")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fix supabase migrations in a single read/write sweep.")
+    parser.add_argument('files', nargs='*', help="migration files to fix (default: every *.sql in --dir)")
+    parser.add_argument('--dir', default=MIGRATION_DIR, help=f"migration directory (default: {MIGRATION_DIR})")
+    parser.add_argument('--passes', help="comma-separated passes to run (default: the default pipeline)")
+    parser.add_argument('--all', action='store_true', help="run every registered pass")
+    parser.add_argument('--list', action='store_true', help="list the registered passes and exit")
+    parser.add_argument('--check', action='store_true', help="report files that would change without writing them")
+    parser.add_argument('--cache', default=CACHE_FILE, help=f"incremental-mode manifest (default: {CACHE_FILE})")
+    parser.add_argument('--no-cache', action='store_true', help="process every file, ignoring and not updating the manifest")
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="worker processes to spread files over (0 = one per CPU, default: 1)")
+    parser.add_argument('--pass-timeout', type=float, default=PASS_BUDGET,
+                        help=f"seconds one pass may spend on one file before it is aborted (0 = no limit, default: {PASS_BUDGET:g})")
+    parser.add_argument('--profile', nargs='?', const=pass_profile.PROFILE_PREFIX, metavar='PREFIX',
+                        help="measure every pass on every file and write PREFIX.json and PREFIX.prom "
+                             f"(default prefix: {pass_profile.PROFILE_PREFIX})")
+    parser.add_argument('--cprofile', action='store_true', help="with --profile, re-run the slowest pass under cProfile")
+    parser.add_argument('--watch', action='store_true', help="keep running and re-fix migration files as they are saved")
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE,
+                        help=f"seconds --watch waits for saves to settle (default: {DEBOUNCE:g})")
+    parser.add_argument('--poll', action='store_true', help="make --watch poll the directory instead of using inotify")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.list:
+        for p in PASSES:
+            print(f"{'*' if p.default else ' '} {p.name}")
+        print("\n* = part of the default pipeline")
+        return 0
+
+    try:
+        if args.all:
+            passes = list(PASSES)
+        else:
+            passes = select_passes(args.passes.split(',') if args.passes else None)
+    except ValueError as e:
+        print(e)
+        return 2
+
+    if not args.files and not os.path.exists(args.dir):
+        print(f"Migration directory {args.dir} not found!")
+        return 1
+
+    migration_files = find_migrations(args.dir, args.files)
+    print(f"Running {len(passes)} passes over {len(migration_files)} migration files")
+
+    cache = {} if args.no_cache else load_cache(args.cache)
+    version = pipeline_version(passes)
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    pass_names = [p.name for p in passes]
+
+    started = time.perf_counter()
+    recorders = []
+
+    def profiled(results):
+        for result in results:
+            if result.profile is not None:
+                recorders.append(result.profile)
+            yield result
+
+    results = process_files(migration_files, pass_names, version, cache, check=args.check, jobs=jobs,
+                            budget=args.pass_timeout, profile=bool(args.profile))
+    changed, skipped, timed_out = report_results(profiled(results), cache, version, args.check)
+    if args.profile:
+        write_profile(args.profile, recorders, time.perf_counter() - started, args.cprofile)
+
+    if not args.no_cache:
+        save_cache(args.cache, cache)
+
+    print(f"{changed} out of {len(migration_files)} migration files {'need fixing' if args.check else 'updated'}, "
+          f"{skipped} unchanged since the last run skipped.")
+    if args.watch:
+        return watch(args, migration_files, pass_names, version, cache, jobs)
+    if timed_out:
+        print(f"{timed_out} migration files aborted after a pass ran past --pass-timeout.")
+        return 1
+    return 1 if args.check and changed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
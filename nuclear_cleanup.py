@@ -3,36 +3,72 @@ import os
 import re
 import glob
 
+from sql_lexer import (closes_nested_do, iter_statements, join_segments, opens_nested_do, policy_signature,
+                       rewrite_statements, split_block, split_statements)
+
+def _policy_parts(stmt):
+    """(name, table, body) of a CREATE POLICY statement"""
+    signature = policy_signature(stmt)
+    if not signature or not stmt.starts_with('CREATE', 'POLICY'):
+        return None
+    match = re.match(r'CREATE POLICY\s+"[^"]+"\s+ON\s+[\w.]+', stmt.text)
+    if not match:
+        return None
+    return signature[0], signature[1], stmt.text[match.end():].rstrip(';')
+
 def extract_policies(sql):
     """Find all CREATE POLICY statements (even inside DO blocks)"""
-    policy_regex = re.compile(
-        r'CREATE POLICY\s+"([^"]+)"\s+ON\s+(\w+)([\s\S]*?);', re.MULTILINE)
-    return policy_regex.findall(sql)
+    policies = []
+    for stmt in iter_statements(sql):
+        inner = split_block(stmt.body) if stmt.kind == 'do' and stmt.body is not None else [stmt]
+        for piece in inner:
+            parts = _policy_parts(piece)
+            if parts:
+                policies.append(parts)
+    return policies
+
+def _is_policy_do_block(stmt):
+    if stmt.kind != 'do':
+        return False
+    return 'pg_policies' in stmt.text or 'CREATE POLICY' in stmt.text
 
 def remove_policy_do_blocks(sql):
     """Remove all DO blocks that reference pg_policies or CREATE POLICY"""
-    # Remove nested DO blocks first
-    sql = re.sub(
-        r'DO\s+\$\$.*?DO\s+\$\$.*?END\s+\$\$;.*?END\s+\$\$;',
-        '', sql, flags=re.DOTALL)
-    # Remove single DO blocks that reference pg_policies
-    sql = re.sub(
-        r'DO\s+\$\$.*?(pg_policies|CREATE POLICY)[\s\S]*?END\s+\$\$;',
-        '', sql, flags=re.DOTALL)
-    return sql
+    segments = []
+    in_nested = False
+    for stmt in split_statements(sql):
+        if in_nested:
+            # Remove nested DO blocks up to the END $$ that closes them
+            in_nested = not closes_nested_do(stmt)
+            continue
+        if opens_nested_do(stmt):
+            in_nested = True
+            continue
+        if not _is_policy_do_block(stmt):
+            segments.append(stmt)
+    return join_segments(segments)
 
 def remove_orphaned_policy_lines(sql):
     """Remove any orphaned DO/BEGIN/END lines that are left over from policy blocks"""
-    # Remove empty DO blocks
-    sql = re.sub(r'DO\s+\$\$\s*BEGIN\s*END\s+\$\$;', '', sql)
-    # Remove orphaned BEGIN/END statements
-    sql = re.sub(r'^\s*(BEGIN|END\s+\$\$;)\s*$', '', sql, flags=re.MULTILINE)
-    return sql
+    def drop_orphans(stmt):
+        if stmt.kind == 'trivia':
+            return None
+        # Remove empty DO blocks
+        if stmt.kind == 'do' and stmt.body is not None and re.fullmatch(r'\s*BEGIN\s*END\s*', stmt.body):
+            return ''
+        # Remove orphaned END statements (END $$; or END;) at the top level
+        if stmt.head[:1] == ('END',) and stmt.head[1:2] != ('IF',):
+            return ''
+        # Remove orphaned BEGIN lines glued to the next statement
+        if stmt.head[:1] == ('BEGIN',) and len(stmt.head) > 1 and stmt.head[1] != ';':
+            return re.sub(r'\ABEGIN\s*\n\s*', '', stmt.text)
+        return None
+    return rewrite_statements(sql, drop_orphans)
 
 def insert_clean_policies(sql, policies):
     """Remove all orphaned CREATE POLICY statements and insert clean ones"""
     # Remove all CREATE POLICY statements (they'll be re-added)
-    sql = re.sub(r'CREATE POLICY\s+"([^"]+)"\s+ON\s+(\w+)[\s\S]*?;', '', sql)
+    segments = [stmt for stmt in split_statements(sql) if not stmt.starts_with('CREATE', 'POLICY')]
     
     # Insert all policies with clean DO block structure
     policy_blocks = []
@@ -41,11 +77,11 @@ def insert_clean_policies(sql, policies):
         body = body.strip()
         if not body.startswith('\n'):
             body = '\n' + body
-        
+        literal = name.replace("'", "''")
         block = f'''DO $$
 BEGIN
   IF NOT EXISTS (
-    SELECT 1 FROM pg_policies WHERE polname = '{name}' AND tablename = '{table}'
+    SELECT 1 FROM pg_policies WHERE schemaname = 'public' AND tablename = '{table}' AND policyname = '{literal}'
   ) THEN
     CREATE POLICY "{name}" ON {table}{body};
   END IF;
@@ -55,25 +91,20 @@ END $$;'''
     # Add policies after the table creation but before other operations
     # Find a good insertion point (after CREATE TABLE statements)
     if policy_blocks:
-        # Insert after the last CREATE TABLE IF NOT EXISTS
-        table_pattern = r'(CREATE TABLE IF NOT EXISTS.*?;)(\s*\n)'
-        match = re.search(table_pattern, sql, re.DOTALL)
-        if match:
-            insert_point = match.end()
-            sql = sql[:insert_point] + '\n\n-- RLS Policies\n' + '\n\n'.join(policy_blocks) + '\n\n' + sql[insert_point:]
+        # Insert after the first CREATE TABLE IF NOT EXISTS
+        clean_policies = '\n\n-- RLS Policies\n' + '\n\n'.join(policy_blocks) + '\n\n'
+        for index, stmt in enumerate(segments):
+            if stmt.starts_with('CREATE', 'TABLE', 'IF', 'NOT', 'EXISTS'):
+                segments.insert(index + 1, clean_policies)
+                break
         else:
             # If no CREATE TABLE found, insert at the beginning
-            sql = '-- RLS Policies\n' + '\n\n'.join(policy_blocks) + '\n\n' + sql
+            segments.insert(0, clean_policies.lstrip())
     
-    return sql
+    return join_segments(segments)
 
-def fix_migration_file(file_path):
-    """Apply nuclear cleanup to a single migration file"""
-    print(f"Processing: {file_path}")
-    
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
+def nuclear_cleanup_sql(content):
+    """Re-create every policy in a clean DO block and drop the old policy blocks"""
     # Step 1: Extract all policies
     policies = extract_policies(content)
     print(f"    Found {len(policies)} policies")
@@ -85,7 +116,16 @@ def fix_migration_file(file_path):
     content = remove_orphaned_policy_lines(content)
     
     # Step 4: Insert clean policies
-    content = insert_clean_policies(content, policies)
+    return insert_clean_policies(content, policies)
+
+def fix_migration_file(file_path):
+    """Apply nuclear cleanup to a single migration file"""
+    print(f"Processing: {file_path}")
+    
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    content = nuclear_cleanup_sql(content)
     
     # Write back the cleaned file
     with open(file_path, 'w', encoding='utf-8') as f:
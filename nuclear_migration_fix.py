@@ -3,6 +3,65 @@ import os
 import re
 import glob
 
+import policy_catalog
+from sql_lexer import closes_nested_do, join_segments, opens_nested_do, significant_tokens, split_statements
+
+def simple_policies(table):
+    """Only the most essential policies, without DO blocks"""
+    return f"""
+-- Simple policies for {table}
+{policy_catalog.plain_policies(table)}"""
+
+def fix_function(stmt):
+    """FIX FUNCTIONS - ADD MISSING BEGIN"""
+    body = stmt.body
+    # If no BEGIN in body, add it
+    if body is None or any(tok.text.upper() == 'BEGIN' for tok in significant_tokens(body) if tok.kind == 'word'):
+        return stmt
+    return stmt.replace_body(f"\nBEGIN\n{body}\nEND;\n")
+
+def nuclear_fix_sql(content):
+    """Strip all DO blocks and rebuild policies with brute force simplicity, in one pass"""
+    segments = []
+    in_nested = False
+    orphaned_if = False
+    for stmt in split_statements(content):
+        if stmt.kind == 'trivia':
+            segments.append(stmt)
+            continue
+        # STEP 1: REMOVE ALL DO BLOCKS COMPLETELY
+        if in_nested:
+            in_nested = not closes_nested_do(stmt)
+            continue
+        if stmt.kind == 'do':
+            in_nested = opens_nested_do(stmt)
+            continue
+        # STEP 2: REMOVE ORPHANED BEGIN/END STATEMENTS
+        if stmt.head[:1] == ('END',):
+            orphaned_if = False
+            continue
+        if stmt.head[:1] == ('BEGIN',):
+            stmt = stmt._replace(text=re.sub(r'\ABEGIN\s*', '', stmt.text), head=stmt.head[1:])
+            if not stmt.head:
+                continue
+        # STEP 3: REMOVE ORPHANED IF NOT EXISTS ... THEN ... END IF;
+        if stmt.starts_with('IF', 'NOT', 'EXISTS') or orphaned_if:
+            orphaned_if = True
+            continue
+        # STEP 4: FIX FUNCTIONS - ADD MISSING BEGIN
+        if stmt.kind == 'function':
+            segments.append(fix_function(stmt))
+            continue
+        segments.append(stmt)
+        # STEP 6: ADD ESSENTIAL POLICIES BACK (SIMPLE VERSION) after RLS enable
+        if stmt.head[:2] == ('ALTER', 'TABLE') and stmt.head[3:8] == ('ENABLE', 'ROW', 'LEVEL', 'SECURITY', ';'):
+            table = significant_tokens(stmt.text, limit=3)[2].text
+            segments.append(stmt._replace(kind='trivia', text=simple_policies(table)))
+    
+    # STEP 5 / 7: CLEAN UP MULTIPLE EMPTY LINES
+    content = join_segments(segments, squeeze=True)
+    return content.strip() + '\n'
+
 def nuclear_fix_migration(file_path):
     """NUCLEAR OPTION: Strip all DO blocks and rebuild with brute force simplicity"""
     print(f"NUCLEAR FIXING {file_path}...")
@@ -10,80 +69,7 @@ def nuclear_fix_migration(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
     
-    # STEP 1: REMOVE ALL DO BLOCKS COMPLETELY
-    content = re.sub(r'DO \$\$.*?END \$\$;', '', content, flags=re.DOTALL)
-    
-    # STEP 2: REMOVE ORPHANED BEGIN/END STATEMENTS
-    content = re.sub(r'^\s*BEGIN\s*$', '', content, flags=re.MULTILINE)
-    content = re.sub(r'^\s*END\s*$', '', content, flags=re.MULTILINE)
-    content = re.sub(r'^\s*END IF;\s*$', '', content, flags=re.MULTILINE)
-    
-    # STEP 3: REMOVE ORPHANED IF NOT EXISTS
-    content = re.sub(r'^\s*IF NOT EXISTS.*?THEN\s*.*?END IF;', '', content, flags=re.MULTILINE | re.DOTALL)
-    
-    # STEP 4: FIX FUNCTIONS - ADD MISSING BEGIN
-    def fix_function(match):
-        func_header = match.group(1)
-        func_body = match.group(2)
-        func_end = match.group(3)
-        
-        # If no BEGIN in body, add it
-        if 'BEGIN' not in func_body.upper():
-            return f"{func_header}\nBEGIN\n{func_body}\nEND;\n{func_end}"
-        return match.group(0)
-    
-    content = re.sub(r'(CREATE OR REPLACE FUNCTION.*?RETURNS.*?\$\$)(.*?)(\$\$)', fix_function, content, flags=re.DOTALL)
-    
-    # STEP 5: CLEAN UP MULTIPLE EMPTY LINES
-    content = re.sub(r'\n\s*\n\s*\n', '\n\n', content)
-    
-    # STEP 6: ADD ESSENTIAL POLICIES BACK (SIMPLE VERSION)
-    # Only add the most essential policies without DO blocks
-    
-    # Find tables with RLS enabled
-    rls_tables = re.findall(r'ALTER TABLE (\w+) ENABLE ROW LEVEL SECURITY;', content)
-    
-    for table in rls_tables:
-        if table == 'notebooks':
-            # Add simple policies for notebooks
-            policies = f"""
--- Simple policies for {table}
-CREATE POLICY "Anyone can read {table}" ON {table} FOR SELECT USING (true);
-CREATE POLICY "Authenticated users can insert {table}" ON {table} FOR INSERT WITH CHECK (auth.role() = 'authenticated');
-CREATE POLICY "Authenticated users can update {table}" ON {table} FOR UPDATE USING (auth.role() = 'authenticated') WITH CHECK (auth.role() = 'authenticated');
-CREATE POLICY "Authenticated users can delete {table}" ON {table} FOR DELETE USING (auth.role() = 'authenticated');
-"""
-        elif table == 'profiles':
-            policies = f"""
--- Simple policies for {table}
-CREATE POLICY "Anyone can read {table}" ON {table} FOR SELECT USING (true);
-CREATE POLICY "Users can update their own {table}" ON {table} FOR UPDATE USING (auth.uid() = id) WITH CHECK (auth.uid() = id);
-CREATE POLICY "Users can insert their own {table}" ON {table} FOR INSERT WITH CHECK (auth.uid() = id);
-"""
-        elif table == 'saved_notebooks':
-            policies = f"""
--- Simple policies for {table}
-CREATE POLICY "Users can read their own {table}" ON {table} FOR SELECT USING (auth.uid() = user_id);
-CREATE POLICY "Users can insert their own {table}" ON {table} FOR INSERT WITH CHECK (auth.uid() = user_id);
-CREATE POLICY "Users can delete their own {table}" ON {table} FOR DELETE USING (auth.uid() = user_id);
-"""
-        else:
-            # Generic policies for other tables
-            policies = f"""
--- Simple policies for {table}
-CREATE POLICY "Anyone can read {table}" ON {table} FOR SELECT USING (true);
-CREATE POLICY "Authenticated users can insert {table}" ON {table} FOR INSERT WITH CHECK (auth.role() = 'authenticated');
-"""
-        
-        # Insert policies after RLS enable
-        rls_pos = content.find(f'ALTER TABLE {table} ENABLE ROW LEVEL SECURITY;')
-        if rls_pos != -1:
-            insert_pos = rls_pos + len(f'ALTER TABLE {table} ENABLE ROW LEVEL SECURITY;')
-            content = content[:insert_pos] + policies + content[insert_pos:]
-    
-    # STEP 7: FINAL CLEANUP
-    content = re.sub(r'\n\s*\n\s*\n', '\n\n', content)
-    content = content.strip() + '\n'
+    content = nuclear_fix_sql(content)
     
     with open(file_path, 'w', encoding='utf-8') as f:
         f.write(content)
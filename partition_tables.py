@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""Range-partition the append-only event and analytics tables by month.
+
+user_events, notebook_analytics and search_analytics only ever get rows
+appended, and old rows are only ever removed by retention. As monthly
+partitions of a parent partitioned by created_at, a range scan touches
+only the months it asks for and retention detaches and drops whole
+partitions instead of deleting rows.
+
+`create` writes the migration that sets the tables up: the parent with
+its primary key widened to include created_at (Postgres requires the
+partition key in every unique constraint), a partition per month from
+--start to --ahead months from now, the indexes declared on the parent so
+that Postgres builds them on every partition, present and future, and
+the standard RLS policies on the parent. A table the migrations already
+create is converted: its rows are copied into the new parent within the
+same migration. Partitions get RLS enabled without policies, so they can
+only be read through the parent.
+
+`roll` writes the migration that keeps it going: partitions for the next
+--ahead months, and the expired ones detached and dropped (or only
+detached with --detach-only, to archive them first). Run it monthly.
+"""
+import os
+import re
+import sys
+import copy
+import argparse
+from datetime import date, datetime, timezone
+from collections import namedtuple
+
+import policy_catalog
+from sql_schema import MIGRATION_DIR, Schema, apply_sql, index_name, load_schema, migration_path
+from squash_migrations import render_index, render_table
+
+PARTITION_KEY = 'created_at'
+
+# Months of partitions that exist ahead of the current one
+AHEAD = 3
+
+# Months of raw rows kept, besides the current month; a year keeps year-over-year comparisons possible
+RETAIN = 12
+
+# The tables and their shapes when the migrations do not create them yet
+DEFINITIONS = {
+    'user_events': """CREATE TABLE user_events (
+  id uuid NOT NULL DEFAULT gen_random_uuid(),
+  user_id uuid NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  event_type text NOT NULL,
+  event_data jsonb NOT NULL DEFAULT '{}'::jsonb,
+  notebook_id uuid,
+  created_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (id, created_at)
+);""",
+    'notebook_analytics': """CREATE TABLE notebook_analytics (
+  id uuid NOT NULL DEFAULT gen_random_uuid(),
+  notebook_id uuid NOT NULL REFERENCES notebooks(id) ON DELETE CASCADE,
+  user_id uuid REFERENCES auth.users(id) ON DELETE CASCADE,
+  event_type text NOT NULL,
+  metadata jsonb NOT NULL DEFAULT '{}'::jsonb,
+  created_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (id, created_at)
+);""",
+    'search_analytics': """CREATE TABLE search_analytics (
+  id uuid NOT NULL DEFAULT gen_random_uuid(),
+  query text NOT NULL,
+  user_id uuid REFERENCES auth.users(id) ON DELETE CASCADE,
+  category text,
+  results_count integer,
+  created_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (id, created_at)
+);""",
+}
+
+# Indexes declared on each parent; every one ends in the partition key so a range scan can use it
+INDEXES = {
+    'user_events': [('user_id', 'created_at'), ('event_type', 'created_at'), ('notebook_id', 'created_at')],
+    'notebook_analytics': [('notebook_id', 'created_at'), ('user_id', 'created_at')],
+    'search_analytics': [('user_id', 'created_at'), ('category', 'created_at')],
+}
+
+# One monthly partition: <table>_pYYYY_MM
+Partition = namedtuple('Partition', 'name table month')
+_PARTITION_NAME = re.compile(r'(\w+)_p(\d{4})_(\d{2})\Z')
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month.year:04d}_{month.month:02d}'
+
+
+def parse_partition_name(name):
+    """Partition for a <table>_pYYYY_MM name, or None"""
+    match = _PARTITION_NAME.match(name)
+    if not match:
+        return None
+    return Partition(name, match.group(1), date(int(match.group(2)), int(match.group(3)), 1))
+
+
+def render_partition(table, month):
+    """CREATE TABLE for one month's partition; the bounds are UTC midnights, whatever the session time zone"""
+    name = partition_name(table, month)
+    return (f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table}\n"
+            f"  FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{add_months(month, 1).isoformat()} 00:00:00+00');\n"
+            f"ALTER TABLE {name} ENABLE ROW LEVEL SECURITY;")
+
+
+def parent_table(table):
+    """Copy of a sql_schema Table as a parent partitioned by month: partition key NOT NULL and in the primary key"""
+    key = table.columns.get(PARTITION_KEY)
+    if key is None:
+        raise ValueError(f'{table.name} has no {PARTITION_KEY} column to partition by')
+    parent = copy.deepcopy(table)
+    parent.columns[PARTITION_KEY] = key._replace(not_null=True)
+    if parent.primary_key and PARTITION_KEY not in parent.primary_key:
+        parent.primary_key = tuple(parent.primary_key) + (PARTITION_KEY,)
+    # Unique constraints without the partition key cannot be enforced across partitions
+    dropped = [key for key in parent.uniques if PARTITION_KEY not in key]
+    parent.uniques = [key for key in parent.uniques if PARTITION_KEY in key]
+    parent.partition_by = f'RANGE ({PARTITION_KEY})'
+    parent.rls = True
+    return parent, dropped
+
+
+def render_create(table, schema, months):
+    """Migration section that creates (or converts) one partitioned table. Returns (sql, notes)."""
+    notes = []
+    existing = schema.table(table)
+    if existing is None:
+        model = Schema()
+        apply_sql(model, DEFINITIONS[table])
+        source = model.tables[table]
+    else:
+        source = existing
+    parent, dropped = parent_table(source)
+    for key in dropped:
+        notes.append(f'UNIQUE ({", ".join(key)}) on {table} dropped: it does not include {PARTITION_KEY}')
+
+    parts = [f'-- {table}: monthly range partitions by {PARTITION_KEY}']
+    indexes = [(index_name(table, columns), f'CREATE INDEX IF NOT EXISTS {index_name(table, columns)} ON {table} '
+                                            f'({", ".join(columns)});')
+               for columns in INDEXES.get(table, ()) if all(c in parent.columns for c in columns)]
+    constraints = []
+    if existing is not None:
+        # The old table keeps its constraint and index names until it is dropped, so the new ones come after
+        if parent.primary_key:
+            constraints.append(f'ALTER TABLE {table} ADD PRIMARY KEY ({", ".join(parent.primary_key)});')
+        constraints += [f'ALTER TABLE {table} ADD UNIQUE ({", ".join(key)});' for key in parent.uniques]
+        parent.primary_key, parent.uniques = (), []
+        for index in schema.indexes_on(table):
+            if index.unique and PARTITION_KEY not in index.columns:
+                notes.append(f'unique index {index.name} dropped: it does not include {PARTITION_KEY}')
+            elif index.name not in dict(indexes):
+                indexes.append((index.name, render_index(index)))
+        for trigger in schema.triggers_on(table):
+            notes.append(f'trigger {trigger.name} is dropped with the old table; re-create it on the parent')
+        parts.append(f'ALTER TABLE {table} RENAME TO {table}_unpartitioned;')
+    parts.append(render_table(parent).replace('\nALTER TABLE', '\n\nALTER TABLE', 1))
+    parts += [render_partition(table, month) for month in months]
+    if existing is not None:
+        columns = ', '.join(existing.columns)
+        parts.append(f'INSERT INTO {table} ({columns})\nSELECT {columns} FROM {table}_unpartitioned;')
+        parts.append(f'DROP TABLE {table}_unpartitioned;')
+    parts += constraints
+    parts += [sql for _, sql in indexes]
+    policies = policy_catalog.replaceable_policies(table)
+    if policies:
+        parts.append(policies)
+    return '\n\n'.join(parts), notes
+
+
+def partitions_of(schema, table):
+    """{month: Partition} of the monthly partitions of a table the migrations leave attached"""
+    found = {}
+    for name, t in schema.tables.items():
+        partition = parse_partition_name(name)
+        if partition and partition.table == table and t.partition_of == table:
+            found[partition.month] = partition
+    return found
+
+
+def detached_partitions(schema, table):
+    """Monthly partitions of a table that were detached but not dropped"""
+    return [p for p in map(parse_partition_name, schema.tables)
+            if p and p.table == table and schema.tables[p.name].partition_of is None]
+
+
+def plan_roll(schema, today, ahead=AHEAD, retain=RETAIN, detach_only=False):
+    """Statements that bring every monthly-partitioned table up to date, by table"""
+    current = month_start(today)
+    cutoff = add_months(current, -retain)
+    plan = {}
+    for name, table in schema.tables.items():
+        if table.partition_by != f'RANGE ({PARTITION_KEY})':
+            continue
+        existing = partitions_of(schema, name)
+        statements = [render_partition(name, month) for month in (add_months(current, n) for n in range(ahead + 1))
+                      if month not in existing]
+        for month, partition in sorted(existing.items()):
+            if month < cutoff:
+                statements.append(f'ALTER TABLE {name} DETACH PARTITION {partition.name};')
+                if not detach_only:
+                    statements.append(f'DROP TABLE IF EXISTS {partition.name};')
+        if not detach_only:
+            statements += [f'DROP TABLE IF EXISTS {p.name};' for p in detached_partitions(schema, name)
+                           if p.month < cutoff]
+        if statements:
+            plan[name] = statements
+    return plan
+
+
+def _month(text):
+    return month_start(datetime.strptime(text, '%Y-%m').date())
+
+
+def _today():
+    return datetime.now(timezone.utc).date()
+
+
+def _write(args, name, sql):
+    if args.dry_run:
+        print(sql)
+        return
+    path = migration_path(args.dir, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(sql)
+    print(f"✓ Wrote {path}")
+
+
+def create_command(args):
+    schema = load_schema(args.dir)
+    current = month_start(_today())
+    start = _month(args.start) if args.start else current
+    if start > current:
+        print(f"--start {args.start} is after the current month")
+        return 1
+    months = []
+    month = start
+    while month <= add_months(current, args.ahead):
+        months.append(month)
+        month = add_months(month, 1)
+
+    sections = [f'-- Monthly range partitions for {", ".join(args.tables)}, '
+                f'{months[0]:%Y-%m} to {months[-1]:%Y-%m}; keep them rolling with partition_tables.py roll']
+    for table in args.tables:
+        existing = schema.table(table)
+        if existing is not None and existing.partition_by:
+            print(f"  - {table} is already partitioned ({existing.partition_by})")
+            continue
+        try:
+            sql, notes = render_create(table, schema, months)
+        except ValueError as e:
+            print(f"  ✗ {e}")
+            return 1
+        print(f"  ✓ {table}: {'converted' if existing is not None else 'created'}, {len(months)} partitions")
+        for note in notes:
+            print(f"    ! {note}")
+        sections.append(sql)
+    if len(sections) == 1:
+        print("Nothing to partition.")
+        return 0
+    _write(args, 'partition_event_tables', '\n\n'.join(sections) + '\n')
+    return 0
+
+
+def roll_command(args):
+    today = datetime.strptime(args.as_of, '%Y-%m-%d').date() if args.as_of else _today()
+    plan = plan_roll(load_schema(args.dir), today, args.ahead, args.retain, args.detach_only)
+    if not plan:
+        print("Every partitioned table is up to date.")
+        return 0
+    sections = [f'-- Partitions through {add_months(month_start(today), args.ahead):%Y-%m}, '
+                f'rows before {add_months(month_start(today), -args.retain):%Y-%m} expired']
+    for table, statements in plan.items():
+        created = sum(s.startswith('CREATE') for s in statements)
+        expired = {s.rstrip(';').split()[-1] for s in statements if 'DETACH' in s or s.startswith('DROP')}
+        print(f"  ✓ {table}: {created} partitions added, {len(expired)} expired")
+        sections.append(f'-- {table}\n' + '\n'.join(statements))
+    _write(args, 'roll_partitions', '\n\n'.join(sections) + '\n')
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Range-partition the event and analytics tables by month.")
+    parser.add_argument('--dir', default=MIGRATION_DIR, help=f"migration directory (default: {MIGRATION_DIR})")
+    parser.add_argument('--dry-run', action='store_true', help="print the migration instead of writing it")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    create = commands.add_parser('create', help="write the migration that partitions the tables")
+    create.add_argument('--tables', nargs='+', default=list(DEFINITIONS), choices=list(DEFINITIONS),
+                        help="tables to partition (default: all of them)")
+    create.add_argument('--start', help="first month with a partition, YYYY-MM (default: the current month); "
+                                        "converted tables need one for every month they have rows in")
+    create.add_argument('--ahead', type=int, default=AHEAD, help=f"months of partitions ahead (default: {AHEAD})")
+
+    roll = commands.add_parser('roll', help="write the migration that adds and expires partitions")
+    roll.add_argument('--ahead', type=int, default=AHEAD, help=f"months of partitions ahead (default: {AHEAD})")
+    roll.add_argument('--retain', type=int, default=RETAIN,
+                      help=f"months kept before the current one (default: {RETAIN})")
+    roll.add_argument('--detach-only', action='store_true', help="detach expired partitions without dropping them")
+    roll.add_argument('--as-of', help="date to roll for, YYYY-MM-DD (default: today, UTC)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.dir):
+        print(f"Migration directory {args.dir} not found!")
+        return 1
+    return create_command(args) if args.command == 'create' else roll_command(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Per-pass, per-file cost of a migrate_fix run.
+
+measure() runs a transform twice: once bare for the wall and CPU time, and
+once under tracemalloc and a profile hook for peak memory and the number of
+regex calls, so the instrumentation never shows up in the timings. The
+records are written as JSON and as a Prometheus textfile for the node
+exporter's textfile collector, and the slowest pass can be re-run under
+cProfile.
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+import contextlib
+from collections import namedtuple
+
+PROFILE_PREFIX = "migration_profile"
+
+# One pass over one migration; sizes in bytes of UTF-8 text
+PassProfile = namedtuple('PassProfile', 'name file wall cpu bytes_scanned bytes_changed regex_calls peak_memory')
+
+# Methods of compiled patterns that scan text; re.sub() and friends call these as well
+_REGEX_METHODS = frozenset(('match', 'fullmatch', 'search', 'sub', 'subn', 'split', 'findall', 'finditer'))
+
+
+def changed_bytes(before, after):
+    """Length of the span of after that differs from before, ignoring the common prefix and suffix"""
+    if before == after:
+        return 0
+    a, b = before.encode('utf-8'), after.encode('utf-8')
+    prefix = len(os.path.commonprefix((a, b)))
+    limit = min(len(a), len(b)) - prefix
+    suffix = 0
+    while suffix < limit and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+    return max(len(a), len(b)) - prefix - suffix
+
+
+def count_regex_calls(fn, *args):
+    """(fn(*args), number of regex scans it made)"""
+    calls = 0
+
+    def hook(frame, event, arg):
+        nonlocal calls
+        if event == 'c_call' and getattr(arg, '__name__', None) in _REGEX_METHODS and isinstance(
+                getattr(arg, '__self__', None), re.Pattern):
+            calls += 1
+
+    previous = sys.getprofile()
+    sys.setprofile(hook)
+    try:
+        result = fn(*args)
+    finally:
+        sys.setprofile(previous)
+    return result, calls
+
+
+def measure(name, transform, content):
+    """(transform(content), PassProfile) for one pass over one migration's text"""
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = transform(content)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, regex_calls = count_regex_calls(transform, content)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    if not tracing:
+        tracemalloc.stop()
+
+    return result, PassProfile(name, None, wall, cpu, len(content.encode('utf-8')), changed_bytes(content, result),
+                               regex_calls, max(peak, 0))
+
+
+class Recorder:
+    """Collects the PassProfiles of one file, plus the input of its slowest pass for cProfile"""
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path
+        self.records = []
+        self.slowest_input = None
+
+    def run(self, name, transform, content):
+        result, record = measure(name, transform, content)
+        record = record._replace(file=self.file_path)
+        if not self.records or record.wall > slowest(self.records).wall:
+            self.slowest_input = content
+        self.records.append(record)
+        return result
+
+
+def slowest(records):
+    return max(records, key=lambda r: r.wall, default=None)
+
+
+def summary(records):
+    """{pass name: totals over every file}, in pipeline order"""
+    totals = {}
+    for r in records:
+        t = totals.setdefault(r.name, {'files': 0, 'wall': 0.0, 'cpu': 0.0, 'bytes_scanned': 0, 'bytes_changed': 0,
+                                       'regex_calls': 0, 'peak_memory': 0})
+        t['files'] += 1
+        for field in ('wall', 'cpu', 'bytes_scanned', 'bytes_changed', 'regex_calls'):
+            t[field] += getattr(r, field)
+        t['peak_memory'] = max(t['peak_memory'], r.peak_memory)
+    return totals
+
+
+def write_json(path, records):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'generated_at': int(time.time()), 'passes': summary(records),
+                   'records': [r._asdict() for r in records]}, f, indent=2)
+        f.write('\n')
+
+
+_METRICS = (
+    ('wall', 'pass_wall_seconds', 'Wall time of a fixer pass summed over the migration files.'),
+    ('cpu', 'pass_cpu_seconds', 'CPU time of a fixer pass summed over the migration files.'),
+    ('bytes_scanned', 'pass_scanned_bytes', 'Bytes of migration text a fixer pass read.'),
+    ('bytes_changed', 'pass_changed_bytes', 'Bytes of migration text a fixer pass rewrote.'),
+    ('regex_calls', 'pass_regex_calls', 'Regex scans a fixer pass made.'),
+    ('peak_memory', 'pass_peak_memory_bytes', 'Largest Python allocation peak of a fixer pass on one file.'),
+)
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_prometheus(path, records, wall):
+    """Prometheus text exposition of the per-pass totals, written atomically for the textfile collector"""
+    totals = summary(records)
+    lines = []
+    for field, metric, help_text in _METRICS:
+        lines.append(f'# HELP migrate_fix_{metric} {help_text}')
+        lines.append(f'# TYPE migrate_fix_{metric} gauge')
+        for name, t in totals.items():
+            lines.append(f'migrate_fix_{metric}{{pass="{_label(name)}"}} {t[field]:g}')
+    lines += [
+        '# HELP migrate_fix_files Migration files profiled.',
+        '# TYPE migrate_fix_files gauge',
+        f'migrate_fix_files {len({r.file for r in records})}',
+        '# HELP migrate_fix_run_seconds Wall time of the whole profiled run.',
+        '# TYPE migrate_fix_run_seconds gauge',
+        f'migrate_fix_run_seconds {wall:g}',
+        '# HELP migrate_fix_last_run_timestamp_seconds When the profiled run finished.',
+        '# TYPE migrate_fix_last_run_timestamp_seconds gauge',
+        f'migrate_fix_last_run_timestamp_seconds {int(time.time())}',
+    ]
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
+
+
+def dump_cprofile(path, transform, content, top=15):
+    """Run transform(content) under cProfile, save the stats to path and return the top functions as text"""
+    profiler = cProfile.Profile()
+    with contextlib.redirect_stdout(io.StringIO()):
+        profiler.runcall(transform, content)
+    profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(top)
+    return out.getvalue()
+
+
+def format_table(records):
+    lines = [f"  {'pass':<32} {'wall ms':>9} {'cpu ms':>9} {'scanned':>10} {'changed':>9} {'regex':>8} {'peak KiB':>9}"]
+    for name, t in sorted(summary(records).items(), key=lambda item: -item[1]['wall']):
+        lines.append(f"  {name:<32} {t['wall'] * 1000:>9.1f} {t['cpu'] * 1000:>9.1f} {t['bytes_scanned']:>10} "
+                     f"{t['bytes_changed']:>9} {t['regex_calls']:>8} {t['peak_memory'] / 1024:>9.0f}")
+    return '\n'.join(lines)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""The standard RLS policies, declared once for every fixer that restores them.
+
+POLICIES maps table -> command -> policy. Each policy has the short name
+the old pg_policies checks used, the real policy name, its USING and
+WITH CHECK expressions and any other short names earlier fixers used for it.
+The catalog is indexed once per process and every rendered SQL fragment is
+memoized, so the fixers look policies up instead of rebuilding them per file.
+"""
+import functools
+from collections import namedtuple
+
+# auth calls are wrapped in a select so Postgres evaluates them once per query (see rls_initplan)
+OWNER = '(select auth.uid()) = user_id'
+AUTHENTICATED = "(select auth.role()) = 'authenticated'"
+
+# Commands appear in the order their policies are created
+POLICIES = {
+    'notebooks': {
+        'SELECT': {'short_name': 'public_read', 'name': 'Anyone can read notebooks', 'using': 'true'},
+        'INSERT': {'short_name': 'authenticated_insert', 'name': 'Authenticated users can insert notebooks',
+                   'check': AUTHENTICATED},
+        # author is free text, not a user id, so notebooks cannot have owner policies
+        'UPDATE': {'short_name': 'authenticated_update', 'name': 'Authenticated users can update notebooks',
+                   'using': AUTHENTICATED, 'check': AUTHENTICATED, 'aliases': ('owner_update',)},
+        'DELETE': {'short_name': 'authenticated_delete', 'name': 'Authenticated users can delete notebooks',
+                   'using': AUTHENTICATED, 'aliases': ('owner_delete',)},
+    },
+    'profiles': {
+        'SELECT': {'short_name': 'public_read', 'name': 'Anyone can read profiles', 'using': 'true'},
+        'UPDATE': {'short_name': 'owner_update', 'name': 'Users can update their own profiles',
+                   'using': '(select auth.uid()) = id', 'check': '(select auth.uid()) = id', 'aliases': ('authenticated_update',)},
+        'INSERT': {'short_name': 'owner_insert', 'name': 'Users can insert their own profiles',
+                   'check': '(select auth.uid()) = id'},
+    },
+    'saved_notebooks': {
+        'SELECT': {'short_name': 'owner_read', 'name': 'Users can read their own saved_notebooks', 'using': OWNER},
+        'INSERT': {'short_name': 'owner_insert', 'name': 'Users can insert their own saved_notebooks', 'check': OWNER},
+        'DELETE': {'short_name': 'owner_delete', 'name': 'Users can delete their own saved_notebooks', 'using': OWNER,
+                   'aliases': ('authenticated_delete',)},
+    },
+    'subscription_plans': {
+        'SELECT': {'short_name': 'public_read', 'name': 'Anyone can read subscription plans', 'using': 'true'},
+    },
+    'subscriptions': {
+        'SELECT': {'short_name': 'owner_read', 'name': 'Users can read their own subscriptions', 'using': OWNER},
+        'INSERT': {'short_name': 'owner_insert', 'name': 'Users can insert their own subscriptions', 'check': OWNER},
+        'UPDATE': {'short_name': 'owner_update', 'name': 'Users can update their own subscriptions',
+                   'using': OWNER, 'check': OWNER, 'aliases': ('authenticated_update',)},
+    },
+    'payments': {
+        'SELECT': {'short_name': 'owner_read', 'name': 'Users can read their own payments', 'using': OWNER},
+        'INSERT': {'short_name': 'owner_insert', 'name': 'Users can insert their own payments', 'check': OWNER},
+    },
+    'user_interactions': {
+        'SELECT': {'short_name': 'owner_read', 'name': 'Users can read their own interactions', 'using': OWNER},
+        'INSERT': {'short_name': 'owner_insert', 'name': 'Users can insert their own interactions', 'check': OWNER},
+        'UPDATE': {'short_name': 'owner_update', 'name': 'Users can update their own interactions',
+                   'using': OWNER, 'check': OWNER, 'aliases': ('authenticated_update',)},
+    },
+    'scraping_operations': {
+        'SELECT': {'short_name': 'owner_read', 'name': 'Users can read their own scraping operations', 'using': OWNER},
+        'INSERT': {'short_name': 'owner_insert', 'name': 'Users can insert their own scraping operations',
+                   'check': OWNER},
+        'UPDATE': {'short_name': 'owner_update', 'name': 'Users can update their own scraping operations',
+                   'using': OWNER, 'check': OWNER, 'aliases': ('authenticated_update',)},
+    },
+    'scraped_items': {
+        'SELECT': {'short_name': 'owner_read', 'name': 'Users can read their own scraped items', 'using': OWNER},
+        'INSERT': {'short_name': 'owner_insert', 'name': 'Users can insert their own scraped items', 'check': OWNER},
+    },
+    'user_events': {
+        'SELECT': {'short_name': 'owner_read', 'name': 'Users can read their own events', 'using': OWNER},
+        'INSERT': {'short_name': 'owner_insert', 'name': 'Users can insert their own events', 'check': OWNER},
+    },
+    'notebook_analytics': {
+        'SELECT': {'short_name': 'owner_read', 'name': 'Users can read their own analytics', 'using': OWNER},
+        'INSERT': {'short_name': 'owner_insert', 'name': 'Users can insert their own analytics', 'check': OWNER},
+    },
+    'search_analytics': {
+        'SELECT': {'short_name': 'owner_read', 'name': 'Users can read their own search analytics', 'using': OWNER},
+        'INSERT': {'short_name': 'owner_insert', 'name': 'Users can insert their own search analytics',
+                   'check': OWNER},
+    },
+    # Daily rollups of the analytics tables (see analytics_rollups). Event and category counts are readable by
+    # any signed-in user; query_daily_stats keeps the search text, so it has no policy and only service_role
+    # reads it, as with search_analytics itself
+    'notebook_daily_stats': {
+        'SELECT': {'short_name': 'authenticated_read', 'name': 'Authenticated users can read notebook daily stats',
+                   'using': AUTHENTICATED},
+    },
+    'category_daily_stats': {
+        'SELECT': {'short_name': 'authenticated_read', 'name': 'Authenticated users can read category daily stats',
+                   'using': AUTHENTICATED},
+    },
+    'user_preferences': {
+        'SELECT': {'short_name': 'owner_read', 'name': 'Users can read their own preferences', 'using': OWNER},
+        'INSERT': {'short_name': 'owner_insert', 'name': 'Users can insert their own preferences', 'check': OWNER},
+        'UPDATE': {'short_name': 'owner_update', 'name': 'Users can update their own preferences',
+                   'using': OWNER, 'check': OWNER, 'aliases': ('authenticated_update',)},
+    },
+    'user_recommendations': {
+        'SELECT': {'short_name': 'owner_read', 'name': 'Users can read their own recommendations', 'using': OWNER},
+        'INSERT': {'short_name': 'owner_insert', 'name': 'Users can insert their own recommendations',
+                   'check': OWNER},
+    },
+}
+
+# Fallback for RLS-enabled tables the catalog does not know; {table} is filled in
+GENERIC_POLICIES = {
+    'SELECT': {'short_name': 'public_read', 'name': 'Anyone can read {table}', 'using': 'true'},
+    'INSERT': {'short_name': 'authenticated_insert', 'name': 'Authenticated users can insert {table}',
+               'check': AUTHENTICATED},
+}
+
+
+class Policy(namedtuple('Policy', 'table command short_name name using check aliases')):
+    """One catalog entry; sql is the CREATE POLICY statement, rendered once"""
+    __slots__ = ()
+
+    @property
+    def sql(self):
+        return render_policy(self)
+
+
+def _build(table, command, spec):
+    return Policy(table, command, spec['short_name'], spec['name'].format(table=table),
+                  spec.get('using'), spec.get('check'), tuple(spec.get('aliases', ())))
+
+
+@functools.lru_cache(maxsize=None)
+def load_catalog():
+    """{table: (Policy, ...)} in creation order, built once per process"""
+    return {table: tuple(_build(table, command, spec) for command, spec in commands.items())
+            for table, commands in POLICIES.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def _command_index():
+    return {(p.table, p.command): p for policies in load_catalog().values() for p in policies}
+
+
+@functools.lru_cache(maxsize=None)
+def short_name_index():
+    """{(table, short_name or alias): Policy}"""
+    index = {}
+    for policies in load_catalog().values():
+        for p in policies:
+            for short_name in (p.short_name,) + p.aliases:
+                index[(p.table, short_name)] = p
+    return index
+
+
+def policies_for(table):
+    """The table's standard policies, or () if the catalog does not know it"""
+    return load_catalog().get(table, ())
+
+
+def policy(table, command):
+    """The table's policy for a command (SELECT/INSERT/UPDATE/DELETE), or None"""
+    return _command_index().get((table, command))
+
+
+def lookup_short_name(table, short_name):
+    """The policy an old pg_policies check by short name refers to, or None"""
+    return short_name_index().get((table, short_name))
+
+
+@functools.lru_cache(maxsize=None)
+def generic_policies(table):
+    """GENERIC_POLICIES filled in for a table the catalog does not know"""
+    return tuple(_build(table, command, spec) for command, spec in GENERIC_POLICIES.items())
+
+
+@functools.lru_cache(maxsize=None)
+def render_policy(p):
+    """CREATE POLICY statement for a catalog entry"""
+    sql = f'CREATE POLICY "{p.name}" ON {p.table} FOR {p.command}'
+    if p.using:
+        sql += f' USING ({p.using})'
+    if p.check:
+        sql += f' WITH CHECK ({p.check})'
+    return sql + ';'
+
+
+@functools.lru_cache(maxsize=None)
+def render_policy_block(table_name, policy_name, policy_sql):
+    """DO block that creates a policy unless pg_policies already has it"""
+    return f"""DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_policies 
+        WHERE tablename = '{table_name}' 
+        AND policyname = '{policy_name}'
+    ) THEN
+        {policy_sql}
+    END IF;
+END $$;
+
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def guarded_policies(table):
+    """Every standard policy of a table as pg_policies-guarded DO blocks"""
+    return ''.join(render_policy_block(table, p.short_name, p.sql) for p in policies_for(table))
+
+
+@functools.lru_cache(maxsize=None)
+def plain_policies(table):
+    """Bare CREATE POLICY statements for a table, one per line.
+
+    Tables the catalog does not know get GENERIC_POLICIES.
+    """
+    policies = policies_for(table) or generic_policies(table)
+    return ''.join(f'{p.sql}\n' for p in policies)
+
+
+@functools.lru_cache(maxsize=None)
+def replaceable_policies(table):
+    """The table's standard policies, each dropped first so a migration can be re-run"""
+    return '\n'.join(f'DROP POLICY IF EXISTS "{p.name}" ON {table};\n{p.sql}' for p in policies_for(table))
+
+
+@functools.lru_cache(maxsize=None)
+def standard_policies():
+    """{table: ((short_name, CREATE POLICY ...), ...)}, the shape restore_rls_policies used"""
+    return {table: tuple((p.short_name, p.sql) for p in policies) for table, policies in load_catalog().items()}
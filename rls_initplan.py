@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Wrap the auth.uid()/auth.role()/auth.jwt() calls of RLS policies in a scalar select.
+
+A bare call is evaluated once per scanned row; (select auth.uid()) is
+planned as an initplan and evaluated once per query.
+"""
+import os
+import sys
+import glob
+import argparse
+from collections import namedtuple
+
+from sql_lexer import join_segments, policy_signature, rewrite_statements, significant_tokens, split_block
+
+# auth.<function>() calls that return the same value for every row of a query
+AUTH_FUNCTIONS = ('uid', 'role', 'jwt')
+
+# One changed policy: where it is and which calls were wrapped
+PolicyRewrite = namedtuple('PolicyRewrite', 'line table name calls')
+
+
+def _auth_calls(tokens):
+    """Index of every auth.<fn>() call in a USING/WITH CHECK clause that is not already wrapped in a select"""
+    clause = next((i for i, tok in enumerate(tokens) if tok.kind == 'word' and tok.text.upper() in ('USING', 'WITH')), None)
+    if clause is None:
+        return []
+    calls = []
+    for i in range(clause, len(tokens) - 4):
+        if (tokens[i].text.lower() != 'auth' or tokens[i + 1].text != '.'
+                or tokens[i + 2].text.lower() not in AUTH_FUNCTIONS
+                or tokens[i + 3].text != '(' or tokens[i + 4].text != ')'):
+            continue
+        # Already (select auth.uid())
+        if i >= 2 and tokens[i - 1].text.upper() == 'SELECT' and tokens[i - 2].text == '(':
+            continue
+        calls.append(i)
+    return calls
+
+
+def wrap_auth_calls(policy_sql):
+    """CREATE POLICY text with auth.uid()/auth.role()/auth.jwt() wrapped as (select auth.uid()).
+
+    Postgres evaluates a bare auth.uid() once per scanned row; wrapped in a
+    scalar subquery it becomes an initplan that is evaluated once per
+    query. Returns (new text, list of the wrapped calls).
+    """
+    tokens = significant_tokens(policy_sql)
+    calls = _auth_calls(tokens)
+    if not calls:
+        return policy_sql, []
+    pieces = []
+    wrapped = []
+    pos = 0
+    for i in calls:
+        start = tokens[i].start
+        end = tokens[i + 4].start + 1
+        call = policy_sql[start:end]
+        pieces.append(policy_sql[pos:start])
+        pieces.append(f'(select {call})')
+        wrapped.append(call)
+        pos = end
+    pieces.append(policy_sql[pos:])
+    return ''.join(pieces), wrapped
+
+
+def rewrite_policy_initplans(content):
+    """Wrap the auth calls of every CREATE POLICY, top level or inside a DO block.
+
+    Returns (new content, [PolicyRewrite]).
+    """
+    changes = []
+
+    def rewrite_policy(stmt, line):
+        if not stmt.starts_with('CREATE', 'POLICY'):
+            return None
+        text, wrapped = wrap_auth_calls(stmt.text)
+        if not wrapped:
+            return None
+        name, table = policy_signature(stmt) or ('?', '?')
+        changes.append(PolicyRewrite(line, table, name, wrapped))
+        return text
+
+    def rewrite_block(block, first_line):
+        """Rewrite the policies of a statement list, descending into DO and function bodies"""
+        segments = []
+        changed = False
+        for piece in split_block(block):
+            line = first_line + piece.line - 1
+            new = None
+            if piece.kind == 'trivia' or 'auth' not in piece.text:
+                pass
+            elif piece.starts_with('CREATE', 'POLICY'):
+                new = rewrite_policy(piece, line)
+            elif piece.bodies:
+                # Lines before the body starts, to report policies at their line in the file
+                body = rewrite_block(piece.body, line + piece.text.count('\n', 0, piece.bodies[0][0]))
+                new = None if body is None else piece.replace_body(body)
+            changed = changed or new is not None
+            segments.append(piece if new is None else new)
+        return join_segments(segments) if changed else None
+
+    def rewrite(stmt):
+        if stmt.kind == 'trivia' or 'POLICY' not in stmt.text.upper():
+            return None
+        if stmt.starts_with('CREATE', 'POLICY'):
+            return rewrite_policy(stmt, stmt.line)
+        # DO blocks, and the inner halves of nested DO $$ blocks that show up at the top level
+        return rewrite_block(stmt.text, stmt.line)
+
+    return rewrite_statements(content, rewrite), changes
+
+
+def format_report(changes, file_path=None):
+    lines = []
+    for change in changes:
+        where = f'{file_path}:{change.line}' if file_path else f'line {change.line}'
+        lines.append(f'  {where}: policy "{change.name}" on {change.table}: wrapped {", ".join(change.calls)}')
+    return '\n'.join(lines)
+
+
+def rls_initplan_sql(content):
+    """Pass form of rewrite_policy_initplans: rewrite and print the report"""
+    content, changes = rewrite_policy_initplans(content)
+    if changes:
+        print(format_report(changes))
+    return content
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Wrap auth.uid()/auth.role() in RLS policies as initplans.")
+    parser.add_argument('files', nargs='*', help="migration files (default: every *.sql in supabase/migrations)")
+    parser.add_argument('--check', action='store_true', help="only report the policies that would change")
+    args = parser.parse_args(argv)
+
+    migration_files = sorted(args.files or glob.glob(os.path.join("supabase/migrations", "*.sql")))
+    print(f"Checking {len(migration_files)} migration files for per-row auth calls")
+
+    total = 0
+    for file_path in migration_files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        new, changes = rewrite_policy_initplans(content)
+        if not changes:
+            continue
+        total += len(changes)
+        print(format_report(changes, file_path))
+        if not args.check:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(new)
+
+    print(f"\n{total} policies {'would be rewritten' if args.check else 'rewritten'}.")
+    return 1 if args.check and total else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Generate the trigram and full-text search schema for notebook search.
+
+lib/notebooks.js searches with `title.ilike.%q%,description.ilike.%q%,
+author.ilike.%q%` and lib/content-discovery.js with `.ilike('title', '%q%')`.
+A leading wildcard cannot use a btree index, so every search is a sequential
+scan of notebooks. This writes a migration with pg_trgm GIN indexes that
+serve those ILIKE filters as they are, a generated, weighted tsvector column
+over title, description, tags and author with its own GIN index, and a
+search_notebooks() function that ranks full-text matches for the app to call
+through supabase.rpc(). The DDL is put through make_migrations_idempotent, so
+the migration re-applies cleanly.
+"""
+import os
+import sys
+import argparse
+
+from make_migrations_idempotent import make_idempotent_sql
+from sql_schema import MIGRATION_DIR, index_name, load_schema, migration_path
+
+TABLE = 'notebooks'
+# Columns the app filters with ILIKE '%q%'
+TRIGRAM_COLUMNS = ('title', 'description', 'author')
+# Full-text document: column and weight, A ranks highest
+WEIGHTED_COLUMNS = (('title', 'A'), ('description', 'B'), ('tags', 'C'), ('author', 'D'))
+# Array columns need an immutable text conversion to appear in a generated column
+ARRAY_COLUMNS = frozenset(('tags',))
+SEARCH_COLUMN = 'search_vector'
+TEXT_CONFIG = 'english'
+
+
+def tags_function():
+    # array_to_string() is only STABLE, and generated columns accept IMMUTABLE expressions only
+    return f'''CREATE OR REPLACE FUNCTION {TABLE}_search_tags(tags text[])
+RETURNS text
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+AS $$
+  SELECT coalesce(array_to_string(tags, ' '), '')
+$$;'''
+
+
+def search_document():
+    """setweight(to_tsvector(...)) || ... over WEIGHTED_COLUMNS"""
+    parts = []
+    for column, weight in WEIGHTED_COLUMNS:
+        text = f'{TABLE}_search_tags({column})' if column in ARRAY_COLUMNS else f"coalesce({column}, '')"
+        parts.append(f"setweight(to_tsvector('{TEXT_CONFIG}'::regconfig, {text}), '{weight}')")
+    return '\n    || '.join(parts)
+
+
+def search_function():
+    return f'''CREATE OR REPLACE FUNCTION search_{TABLE}(search_query text, result_limit integer DEFAULT 20, result_offset integer DEFAULT 0)
+RETURNS SETOF {TABLE}
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT n.*
+  FROM {TABLE} n, websearch_to_tsquery('{TEXT_CONFIG}'::regconfig, search_query) q
+  WHERE n.{SEARCH_COLUMN} @@ q
+     OR n.title ILIKE '%' || search_query || '%'
+  ORDER BY ts_rank_cd(n.{SEARCH_COLUMN}, q) + similarity(n.title, search_query) DESC, n.created_at DESC
+  LIMIT result_limit OFFSET result_offset
+$$;'''
+
+
+def render_migration():
+    statements = [
+        "-- Trigram and full-text search for notebooks. Generated by search_schema.py",
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+        "",
+        "-- Serve the app's title/description/author ILIKE '%q%' filters",
+    ]
+    for column in TRIGRAM_COLUMNS:
+        statements.append(f"CREATE INDEX {index_name(TABLE, (column, 'trgm'))} ON {TABLE} USING gin ({column} gin_trgm_ops);")
+    statements += [
+        "",
+        tags_function(),
+        "",
+        "-- Weighted search document, kept up to date by Postgres (adding it rewrites the table once)",
+        f"ALTER TABLE {TABLE} ADD COLUMN {SEARCH_COLUMN} tsvector GENERATED ALWAYS AS (\n    {search_document()}\n) STORED;",
+        f"CREATE INDEX {index_name(TABLE, (SEARCH_COLUMN,))} ON {TABLE} USING gin ({SEARCH_COLUMN});",
+        "",
+        "-- Ranked search: full-text matches first, then trigram similarity of the title",
+        search_function(),
+        "",
+    ]
+    return make_idempotent_sql('\n'.join(statements))
+
+
+def missing_columns(schema):
+    """Columns the search schema needs that no migration creates on TABLE"""
+    table = schema.table(TABLE)
+    needed = set(TRIGRAM_COLUMNS) | {column for column, _ in WEIGHTED_COLUMNS}
+    if table is None:
+        return sorted(needed)
+    return sorted(needed - set(table.columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate trigram and full-text search indexes for notebooks.")
+    parser.add_argument('--dir', default=MIGRATION_DIR, help=f"migration directory (default: {MIGRATION_DIR})")
+    parser.add_argument('--output', help="migration file to write (default: a new timestamped file in --dir)")
+    parser.add_argument('--dry-run', action='store_true', help="print the migration instead of writing it")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.dir):
+        print(f"Migration directory {args.dir} not found!")
+        return 1
+    missing = missing_columns(load_schema(args.dir))
+    if missing:
+        print(f"No migration creates {TABLE}.{', '.join(missing)}; cannot build the search schema")
+        return 1
+
+    sql = render_migration()
+    if args.dry_run:
+        print(sql)
+        return 0
+    output = args.output or migration_path(args.dir, f'{TABLE}_search')
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(sql)
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+"""Move seed rows out of the migrations into CSV files loaded with COPY.
+
+A multi-row INSERT ... VALUES literal is data, but every fixer pass and the
+validator scan it as SQL on every run, and the cost grows with the rows
+seeded for staging. `extract` takes each top-level INSERT whose VALUES are
+all constants (strings, numbers, booleans, NULL, ARRAY[...] of constants,
+casts of those) out of its migration, writes the rows to
+supabase/seed/<version>_<table>.csv in COPY's CSV format and leaves a
+comment pointing at the file. Arrays are written as Postgres array
+literals, quoted element by element; casts are dropped because COPY reads
+the text as the column's type. INSERTs with expressions, DEFAULT,
+ON CONFLICT or RETURNING stay where they are.
+
+Seed files are loaded after the migrations, not at the INSERT's place in
+them, so an INSERT is left alone if the table is dropped or loses one of
+the columns later, gains a NOT NULL column without a default, or is
+touched by later DML that would expect the rows to be there.
+
+`load` streams every seed file into the database with COPY FROM STDIN in
+one transaction. supabase/seed/load.sql does the same with psql's \\copy
+for anyone without this script: psql "$DATABASE_URL" -f supabase/seed/load.sql,
+run from the repository root.
+"""
+import os
+import re
+import sys
+import glob
+import argparse
+from collections import namedtuple
+
+from analytics_rollups import LOCAL_DB_URL, run_psql
+from sql_lexer import dollar_body, rewrite_statements, significant_tokens, split_statements, unquote_ident
+from sql_schema import MIGRATION_DIR, find_migrations, load_schema, normalize_name
+
+SEED_DIR = os.path.join(os.path.dirname(MIGRATION_DIR), 'seed')
+LOADER = 'load.sql'
+
+# One extracted INSERT: the rows are lists of str, None (NULL) or nested lists (arrays)
+Seed = namedtuple('Seed', 'table columns rows line')
+
+_DML = frozenset(('INSERT', 'UPDATE', 'DELETE', 'TRUNCATE', 'MERGE'))
+
+_ESCAPE = re.compile(r"\\(?:([0-7]{1,3})|x([0-9A-Fa-f]{1,2})|u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))|''", re.DOTALL)
+_ESCAPED_CHARS = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+_BARE_IDENT = re.compile(r'[a-z_][a-z0-9_$]*\Z')
+
+
+class NotLiteral(ValueError):
+    """An INSERT that cannot be turned into seed rows; the message says why"""
+
+
+def _unescape(match):
+    octal, hex_byte, short, long, char = match.groups()
+    if match.group(0) == "''":
+        return "'"
+    if octal or hex_byte:
+        return chr(int(octal, 8) if octal else int(hex_byte, 16))
+    if short or long:
+        return chr(int(short or long, 16))
+    return _ESCAPED_CHARS.get(char, char)
+
+
+def string_value(tok):
+    """Text of a string or dollar-quoted constant token"""
+    if tok.kind == 'dollar':
+        return dollar_body(tok.text)
+    if tok.text[0] in 'Ee':
+        return _ESCAPE.sub(_unescape, tok.text[2:-1])
+    return tok.text[1:-1].replace("''", "'")
+
+
+class _Values:
+    """Reads constant values off a token list"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.i = 0
+
+    def peek(self, offset=0):
+        i = self.i + offset
+        return self.tokens[i] if i < len(self.tokens) else None
+
+    def word(self, offset=0):
+        tok = self.peek(offset)
+        return tok.text.upper() if tok is not None and tok.kind == 'word' else None
+
+    def expect(self, text):
+        tok = self.peek()
+        if tok is None or tok.text != text:
+            raise NotLiteral(f"expected {text!r} at {tok.text if tok else 'end of statement'!r}")
+        self.i += 1
+
+    def value(self):
+        tok = self.peek()
+        if tok is None:
+            raise NotLiteral('statement ends inside VALUES')
+        word = self.word()
+        if tok.kind in ('string', 'dollar'):
+            self.i += 1
+            value = string_value(tok)
+        elif tok.text in ('-', '+') and self.peek(1) is not None and self.peek(1).kind == 'number':
+            self.i += 2
+            value = ('-' if tok.text == '-' else '') + self.peek(-1).text
+        elif tok.kind == 'number':
+            self.i += 1
+            value = tok.text
+        elif word in ('TRUE', 'FALSE'):
+            self.i += 1
+            value = word.lower()
+        elif word == 'NULL':
+            self.i += 1
+            value = None
+        elif word == 'ARRAY' and self.peek(1) is not None and self.peek(1).text == '[':
+            self.i += 2
+            value = self.items(']')
+        elif tok.kind == 'word' and self.peek(1) is not None and self.peek(1).kind == 'string' \
+                and self.peek(1).text[0] not in 'Ee':
+            # A typed literal such as DATE '2025-01-01'
+            self.i += 2
+            value = string_value(self.peek(-1))
+        else:
+            raise NotLiteral(f'{tok.text!r} is not a constant')
+        self.casts()
+        return value
+
+    def casts(self):
+        """Skip ::type casts, including array types and type modifiers"""
+        while self.peek() is not None and self.peek().text == ':' and self.peek(1) is not None \
+                and self.peek(1).text == ':':
+            self.i += 2
+            if self.peek() is None or self.peek().kind not in ('word', 'quoted_ident'):
+                raise NotLiteral('cast without a type')
+            while self.peek() is not None and (self.peek().kind in ('word', 'quoted_ident') or self.peek().text == '.'):
+                self.i += 1
+            if self.peek() is not None and self.peek().text == '(':
+                while self.peek() is not None and self.peek().text != ')':
+                    self.i += 1
+                self.expect(')')
+            while self.peek() is not None and self.peek().text == '[':
+                self.i += 1
+                if self.peek() is not None and self.peek().kind == 'number':
+                    self.i += 1
+                self.expect(']')
+
+    def items(self, closing):
+        values = []
+        if self.peek() is not None and self.peek().text == closing:
+            self.i += 1
+            return values
+        while True:
+            values.append(self.value())
+            tok = self.peek()
+            if tok is not None and tok.text == ',':
+                self.i += 1
+                continue
+            self.expect(closing)
+            return values
+
+
+def _table_name(tokens, i):
+    """(name, index after it) of a possibly schema-qualified table name"""
+    parts = [unquote_ident(tokens[i].text)]
+    i += 1
+    while i + 1 < len(tokens) and tokens[i].text == '.':
+        parts.append(unquote_ident(tokens[i + 1].text))
+        i += 2
+    return '.'.join(parts), i
+
+
+def parse_insert(stmt):
+    """Seed of an INSERT INTO t (columns) VALUES statement with constant rows; raises NotLiteral"""
+    tokens = significant_tokens(stmt.text)
+    if tokens and tokens[-1].kind == 'semicolon':
+        tokens = tokens[:-1]
+    if len(tokens) < 4 or tokens[2].kind not in ('word', 'quoted_ident'):
+        raise NotLiteral('no table name')
+    table, i = _table_name(tokens, 2)
+    reader = _Values(tokens)
+    reader.i = i
+    if reader.word() == 'AS':
+        raise NotLiteral('table alias')
+    if reader.peek() is None or reader.peek().text != '(':
+        raise NotLiteral('no column list')
+    reader.i += 1
+    columns = []
+    while True:
+        tok = reader.peek()
+        if tok is None or tok.kind not in ('word', 'quoted_ident'):
+            raise NotLiteral('column list is not plain names')
+        columns.append(unquote_ident(tok.text))
+        reader.i += 1
+        if reader.peek() is not None and reader.peek().text == ',':
+            reader.i += 1
+            continue
+        reader.expect(')')
+        break
+    if reader.word() != 'VALUES':
+        raise NotLiteral(f"{reader.word() or 'no'} VALUES")
+    reader.i += 1
+    rows = []
+    while True:
+        reader.expect('(')
+        row = reader.items(')')
+        if len(row) != len(columns):
+            raise NotLiteral(f'row {len(rows) + 1} has {len(row)} values for {len(columns)} columns')
+        rows.append(row)
+        if reader.peek() is not None and reader.peek().text == ',':
+            reader.i += 1
+            continue
+        break
+    if reader.peek() is not None:
+        raise NotLiteral(f'{reader.peek().text} after VALUES')
+    return Seed(table, tuple(columns), rows, stmt.line)
+
+
+def array_literal(items):
+    """Postgres array literal of a list of values, every element quoted"""
+    parts = []
+    for item in items:
+        if item is None:
+            parts.append('NULL')
+        elif isinstance(item, list):
+            parts.append(array_literal(item))
+        else:
+            parts.append('"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"')
+    return '{' + ','.join(parts) + '}'
+
+
+def csv_field(value):
+    """One field in COPY's CSV format: NULL unquoted and empty, anything that needs it quoted"""
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        value = array_literal(value)
+    if value == '' or value == '\\.' or any(c in value for c in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def csv_text(seed):
+    lines = [','.join(csv_field(c) for c in seed.columns)]
+    lines += [','.join(csv_field(v) for v in row) for row in seed.rows]
+    return '\n'.join(lines) + '\n'
+
+
+def read_csv(text):
+    """Rows of COPY CSV text as lists of str and None, the way COPY reads them"""
+    rows = []
+    row = []
+    field = []
+    quoted = False
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch == '"':
+            close = i + 1
+            while True:
+                close = text.index('"', close)
+                if text.startswith('""', close):
+                    close += 2
+                    continue
+                break
+            field.append(text[i + 1:close].replace('""', '"'))
+            quoted = True
+            i = close + 1
+            continue
+        if ch in ',\n':
+            row.append(''.join(field) if field or quoted else None)
+            field = []
+            quoted = False
+            if ch == '\n':
+                rows.append(row)
+                row = []
+        else:
+            field.append(ch)
+        i += 1
+    return rows
+
+
+def read_array(text):
+    """Values of a Postgres array literal, nested lists for nested arrays"""
+    stack = [[]]
+    i = 1
+    while i < len(text) - 1:
+        ch = text[i]
+        if ch == '{':
+            stack.append([])
+        elif ch == '}':
+            inner = stack.pop()
+            stack[-1].append(inner)
+        elif ch == '"':
+            value = []
+            i += 1
+            while text[i] != '"':
+                if text[i] == '\\':
+                    i += 1
+                value.append(text[i])
+                i += 1
+            stack[-1].append(''.join(value))
+        elif ch != ',':
+            end = i
+            while text[end] not in ',}':
+                end += 1
+            word = text[i:end].strip()
+            stack[-1].append(None if word.upper() == 'NULL' else word)
+            i = end - 1
+        i += 1
+    return stack[0]
+
+
+def round_trips(seed, text):
+    """True if reading text back gives the seed's columns and rows"""
+    rows = read_csv(text)
+    if not rows or rows[0] != list(seed.columns) or len(rows) - 1 != len(seed.rows):
+        return False
+    for row, read in zip(seed.rows, rows[1:]):
+        if len(read) != len(row):
+            return False
+        for value, field in zip(row, read):
+            if isinstance(value, list) and field is not None:
+                field = read_array(field)
+            if value != field:
+                return False
+    return True
+
+
+def seed_file_name(migration_path, table):
+    version = os.path.basename(migration_path).split('_', 1)[0]
+    return f'{version}_{normalize_name(table)}.csv'
+
+
+def dml_statements(paths):
+    """[(file, line, Statement)] of the DML in these migrations, including that in DO blocks"""
+    found = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        for stmt in split_statements(content):
+            inner = split_statements(stmt.body, plpgsql=True) if stmt.kind == 'do' and stmt.body else [stmt]
+            found += [(path, stmt.line, s) for s in inner if s.kind == 'statement' and s.head[:1] and s.head[0] in _DML]
+    return found
+
+
+def _later_dml(dml, table):
+    """(file, line) of the first of these DML statements that touches table, seeds of it aside"""
+    table = normalize_name(table).lower()
+    for path, line, stmt in dml:
+        names = {normalize_name(unquote_ident(t.text)).lower() for t in significant_tokens(stmt.text)
+                 if t.kind in ('word', 'quoted_ident')}
+        if table not in names:
+            continue
+        if stmt.starts_with('INSERT', 'INTO'):
+            try:
+                if normalize_name(parse_insert(stmt).table).lower() == table:
+                    continue
+            except NotLiteral:
+                pass
+        return path, line
+    return None
+
+
+def load_blocker(seed, schema, later):
+    """Why loading seed after every migration would differ from the INSERT, or None.
+
+    later is the dml_statements() that run after the seed's INSERT.
+    """
+    table = schema.table(seed.table)
+    if table is None:
+        return f'{seed.table} does not exist after the later migrations'
+    columns = {name.lower(): column for name, column in table.columns.items()}
+    for name in seed.columns:
+        if name.lower() not in columns:
+            return f'{seed.table}.{name} is dropped or renamed later'
+    seeded = {name.lower() for name in seed.columns}
+    for name, column in columns.items():
+        if name not in seeded and column.not_null and column.default is None and not column.generated:
+            return f'{seed.table}.{name} is NOT NULL without a default'
+    dml = _later_dml(later, seed.table)
+    if dml:
+        return f'{os.path.basename(dml[0])} line {dml[1]} changes {seed.table} rows'
+    return None
+
+
+def extract(path, schema, dml, seed_dir, tables=None):
+    """(new content, [(Seed, file name)], [(line, reason)]) for one migration"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    seeds = []
+    skipped = []
+    by_table = {}
+
+    def replace(stmt):
+        if stmt.kind != 'statement' or not stmt.starts_with('INSERT', 'INTO'):
+            return None
+        try:
+            seed = parse_insert(stmt)
+        except NotLiteral as e:
+            skipped.append((stmt.line, f'INSERT kept: {e}'))
+            return None
+        if tables and normalize_name(seed.table) not in tables:
+            return None
+        later = [d for d in dml if d[:2] > (path, stmt.line)]
+        reason = load_blocker(seed, schema, later)
+        earlier = by_table.get(normalize_name(seed.table))
+        if reason is None and earlier is not None and earlier.columns != seed.columns:
+            reason = f'columns differ from the seed of {seed.table} on line {earlier.line}'
+        if reason is not None:
+            skipped.append((stmt.line, f'INSERT INTO {seed.table} kept: {reason}'))
+            return None
+        if earlier is not None:
+            earlier.rows.extend(seed.rows)
+        else:
+            by_table[normalize_name(seed.table)] = seed
+            seeds.append(seed)
+        name = seed_file_name(path, seed.table)
+        return f'-- {len(seed.rows)} seed rows of {seed.table} moved to {os.path.join(seed_dir, name)}'
+
+    new_content = rewrite_statements(content, replace)
+    return new_content, [(seed, seed_file_name(path, seed.table)) for seed in seeds], skipped
+
+
+def seed_files(seed_dir, tables=None):
+    """[(path, table, columns)] of the seed files in load order"""
+    files = []
+    for path in sorted(glob.glob(os.path.join(seed_dir, '*.csv'))):
+        table = os.path.basename(path)[:-4].split('_', 1)[1]
+        if tables and table not in tables:
+            continue
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            header = read_csv(f.readline())
+        files.append((path, table, header[0] if header else []))
+    return files
+
+
+def quote_ident(name):
+    return name if _BARE_IDENT.match(name) else '"' + name.replace('"', '""') + '"'
+
+
+def copy_command(table, columns, path):
+    """psql's \\copy of a seed file, which streams it to COPY ... FROM STDIN"""
+    target = '.'.join(quote_ident(part) for part in table.split('.'))
+    path = path.replace("'", "''")
+    return f"\\copy {target} ({', '.join(quote_ident(c) for c in columns)}) FROM '{path}' WITH (FORMAT csv, HEADER true)"
+
+
+def render_loader(seed_dir, files):
+    lines = ['-- Loads the seed files written by seed_copy.py; run from the repository root:',
+             f'--   psql "$DATABASE_URL" -v ON_ERROR_STOP=1 --single-transaction -f {os.path.join(seed_dir, LOADER)}']
+    lines += [copy_command(table, columns, path) for path, table, columns in files]
+    return '\n'.join(lines) + '\n'
+
+
+def extract_command(args):
+    migrations = find_migrations(args.dir)
+    schema = load_schema(args.dir)
+    dml = dml_statements(migrations)
+    tables = {normalize_name(t) for t in args.tables} if args.tables else None
+    rewritten = []
+    found = 0
+    for path in migrations:
+        new_content, seeds, skipped = extract(path, schema, dml, args.seed_dir, tables)
+        for line, reason in skipped:
+            print(f"  - {os.path.basename(path)}:{line}: {reason}")
+        files = []
+        for seed, name in seeds:
+            text = csv_text(seed)
+            if not round_trips(seed, text):
+                print(f"  ✗ {os.path.basename(path)}:{seed.line}: {seed.table} rows do not survive CSV; file kept")
+                break
+            print(f"  ✓ {os.path.basename(path)}:{seed.line}: {len(seed.rows)} rows of {seed.table} -> {name}")
+            files.append((name, text))
+        else:
+            if seeds:
+                found += len(seeds)
+                rewritten.append((path, new_content, files))
+
+    if args.check:
+        print(f"{found} seed INSERTs could be moved to {args.seed_dir}." if found
+              else "No seed INSERTs left in the migrations.")
+        return 1 if found else 0
+    if not rewritten:
+        print("No seed INSERTs to move.")
+        return 0
+    if args.dry_run:
+        print(f"Would move {found} seed INSERTs out of {len(rewritten)} migrations (dry run).")
+        return 0
+    os.makedirs(args.seed_dir, exist_ok=True)
+    for path, new_content, files in rewritten:
+        for name, text in files:
+            with open(os.path.join(args.seed_dir, name), 'w', encoding='utf-8', newline='') as f:
+                f.write(text)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(new_content)
+    with open(os.path.join(args.seed_dir, LOADER), 'w', encoding='utf-8') as f:
+        f.write(render_loader(args.seed_dir, seed_files(args.seed_dir)))
+    print(f"Moved {found} seed INSERTs out of {len(rewritten)} migrations; load them with seed_copy.py load "
+          f"or {os.path.join(args.seed_dir, LOADER)}.")
+    return 0
+
+
+def load_command(args):
+    files = seed_files(args.seed_dir, set(args.tables) if args.tables else None)
+    if not files:
+        print(f"No seed files in {args.seed_dir}.")
+        return 0
+    script = '\n'.join(copy_command(table, columns, os.path.abspath(path))
+                       for path, table, columns in files)
+    run_psql(args.db_url, script, single_transaction=True)
+    for path, table, columns in files:
+        print(f"  ✓ {table}: {os.path.basename(path)}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move constant seed INSERTs from the migrations into COPY files.")
+    parser.add_argument('--dir', default=MIGRATION_DIR, help=f"migration directory (default: {MIGRATION_DIR})")
+    parser.add_argument('--seed-dir', default=SEED_DIR, help=f"where the seed files go (default: {SEED_DIR})")
+    parser.add_argument('--db-url', default=os.environ.get('DATABASE_URL', LOCAL_DB_URL),
+                        help="Postgres to load into (default: $DATABASE_URL, else the local Supabase)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    extract_parser = commands.add_parser('extract', help="move the seed INSERTs into CSV files")
+    extract_parser.add_argument('--tables', nargs='+', metavar='TABLE', help="only seeds of these tables")
+    extract_parser.add_argument('--dry-run', action='store_true', help="report what would move without writing")
+    extract_parser.add_argument('--check', action='store_true', help="exit 1 if any seed INSERT could be moved")
+
+    load = commands.add_parser('load', help="COPY the seed files into the database in one transaction")
+    load.add_argument('--tables', nargs='+', metavar='TABLE', help="only these tables")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.dir):
+        print(f"Migration directory {args.dir} not found!")
+        return 1
+    if args.command == 'extract':
+        return extract_command(args)
+    try:
+        return load_command(args)
+    except RuntimeError as e:
+        print(f"✗ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
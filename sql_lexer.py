@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+"""Dollar-quote aware SQL lexer shared by the migration fixers.
+
+A migration is tokenized in one linear pass. String literals, quoted
+identifiers, comments and $tag$ bodies each come out as a single token, so
+a keyword inside a function body, a seed string or a comment can never be
+mistaken for DDL. split_statements() groups the tokens into top-level
+statements and the trivia (whitespace and comments) between them; joining
+the segments back together reproduces the input byte for byte.
+"""
+import re
+import functools
+import itertools
+from collections import namedtuple
+
+Token = namedtuple('Token', 'kind text start')
+
+_SIMPLE_TOKEN = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*)
+  | (?P<estring>[Ee]'(?:[^'\\]|\\.|'')*'?)
+  | (?P<string>'[^']*(?:''[^']*)*'?)
+  | (?P<quoted_ident>"[^"]*(?:""[^"]*)*"?)
+  | (?P<param>\$\d+)
+  | (?P<word>[^\W\d][\w$]*)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+''', re.VERBOSE)
+
+_DOLLAR_TAG = re.compile(r'\$(?:[^\W\d]\w*)?\$')
+
+# The next significant token: the same alternatives as _SIMPLE_TOKEN, with the whitespace and line
+# comments before it consumed by the same match. dollar and block only match the opening $tag$ or /*.
+_NEXT_SIGNIFICANT = re.compile(r'''
+    (?:\s+|--[^\n]*)*
+    (?:
+        (?P<estring>[Ee]'(?:[^'\\]|\\.|'')*'?)
+      | (?P<string>'[^']*(?:''[^']*)*'?)
+      | (?P<quoted_ident>"[^"]*(?:""[^"]*)*"?)
+      | (?P<param>\$\d+)
+      | (?P<word>[^\W\d][\w$]*)
+      | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+      | (?P<dollar>\$(?:[^\W\d]\w*)?\$)
+      | (?P<block>/\*)
+      | (?P<semicolon>;)
+      | (?P<punct>\S)
+    )?
+''', re.VERBOSE)
+
+# Every token up to the next semicolon, dollar body or block comment, in one match. Each repetition is
+# one token exactly as tokenize() reads it; whitespace is consumed a character at a time and a line
+# comment only whole, so a repetition that fails cannot backtrack into other ways of reading them.
+_UP_TO_BOUNDARY = re.compile(r'''
+    (?:
+        (?:\s|--[^\n]*(?![^\n]))*
+        (?:
+            [Ee]'(?:[^'\\]|\\.|'')*'?
+          | '[^']*(?:''[^']*)*'?
+          | "[^"]*(?:""[^"]*)*"?
+          | \$\d+
+          | [^\W\d][\w$]*
+          | \d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+
+          | /(?!\*)
+          | -(?!-)
+          | [^\s;$/-]
+        )
+    )*
+''', re.VERBOSE)
+
+_TERMINATED_STRING = re.compile(r"(?:'[^']*(?:''[^']*)*'|[Ee]'(?:[^'\\]|\\.|'')*')\Z")
+
+# Number of significant tokens remembered per statement for cheap keyword checks
+HEAD_SIZE = 16
+
+# Splits kept by content; a file and the DO/function bodies in it take one entry each
+SPLIT_CACHE_SIZE = 1024
+
+# Words after which a PL/pgSQL block starts a new statement without a semicolon
+_BLOCK_OPENERS = frozenset(('BEGIN', 'DECLARE', 'THEN', 'ELSE', 'LOOP', 'EXCEPTION'))
+
+
+def _block_comment_end(sql, pos):
+    """Return the offset just past a (possibly nested) /* ... */ comment"""
+    depth = 0
+    n = len(sql)
+    # Next opener/closer at or after pos; each is searched for again only
+    # once consumed, so the scan stays linear however deep the nesting
+    next_open = sql.find('/*', pos)
+    next_close = sql.find('*/', pos)
+    while next_close != -1:
+        if next_open != -1 and next_open < next_close:
+            depth += 1
+            next_open = sql.find('/*', next_open + 2)
+            continue
+        depth -= 1
+        pos = next_close + 2
+        if depth == 0:
+            return pos
+        next_close = sql.find('*/', pos)
+        if next_open != -1 and next_open < pos:
+            next_open = sql.find('/*', pos)
+    return n
+
+
+def tokenize(sql):
+    """Yield Tokens for sql in a single left-to-right pass.
+
+    Unterminated strings, identifiers, comments and dollar bodies run to the
+    end of the input, which is how Postgres itself would read them.
+    """
+    pos = 0
+    n = len(sql)
+    while pos < n:
+        ch = sql[pos]
+        if ch == '$':
+            m = _DOLLAR_TAG.match(sql, pos)
+            if m:
+                tag = m.group(0)
+                close = sql.find(tag, m.end())
+                end = n if close == -1 else close + len(tag)
+                yield Token('dollar', sql[pos:end], pos)
+                pos = end
+                continue
+        elif ch == '/' and sql.startswith('/*', pos):
+            end = _block_comment_end(sql, pos)
+            yield Token('comment', sql[pos:end], pos)
+            pos = end
+            continue
+        m = _SIMPLE_TOKEN.match(sql, pos)
+        if m:
+            kind = m.lastgroup
+            if kind == 'estring':
+                kind = 'string'
+            yield Token(kind, m.group(0), pos)
+            pos = m.end()
+        else:
+            yield Token('semicolon' if ch == ';' else 'punct', ch, pos)
+            pos += 1
+
+
+def terminated(tok):
+    """False for a string, quoted identifier, comment or dollar body that runs to the end of the input"""
+    text = tok.text
+    if tok.kind == 'dollar':
+        tag = _DOLLAR_TAG.match(text).group(0)
+        return len(text) >= 2 * len(tag) and text.endswith(tag)
+    if tok.kind == 'string':
+        return bool(_TERMINATED_STRING.match(text))
+    if tok.kind == 'quoted_ident':
+        return len(text) >= 2 and text.endswith('"')
+    if tok.kind == 'comment' and text.startswith('/*'):
+        return text.endswith('*/')
+    return True
+
+
+def _next_significant(sql, pos):
+    """(kind, start, end) of the first token at or after pos that is not whitespace or a comment.
+
+    kind is None at the end of the input. Block comments are skipped here
+    too, so kind is never 'block'.
+    """
+    while True:
+        m = _NEXT_SIGNIFICANT.match(sql, pos)
+        kind = m.lastgroup
+        if kind is None:
+            return None, len(sql), len(sql)
+        start = m.start(kind)
+        if kind == 'block':
+            pos = _block_comment_end(sql, start)
+            continue
+        if kind == 'dollar':
+            tag = m.group(kind)
+            close = sql.find(tag, m.end())
+            return kind, start, len(sql) if close == -1 else close + len(tag)
+        return 'string' if kind == 'estring' else kind, start, m.end()
+
+
+def _iter_significant(sql):
+    """Yield the Tokens of sql that are not whitespace or comments.
+
+    The same tokens as tokenize() minus those, but whitespace and line
+    comments are skipped inside the regex match instead of coming out as
+    tokens of their own.
+    """
+    pos = 0
+    while True:
+        kind, start, pos = _next_significant(sql, pos)
+        if kind is None:
+            return
+        yield Token(kind, sql[start:pos], start)
+
+
+def significant_tokens(sql, limit=None):
+    """Tokens of sql that are not whitespace or comments, at most limit of them"""
+    return list(itertools.islice(_iter_significant(sql), limit))
+
+
+def _head_text(tok):
+    if tok.kind == 'word':
+        return tok.text.upper()
+    if tok.kind == 'dollar':
+        return _DOLLAR_TAG.match(tok.text).group(0)
+    return tok.text
+
+
+def unquote_ident(text):
+    """Turn a "Quoted" identifier token into its name, leave bare words alone"""
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        return text[1:-1].replace('""', '"')
+    return text
+
+
+def dollar_body(text):
+    """Content of a dollar token without its $tag$ delimiters"""
+    tag = _DOLLAR_TAG.match(text).group(0)
+    if len(text) >= 2 * len(tag) and text.endswith(tag):
+        return text[len(tag):-len(tag)]
+    return text[len(tag):]
+
+
+class Statement(namedtuple('Statement', 'kind text start line head bodies')):
+    """One segment of a migration.
+
+    kind is 'trivia' for the whitespace and comments between statements,
+    'do' for DO blocks, 'function' for CREATE FUNCTION/PROCEDURE and
+    'statement' for everything else. head holds the first HEAD_SIZE
+    significant tokens (words upper-cased, dollar bodies reduced to their
+    opening tag) and bodies the (offset, length) of every dollar-quoted
+    token, relative to text.
+    """
+    __slots__ = ()
+
+    @property
+    def end(self):
+        return self.start + len(self.text)
+
+    def starts_with(self, *words):
+        return self.head[:len(words)] == words
+
+    @property
+    def body(self):
+        """Content of the first dollar-quoted body, or None"""
+        if not self.bodies:
+            return None
+        offset, length = self.bodies[0]
+        return dollar_body(self.text[offset:offset + length])
+
+    def replace_body(self, new_body):
+        """Statement text with the first dollar-quoted body replaced"""
+        offset, length = self.bodies[0]
+        token = self.text[offset:offset + length]
+        tag = _DOLLAR_TAG.match(token).group(0)
+        return f'{self.text[:offset]}{tag}{new_body}{tag}{self.text[offset + length:]}'
+
+
+def _classify(head):
+    if head[:1] == ('DO',):
+        return 'do'
+    words = list(head[1:4]) if head[:1] == ('CREATE',) else []
+    if words[:2] == ['OR', 'REPLACE']:
+        words = words[2:]
+    if words[:1] in (['FUNCTION'], ['PROCEDURE']):
+        return 'function'
+    return 'statement'
+
+
+def split_statements(sql, plpgsql=False):
+    """Split sql into a list of Statement segments in one pass over the tokens.
+
+    With plpgsql=True the input is treated as a PL/pgSQL block body: BEGIN,
+    DECLARE, THEN, ELSE, LOOP and EXCEPTION also end a segment, so
+    "IF x THEN" and "BEGIN" come out as statements of their own.
+
+    Results are cached by content: the passes of a pipeline mostly hand
+    each other the text unchanged, and then only the first one splits it.
+    """
+    return list(_split_statements(sql, plpgsql))
+
+
+def clear_cache():
+    """Forget every cached split, e.g. to time a cold run"""
+    _split_statements.cache_clear()
+
+
+@functools.lru_cache(maxsize=SPLIT_CACHE_SIZE)
+def _split_statements(sql, plpgsql):
+    segments = []
+    line = 1
+    line_pos = 0
+    stmt_start = None
+    trivia_start = 0
+    last_end = 0
+    head = []
+    bodies = []
+    paren_depth = 0
+    case_depth = 0
+    prev_word = None
+
+    def emit(kind, start, end, stmt_head=(), stmt_bodies=()):
+        nonlocal line, line_pos
+        line += sql.count('\n', line_pos, start)
+        line_pos = start
+        segments.append(Statement(kind, sql[start:end], start, line, tuple(stmt_head), tuple(stmt_bodies)))
+
+    pos = 0
+    while True:
+        if stmt_start is not None and not plpgsql and len(head) >= HEAD_SIZE:
+            # Past the head only semicolons and dollar bodies matter: skip to the next one in one match
+            end = _UP_TO_BOUNDARY.match(sql, pos).end()
+            if end > pos:
+                last_end = pos = end
+        kind, start, pos = _next_significant(sql, pos)
+        if kind is None:
+            break
+        if stmt_start is None:
+            if start > trivia_start:
+                emit('trivia', trivia_start, start)
+            stmt_start = start
+            head = []
+            bodies = []
+            paren_depth = case_depth = 0
+            prev_word = None
+        if len(head) < HEAD_SIZE:
+            if kind == 'word':
+                head.append(sql[start:pos].upper())
+            elif kind == 'dollar':
+                head.append(_DOLLAR_TAG.match(sql, start).group(0))
+            else:
+                head.append(sql[start:pos])
+        if kind == 'dollar':
+            bodies.append((start - stmt_start, pos - start))
+        last_end = pos
+        boundary = kind == 'semicolon'
+        if plpgsql and not boundary:
+            if kind == 'punct':
+                if sql[start] == '(':
+                    paren_depth += 1
+                elif sql[start] == ')':
+                    paren_depth = max(paren_depth - 1, 0)
+            elif kind == 'word':
+                word = sql[start:pos].upper()
+                if word == 'CASE' and prev_word != 'END' and len(head) > 1:
+                    case_depth += 1
+                elif word == 'END' and case_depth:
+                    case_depth -= 1
+                elif word in _BLOCK_OPENERS and not paren_depth and not case_depth:
+                    boundary = not (word == 'LOOP' and prev_word == 'END')
+                prev_word = word
+        if boundary:
+            emit(_classify(tuple(head)), stmt_start, last_end, head, bodies)
+            stmt_start = None
+            trivia_start = last_end
+    if stmt_start is not None:
+        emit(_classify(tuple(head)), stmt_start, last_end, head, bodies)
+        trivia_start = last_end
+    if trivia_start < len(sql):
+        emit('trivia', trivia_start, len(sql))
+    return tuple(segments)
+
+
+def iter_statements(sql, kinds=None):
+    """Yield the non-trivia statements of sql, optionally only the given kinds"""
+    for stmt in split_statements(sql):
+        if stmt.kind != 'trivia' and (kinds is None or stmt.kind in kinds):
+            yield stmt
+
+
+_BLANK_RUN = re.compile(r'\n[ \t]*\n(?:[ \t]*\n)+')
+
+
+def join_segments(segments, squeeze=False):
+    """Join Statements and plain strings back into SQL text.
+
+    Plain strings are treated as statement text; empty ones drop out. With
+    squeeze=True runs of blank lines in the trivia around them collapse to a
+    single blank line, the way the fixers used to tidy up after themselves.
+    """
+    pieces = []
+    trivia = []
+    for seg in segments:
+        is_trivia = isinstance(seg, Statement) and seg.kind == 'trivia'
+        text = seg.text if isinstance(seg, Statement) else seg
+        if is_trivia:
+            trivia.append(text)
+            continue
+        if not text:
+            continue
+        if trivia:
+            gap = ''.join(trivia)
+            pieces.append(_BLANK_RUN.sub('\n\n', gap) if squeeze else gap)
+            trivia = []
+        pieces.append(text)
+    if trivia:
+        gap = ''.join(trivia)
+        pieces.append(_BLANK_RUN.sub('\n\n', gap) if squeeze else gap)
+    return ''.join(pieces)
+
+
+def rewrite_statements(sql, fn, squeeze=False):
+    """Apply fn to every segment of sql and join the results.
+
+    fn returns None to keep a segment, a string to replace it, or '' to drop
+    it.
+    """
+    out = []
+    for stmt in split_statements(sql):
+        new = fn(stmt)
+        out.append(stmt if new is None else (stmt._replace(text=new) if stmt.kind == 'trivia' else new))
+    return join_segments(out, squeeze=squeeze)
+
+
+def opens_nested_do(stmt):
+    """True for DO $$ ... DO $$ where the inner block reuses the outer tag.
+
+    Postgres reads the second $$ as the end of the outer body, so the rest of
+    the nested block shows up as top-level statements up to the one that
+    closes_nested_do().
+    """
+    if stmt.kind != 'do' or stmt.body is None:
+        return False
+    tokens = significant_tokens(stmt.body)
+    return bool(tokens) and _head_text(tokens[-1]) == 'DO'
+
+
+def closes_nested_do(stmt):
+    """True for the END $$ ... $$; statement that ends a nested DO block"""
+    return stmt.head[:1] == ('END',) and len(stmt.head) > 1 and stmt.head[1].startswith('$')
+
+
+def split_block(body):
+    """Split a DO/function body into PL/pgSQL statements"""
+    return split_statements(body, plpgsql=True)
+
+
+def block_event(stmt):
+    """The block opener/closer event of one block statement (see block_events), or None"""
+    head = list(stmt.head)
+    if head[:2] == ['<', '<'] and '>' in head:
+        # skip a leading <<label>>
+        head = head[head.index('>') + 2:]
+    first = head[0] if head else None
+    if first == 'END':
+        second = head[1] if len(head) > 1 else None
+        return {'IF': 'end_if', 'LOOP': 'end_loop', 'CASE': 'end_case'}.get(second, 'end')
+    if first in ('BEGIN', 'IF', 'CASE'):
+        return first.lower()
+    if len(stmt.head) < HEAD_SIZE:
+        last = head[-1] if head else None
+    else:
+        last = significant_tokens(stmt.text)[-1].text.upper()
+    if last == 'LOOP':
+        return 'loop'
+    return None
+
+
+def block_events(body):
+    """Yield (event, Statement) for every block opener/closer in a body.
+
+    Events are 'begin', 'end', 'if', 'end_if', 'loop', 'end_loop', 'case' and
+    'end_case'.
+    """
+    for stmt in split_block(body):
+        if stmt.kind == 'trivia':
+            continue
+        event = block_event(stmt)
+        if event:
+            yield event, stmt
+
+
+def block_balance(body):
+    """Unclosed openers per block kind: {'begin': n, 'if': n, 'loop': n, 'case': n}.
+
+    Negative numbers mean there are more closers than openers.
+    """
+    balance = {'begin': 0, 'if': 0, 'loop': 0, 'case': 0}
+    for event, _ in block_events(body):
+        if event.startswith('end'):
+            balance['begin' if event == 'end' else event[4:]] -= 1
+        else:
+            balance[event] += 1
+    return balance
+
+
+def _name_at(tokens, i):
+    """Read a possibly schema-qualified name starting at tokens[i]"""
+    parts = [unquote_ident(tokens[i].text)]
+    i += 1
+    while i + 1 < len(tokens) and tokens[i].text == '.':
+        parts.append(unquote_ident(tokens[i + 1].text))
+        i += 2
+    return '.'.join(parts)
+
+
+def policy_signature(stmt):
+    """(name, table) of a CREATE/DROP POLICY statement, or None"""
+    if stmt.head[:2] not in (('CREATE', 'POLICY'), ('DROP', 'POLICY')):
+        return None
+    tokens = significant_tokens(stmt.text, limit=HEAD_SIZE)
+    i = 4 if stmt.head[2:4] == ('IF', 'EXISTS') else 2
+    if len(tokens) < i + 3 or _head_text(tokens[i + 1]) != 'ON':
+        return None
+    return unquote_ident(tokens[i].text), _name_at(tokens, i + 2)
+
+
+def trigger_signature(stmt):
+    """(name, table) of a CREATE/DROP TRIGGER statement, or None"""
+    words = list(stmt.head[:5])
+    if words[:1] not in (['CREATE'], ['DROP']):
+        return None
+    i = 1
+    if words[i:i + 2] == ['OR', 'REPLACE']:
+        i += 2
+    if words[i:i + 1] == ['CONSTRAINT']:
+        i += 1
+    if words[i:i + 1] != ['TRIGGER']:
+        return None
+    i += 1
+    if stmt.head[i:i + 2] == ('IF', 'EXISTS'):
+        i += 2
+    tokens = significant_tokens(stmt.text, limit=4 * HEAD_SIZE)
+    for j in range(i + 1, len(tokens) - 1):
+        if _head_text(tokens[j]) == 'ON':
+            return unquote_ident(tokens[i].text), _name_at(tokens, j + 1)
+    return None
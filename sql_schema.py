@@ -0,0 +1,756 @@
+#!/usr/bin/env python3
+"""In-memory schema model built by replaying the migrations.
+
+load_schema() runs every CREATE/ALTER/DROP TABLE and CREATE/DROP INDEX,
+POLICY, TRIGGER and FUNCTION of the migrations, in file order, against a
+Schema: tables with their columns, primary keys, unique constraints and
+foreign keys, plus every index, policy, trigger and function. DDL inside DO
+blocks (the guarded form make_migrations_idempotent writes) is replayed too;
+function bodies are not, since they do not run at migration time.
+Statements the model does not understand are skipped.
+"""
+import os
+import glob
+import hashlib
+from datetime import datetime, timezone
+from collections import namedtuple
+
+from sql_lexer import policy_signature, significant_tokens, split_block, split_statements, trigger_signature, unquote_ident
+
+MIGRATION_DIR = "supabase/migrations"
+
+# Longest identifier Postgres keeps
+MAX_IDENTIFIER = 63
+
+# Where a piece of DDL came from: migration file and 1-based line
+Source = namedtuple('Source', 'file line')
+
+# generated is the GENERATED ... clause of a generated or identity column
+Column = namedtuple('Column', 'name type not_null default definition generated', defaults=(None,))
+ForeignKey = namedtuple('ForeignKey', 'table columns ref_table ref_columns on_delete source')
+# columns holds the column name of every index element, or None for expressions
+Index = namedtuple('Index', 'name table columns elements unique method where source')
+# sql is the statement that created the object
+Policy = namedtuple('Policy', 'name table command sql source')
+Trigger = namedtuple('Trigger', 'name table sql source')
+Function = namedtuple('Function', 'name sql source')
+
+_COLUMN_CONSTRAINTS = frozenset(('CONSTRAINT', 'NOT', 'NULL', 'DEFAULT', 'PRIMARY', 'UNIQUE', 'REFERENCES', 'CHECK',
+                                 'GENERATED', 'COLLATE'))
+_TABLE_CONSTRAINTS = frozenset(('CONSTRAINT', 'PRIMARY', 'UNIQUE', 'FOREIGN', 'CHECK', 'EXCLUDE'))
+_FK_ACTIONS = frozenset(('CASCADE', 'RESTRICT', 'NO', 'SET'))
+
+
+class Table:
+    """One table of the model"""
+
+    def __init__(self, name, source=None):
+        self.name = name
+        self.columns = {}
+        self.primary_key = ()
+        self.uniques = []
+        self.foreign_keys = []
+        self.checks = []
+        self.rls = False
+        # "RANGE (created_at)" for a partitioned table
+        self.partition_by = None
+        # Parent and "FOR VALUES ..."/"DEFAULT" bound of an attached partition
+        self.partition_of = None
+        self.partition_bound = None
+        self.source = source
+
+    def __repr__(self):
+        return f'Table({self.name!r}, columns={list(self.columns)})'
+
+
+class Schema:
+    """Tables, indexes and functions by name, policies and triggers by (table, name).
+
+    conflicts collects (Source, message) for statements that would fail
+    when applied, such as a CREATE POLICY for a policy that already exists.
+    Guards in DO blocks are not evaluated by apply_sql, so a guarded
+    statement that would be skipped can show up there too.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.indexes = {}
+        self.policies = {}
+        self.triggers = {}
+        self.functions = {}
+        self.skipped = []
+        self.conflicts = []
+
+    def table(self, name):
+        return self.tables.get(normalize_name(name))
+
+    def indexes_on(self, table):
+        """Explicit indexes of a table, in creation order"""
+        table = normalize_name(table)
+        return [index for index in self.indexes.values() if index.table == table]
+
+    def implicit_indexes(self, table):
+        """The unique indexes Postgres creates for PRIMARY KEY and UNIQUE constraints"""
+        t = self.table(table)
+        if t is None:
+            return []
+        keys = ([t.primary_key] if t.primary_key else []) + t.uniques
+        return [Index(f'{t.name}_{"_".join(key)}_key', t.name, tuple(key), tuple(key), True, 'btree', None, t.source)
+                for key in keys]
+
+    def all_indexes(self, table):
+        return self.implicit_indexes(table) + self.indexes_on(table)
+
+    def policies_on(self, table):
+        table = normalize_name(table)
+        return [p for (t, _), p in self.policies.items() if t == table]
+
+    def triggers_on(self, table):
+        table = normalize_name(table)
+        return [tr for (t, _), tr in self.triggers.items() if t == table]
+
+
+def normalize_name(name):
+    """Table/index names compare without a public. prefix"""
+    return name[7:] if name.startswith('public.') else name
+
+
+def _name_at(tokens, i):
+    """(possibly schema-qualified name, index after it)"""
+    parts = [unquote_ident(tokens[i].text)]
+    i += 1
+    while i + 1 < len(tokens) and tokens[i].text == '.':
+        parts.append(unquote_ident(tokens[i + 1].text))
+        i += 2
+    return normalize_name('.'.join(parts)), i
+
+
+def _word(tok):
+    return tok.text.upper() if tok.kind == 'word' else tok.text
+
+
+def _skip_words(tokens, i, *words):
+    """Index after the given words if they follow at i, else i"""
+    if [_word(t) for t in tokens[i:i + len(words)]] == list(words):
+        return i + len(words)
+    return i
+
+
+def _closing_paren(tokens, i):
+    """Index of the ) matching the ( at tokens[i]"""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j].text == '(':
+            depth += 1
+        elif tokens[j].text == ')':
+            depth -= 1
+            if depth == 0:
+                return j
+    return len(tokens) - 1
+
+
+def _split_items(tokens, open_index):
+    """Token lists of the top-level comma-separated items inside a parenthesis"""
+    close = _closing_paren(tokens, open_index)
+    items = []
+    current = []
+    depth = 0
+    for tok in tokens[open_index + 1:close]:
+        if tok.text == '(':
+            depth += 1
+        elif tok.text == ')':
+            depth -= 1
+        if tok.text == ',' and depth == 0:
+            items.append(current)
+            current = []
+        else:
+            current.append(tok)
+    if current:
+        items.append(current)
+    return items, close
+
+
+def _text(sql, tokens):
+    """Source text spanned by a token list"""
+    if not tokens:
+        return ''
+    last = tokens[-1]
+    return sql[tokens[0].start:last.start + len(last.text)]
+
+
+def _name_list(tokens, i):
+    """Names in the parenthesis at tokens[i], and the index after it"""
+    if i >= len(tokens) or tokens[i].text != '(':
+        return (), i
+    items, close = _split_items(tokens, i)
+    return tuple(unquote_ident(item[0].text) for item in items if item), close + 1
+
+
+def _references(tokens, i, table, columns, source):
+    """ForeignKey for REFERENCES at tokens[i], and the index after it"""
+    ref_table, i = _name_at(tokens, i + 1)
+    ref_columns, i = _name_list(tokens, i)
+    on_delete = None
+    while i + 1 < len(tokens) and _word(tokens[i]) in ('ON', 'MATCH', 'DEFERRABLE', 'INITIALLY', 'NOT'):
+        if _word(tokens[i]) == 'ON':
+            action_start = i + 2
+            j = action_start
+            while j < len(tokens) and _word(tokens[j]) in _FK_ACTIONS | {'NULL', 'DEFAULT', 'ACTION'}:
+                j += 1
+            if _word(tokens[i + 1]) == 'DELETE':
+                on_delete = ' '.join(_word(t) for t in tokens[action_start:j])
+            i = j
+        else:
+            i += 1
+    return ForeignKey(table, tuple(columns), ref_table, ref_columns, on_delete, source), i
+
+
+def _parse_column(sql, table, item, source):
+    """Apply one column definition to table"""
+    name = unquote_ident(item[0].text)
+    i = 1
+    depth = 0
+    while i < len(item):
+        if item[i].text == '(':
+            depth += 1
+        elif item[i].text == ')':
+            depth -= 1
+        elif depth == 0 and _word(item[i]) in _COLUMN_CONSTRAINTS:
+            break
+        i += 1
+    column_type = _text(sql, item[1:i])
+    not_null = False
+    default = None
+    generated = None
+    while i < len(item):
+        word = _word(item[i])
+        if word == 'COLLATE' and i + 1 < len(item):
+            column_type += f' COLLATE {item[i + 1].text}'
+            i += 2
+        elif word == 'GENERATED':
+            # GENERATED {ALWAYS | BY DEFAULT} AS {IDENTITY [(...)] | (expr) STORED}
+            j = _skip_words(item, _skip_words(item, i + 1, 'ALWAYS'), 'BY', 'DEFAULT')
+            j = _skip_words(item, j, 'AS')
+            if j < len(item) and _word(item[j]) == 'IDENTITY':
+                j += 1
+                not_null = True
+            if j < len(item) and item[j].text == '(':
+                j = _closing_paren(item, j) + 1
+            j = _skip_words(item, j, 'STORED')
+            generated = _text(sql, item[i:j])
+            i = j
+        elif word == 'PRIMARY':
+            table.primary_key = (name,)
+            not_null = True
+            i += 2
+        elif word == 'UNIQUE':
+            table.uniques.append((name,))
+            i += 1
+        elif word == 'NOT' and i + 1 < len(item) and _word(item[i + 1]) == 'NULL':
+            not_null = True
+            i += 2
+        elif word == 'REFERENCES':
+            fk, i = _references(item, i, table.name, (name,), source)
+            table.foreign_keys.append(fk)
+        elif word == 'CHECK' and i + 1 < len(item):
+            close = _closing_paren(item, i + 1)
+            table.checks.append(_text(sql, item[i:close + 1]))
+            i = close + 1
+        elif word == 'DEFAULT':
+            j = i + 1
+            depth = 0
+            while j < len(item):
+                if item[j].text == '(':
+                    depth += 1
+                elif item[j].text == ')':
+                    depth -= 1
+                elif depth == 0 and _word(item[j]) in _COLUMN_CONSTRAINTS:
+                    break
+                j += 1
+            default = _text(sql, item[i + 1:j])
+            i = j
+        else:
+            i += 1
+    table.columns[name] = Column(name, column_type, not_null, default, _text(sql, item[1:]), generated)
+
+
+def _parse_table_constraint(sql, table, item, source):
+    i = 2 if _word(item[0]) == 'CONSTRAINT' else 0
+    word = _word(item[i]) if i < len(item) else None
+    if word == 'PRIMARY':
+        table.primary_key, _ = _name_list(item, i + 2)
+    elif word == 'UNIQUE':
+        columns, _ = _name_list(item, _skip_words(item, i + 1, 'NULLS', 'NOT', 'DISTINCT'))
+        table.uniques.append(columns)
+    elif word == 'FOREIGN':
+        columns, j = _name_list(item, i + 2)
+        if j < len(item) and _word(item[j]) == 'REFERENCES':
+            table.foreign_keys.append(_references(item, j, table.name, columns, source)[0])
+    elif word == 'CHECK':
+        # Named checks keep their CONSTRAINT name; NOT VALID only matters while adding it
+        if [_word(t) for t in item[-2:]] == ['NOT', 'VALID']:
+            item = item[:-2]
+        table.checks.append(_text(sql, item))
+
+
+def _parse_definition(sql, table, item, source):
+    if _word(item[0]) in _TABLE_CONSTRAINTS:
+        _parse_table_constraint(sql, table, item, source)
+    else:
+        _parse_column(sql, table, item, source)
+
+
+def _create_table(schema, sql, tokens, source):
+    i = 2
+    while i < len(tokens) and _word(tokens[i]) in ('TEMP', 'TEMPORARY', 'UNLOGGED', 'TABLE'):
+        i += 1
+    guarded = _skip_words(tokens, i, 'IF', 'NOT', 'EXISTS')
+    name, i = _name_at(tokens, guarded)
+    if name in schema.tables and guarded == i:
+        schema.conflicts.append((source, f'table {name} already exists'))
+    if name in schema.tables:
+        # IF NOT EXISTS on an existing table
+        return True
+    if [_word(t) for t in tokens[i:i + 2]] == ['PARTITION', 'OF']:
+        return _create_partition(schema, sql, tokens, name, i + 2, source)
+    if i >= len(tokens) or tokens[i].text != '(':
+        # CREATE TABLE ... AS
+        return False
+    table = Table(name, source)
+    items, close = _split_items(tokens, i)
+    for item in items:
+        if item:
+            _parse_definition(sql, table, item, source)
+    if [_word(t) for t in tokens[close + 1:close + 3]] == ['PARTITION', 'BY']:
+        table.partition_by = _text(sql, [t for t in tokens[close + 3:] if t.kind != 'semicolon'])
+    schema.tables[name] = table
+    return True
+
+
+def _partition_bound(sql, tokens):
+    """The FOR VALUES ... or DEFAULT bound of CREATE TABLE ... PARTITION OF or ATTACH PARTITION, or None"""
+    depth = 0
+    for j, tok in enumerate(tokens):
+        depth += (tok.text == '(') - (tok.text == ')')
+        if depth or tok.kind != 'word':
+            continue
+        if _word(tok) == 'DEFAULT':
+            return 'DEFAULT'
+        if _word(tok) == 'FOR' and j + 1 < len(tokens) and _word(tokens[j + 1]) == 'VALUES':
+            end = next((k for k in range(j, len(tokens)) if tokens[k].kind == 'semicolon'), len(tokens))
+            return _text(sql, tokens[j:end])
+    return None
+
+
+def _create_partition(schema, sql, tokens, name, i, source):
+    """CREATE TABLE name PARTITION OF parent ...: the partition has the parent's columns"""
+    parent_name, i = _name_at(tokens, i)
+    parent = schema.tables.get(parent_name)
+    if parent is None:
+        return False
+    table = Table(name, source)
+    table.columns = dict(parent.columns)
+    table.partition_of = parent_name
+    table.partition_bound = _partition_bound(sql, tokens[i:])
+    schema.tables[name] = table
+    return True
+
+
+def check_name(table, check):
+    """Name of a CHECK constraint: its own, or the one Postgres derives from the first column it uses"""
+    tokens = significant_tokens(check)
+    if tokens and _word(tokens[0]) == 'CONSTRAINT':
+        return unquote_ident(tokens[1].text)
+    column = next((unquote_ident(t.text) for t in tokens if unquote_ident(t.text) in table.columns), None)
+    return f'{table.name}_{column}_check' if column else f'{table.name}_check'
+
+
+def _drop_constraint(table, name):
+    """Forget a constraint by its explicit or Postgres-generated name"""
+    if name == f'{table.name}_pkey':
+        table.primary_key = ()
+    table.uniques = [key for key in table.uniques if f'{table.name}_{"_".join(key)}_key' != name]
+    table.foreign_keys = [fk for fk in table.foreign_keys if f'{table.name}_{"_".join(fk.columns)}_fkey' != name]
+    table.checks = [check for check in table.checks if check_name(table, check) != name]
+
+
+def alter_table_actions(tokens):
+    """(table name, token list of every action) of an ALTER TABLE statement's tokens"""
+    i = _skip_words(tokens, 2, 'IF', 'EXISTS')
+    i = _skip_words(tokens, i, 'ONLY')
+    name, i = _name_at(tokens, i)
+    # Split the action list at top-level commas
+    actions = []
+    current = []
+    depth = 0
+    for tok in tokens[i:]:
+        if tok.text == '(':
+            depth += 1
+        elif tok.text == ')':
+            depth -= 1
+        if (tok.text == ',' and depth == 0) or tok.kind == 'semicolon':
+            actions.append(current)
+            current = []
+        else:
+            current.append(tok)
+    if current:
+        actions.append(current)
+    return name, [action for action in actions if action]
+
+
+def dml_target(tokens):
+    """(table, columns) an INSERT, UPDATE or DELETE statement's tokens write, or None.
+
+    columns holds the target column names; an INSERT without a column list
+    gets one None per value of its first VALUES row instead.
+    """
+    verb = _word(tokens[0]) if tokens else None
+    if verb == 'INSERT' and _skip_words(tokens, 1, 'INTO') == 2:
+        table, i = _name_at(tokens, 2)
+        i = _skip_words(tokens, i, 'AS')
+        if i < len(tokens) and tokens[i].kind in ('word', 'quoted_ident') and _word(tokens[i]) not in (
+                'VALUES', 'SELECT', 'DEFAULT', 'OVERRIDING', 'WITH'):
+            i += 1
+        columns, i = _name_list(tokens, i)
+        if not columns and _skip_words(tokens, i, 'VALUES') == i + 1 and i + 1 < len(tokens):
+            items, _ = _split_items(tokens, i + 1)
+            columns = (None,) * len(items)
+        return table, columns
+    if verb == 'UPDATE':
+        table, i = _name_at(tokens, _skip_words(tokens, 1, 'ONLY'))
+        while i < len(tokens) and _word(tokens[i]) != 'SET':
+            i += 1
+        # Split the SET list at top-level commas; each item starts with its column or (column, ...)
+        items = [[]]
+        depth = 0
+        for tok in tokens[i + 1:]:
+            if depth == 0 and (_word(tok) in ('FROM', 'WHERE', 'RETURNING') or tok.kind == 'semicolon'):
+                break
+            if tok.text == '(':
+                depth += 1
+            elif tok.text == ')':
+                depth -= 1
+            if tok.text == ',' and depth == 0:
+                items.append([])
+            else:
+                items[-1].append(tok)
+        columns = []
+        for item in filter(None, items):
+            if item[0].text == '(':
+                columns.extend(_name_list(item, 0)[0])
+            else:
+                columns.append(unquote_ident(item[0].text))
+        return table, tuple(columns)
+    if verb == 'DELETE' and _skip_words(tokens, 1, 'FROM') == 2:
+        return _name_at(tokens, _skip_words(tokens, 2, 'ONLY'))[0], ()
+    return None
+
+
+def _rename_table(schema, table, new_name):
+    """Move a table and everything keyed by its name to new_name"""
+    old_name = table.name
+    del schema.tables[old_name]
+    table.name = new_name
+    table.foreign_keys = [fk._replace(table=new_name) for fk in table.foreign_keys]
+    schema.tables[new_name] = table
+    for name, index in list(schema.indexes.items()):
+        if index.table == old_name:
+            schema.indexes[name] = index._replace(table=new_name)
+    for objects in (schema.policies, schema.triggers):
+        for key in [key for key in objects if key[0] == old_name]:
+            objects[(new_name, key[1])] = objects.pop(key)._replace(table=new_name)
+    for other in schema.tables.values():
+        other.foreign_keys = [fk._replace(ref_table=new_name) if fk.ref_table == old_name else fk
+                              for fk in other.foreign_keys]
+        if other.partition_of == old_name:
+            other.partition_of = new_name
+
+
+def _alter_table(schema, sql, tokens, source):
+    name, actions = alter_table_actions(tokens)
+    table = schema.tables.get(name)
+    if table is None:
+        return False
+    handled = True
+    for action in actions:
+        words = [_word(t) for t in action[:6]]
+        if words[:1] == ['ADD']:
+            j = _skip_words(action, 1, 'COLUMN')
+            if _word(action[j]) in _TABLE_CONSTRAINTS and j == 1:
+                _parse_table_constraint(sql, table, action[j:], source)
+                continue
+            if [_word(t) for t in action[j:j + 3]] == ['IF', 'NOT', 'EXISTS']:
+                j += 3
+                if unquote_ident(action[j].text) in table.columns:
+                    continue
+            _parse_column(sql, table, action[j:], source)
+        elif words[:1] == ['DROP'] and words[1:2] != ['CONSTRAINT']:
+            j = _skip_words(action, 1, 'COLUMN')
+            j = _skip_words(action, j, 'IF', 'EXISTS')
+            column = unquote_ident(action[j].text)
+            table.columns.pop(column, None)
+            table.foreign_keys = [fk for fk in table.foreign_keys if column not in fk.columns]
+            table.uniques = [key for key in table.uniques if column not in key]
+            for index in schema.indexes_on(table.name):
+                if column in index.columns:
+                    del schema.indexes[index.name]
+        elif words[:2] == ['DROP', 'CONSTRAINT']:
+            j = _skip_words(action, 2, 'IF', 'EXISTS')
+            _drop_constraint(table, unquote_ident(action[j].text))
+        elif words[:2] == ['RENAME', 'TO']:
+            _rename_table(schema, table, _name_at(action, 2)[0])
+        elif words[:2] in (['ATTACH', 'PARTITION'], ['DETACH', 'PARTITION']):
+            partition = schema.tables.get(_name_at(action, 2)[0])
+            if partition is None:
+                handled = False
+            elif words[0] == 'ATTACH':
+                partition.partition_of = table.name
+                partition.partition_bound = _partition_bound(sql, action[3:])
+            else:
+                partition.partition_of = partition.partition_bound = None
+        elif words[:4] == ['ENABLE', 'ROW', 'LEVEL', 'SECURITY']:
+            table.rls = True
+        elif words[:4] == ['DISABLE', 'ROW', 'LEVEL', 'SECURITY']:
+            table.rls = False
+        elif words[:1] == ['ALTER']:
+            j = _skip_words(action, 1, 'COLUMN')
+            column = table.columns.get(unquote_ident(action[j].text))
+            if column is None:
+                continue
+            rest = [_word(t) for t in action[j + 1:j + 4]]
+            if rest[:3] == ['SET', 'NOT', 'NULL']:
+                column = column._replace(not_null=True)
+            elif rest[:3] == ['DROP', 'NOT', 'NULL']:
+                column = column._replace(not_null=False)
+            elif rest[:2] == ['SET', 'DEFAULT']:
+                column = column._replace(default=_text(sql, action[j + 3:]))
+            elif rest[:2] == ['DROP', 'DEFAULT']:
+                column = column._replace(default=None)
+            elif 'TYPE' in rest[:3]:
+                k = j + 1 + rest.index('TYPE') + 1
+                end = next((m for m in range(k, len(action)) if _word(action[m]) in ('USING', 'COLLATE')), len(action))
+                column = column._replace(type=_text(sql, action[k:end]))
+            table.columns[column.name] = column
+        else:
+            handled = False
+    return handled
+
+
+def _index_element(sql, item):
+    """(column name or None, element text) of one index element"""
+    if item[0].kind in ('word', 'quoted_ident') and all(
+            _word(t) in ('ASC', 'DESC', 'NULLS', 'FIRST', 'LAST') or t.kind == 'word' and k == 0
+            for k, t in enumerate(item)):
+        return unquote_ident(item[0].text), _text(sql, item)
+    return None, _text(sql, item)
+
+
+def _create_index(schema, sql, tokens, source):
+    unique = _word(tokens[1]) == 'UNIQUE'
+    i = 3 if unique else 2
+    i = _skip_words(tokens, i, 'CONCURRENTLY')
+    guarded = _skip_words(tokens, i, 'IF', 'NOT', 'EXISTS') != i
+    i = _skip_words(tokens, i, 'IF', 'NOT', 'EXISTS')
+    name = None
+    if _word(tokens[i]) != 'ON':
+        name, i = _name_at(tokens, i)
+    if i >= len(tokens) or _word(tokens[i]) != 'ON':
+        return False
+    i = _skip_words(tokens, i + 1, 'ONLY')
+    table, i = _name_at(tokens, i)
+    method = 'btree'
+    if i < len(tokens) and _word(tokens[i]) == 'USING':
+        method = tokens[i + 1].text.lower()
+        i += 2
+    if i >= len(tokens) or tokens[i].text != '(':
+        return False
+    items, close = _split_items(tokens, i)
+    elements = [_index_element(sql, item) for item in items if item]
+    where = None
+    rest = tokens[close + 1:]
+    for k, tok in enumerate(rest):
+        if _word(tok) == 'WHERE':
+            where = _text(sql, [t for t in rest[k + 1:] if t.kind != 'semicolon'])
+            break
+    if name is None:
+        name = f'{table}_{"_".join(c for c, _ in elements if c)}_idx'
+    if name in schema.indexes:
+        if not guarded:
+            schema.conflicts.append((source, f'index {name} already exists'))
+        return True
+    schema.indexes[name] = Index(name, table, tuple(c for c, _ in elements), tuple(e for _, e in elements),
+                                 unique, method, where, source)
+    return True
+
+
+def _create_policy(schema, stmt, source):
+    signature = policy_signature(stmt)
+    if signature is None:
+        return False
+    name, table = signature[0], normalize_name(signature[1])
+    if (table, name) in schema.policies:
+        schema.conflicts.append((source, f'policy "{name}" on {table} already exists'))
+        return True
+    words = list(stmt.head)
+    command = words[words.index('FOR') + 1] if 'FOR' in words[:-1] else 'ALL'
+    schema.policies[(table, name)] = Policy(name, table, command, stmt.text, source)
+    return True
+
+
+def _create_trigger(schema, stmt, source):
+    signature = trigger_signature(stmt)
+    if signature is None:
+        return False
+    name, table = signature[0], normalize_name(signature[1])
+    if (table, name) in schema.triggers and stmt.head[1:3] != ('OR', 'REPLACE'):
+        schema.conflicts.append((source, f'trigger {name} on {table} already exists'))
+        return True
+    schema.triggers[(table, name)] = Trigger(name, table, stmt.text, source)
+    return True
+
+
+def _drop_on(schema, objects, stmt, signature, kind, source):
+    """DROP POLICY/TRIGGER name ON table"""
+    if signature is None:
+        return False
+    key = (normalize_name(signature[1]), signature[0])
+    if objects.pop(key, None) is None and stmt.head[2:4] != ('IF', 'EXISTS'):
+        schema.conflicts.append((source, f'{kind} {key[1]} on {key[0]} does not exist'))
+    return True
+
+
+def function_name(tokens):
+    """Name of the function a CREATE/DROP FUNCTION or PROCEDURE statement's tokens name, or None"""
+    i = next((k for k, tok in enumerate(tokens[:6]) if _word(tok) in ('FUNCTION', 'PROCEDURE')), None)
+    if i is None:
+        return None
+    i = _skip_words(tokens, i + 1, 'IF', 'EXISTS')
+    if i >= len(tokens):
+        return None
+    return _name_at(tokens, i)[0]
+
+
+def _create_function(schema, stmt, source):
+    tokens = significant_tokens(stmt.text, limit=16)
+    name = function_name(tokens)
+    if name is None:
+        return False
+    if name in schema.functions and stmt.head[1:3] != ('OR', 'REPLACE'):
+        schema.conflicts.append((source, f'function {name} already exists'))
+    schema.functions[name] = Function(name, stmt.text, source)
+    return True
+
+
+def _drop(schema, tokens):
+    kind = _word(tokens[1])
+    i = _skip_words(tokens, 2, 'CONCURRENTLY')
+    i = _skip_words(tokens, i, 'IF', 'EXISTS')
+    while i < len(tokens):
+        name, i = _name_at(tokens, i)
+        if kind == 'TABLE':
+            schema.tables.pop(name, None)
+            for index in schema.indexes_on(name):
+                del schema.indexes[index.name]
+            for objects in (schema.policies, schema.triggers):
+                for key in [key for key in objects if key[0] == name]:
+                    del objects[key]
+        else:
+            schema.indexes.pop(name, None)
+        if i < len(tokens) and tokens[i].text == ',':
+            i += 1
+        else:
+            break
+    return True
+
+
+def apply_statement(schema, stmt, source):
+    """Replay one DDL statement; returns False for statements the model skips"""
+    head = stmt.head
+    if stmt.kind == 'function':
+        return _create_function(schema, stmt, source)
+    if head[:2] == ('CREATE', 'POLICY'):
+        return _create_policy(schema, stmt, source)
+    if head[:1] == ('CREATE',) and 'TRIGGER' in head[1:4]:
+        return _create_trigger(schema, stmt, source)
+    if head[:1] == ('CREATE',):
+        kind = next((w for w in head[1:4] if w in ('TABLE', 'INDEX')), None)
+        if kind is None or head[1] not in ('TABLE', 'INDEX', 'UNIQUE', 'TEMP', 'TEMPORARY', 'UNLOGGED'):
+            return False
+        tokens = significant_tokens(stmt.text)
+        if kind == 'TABLE':
+            return _create_table(schema, stmt.text, tokens, source)
+        return _create_index(schema, stmt.text, tokens, source)
+    if head[:2] == ('ALTER', 'TABLE'):
+        return _alter_table(schema, stmt.text, significant_tokens(stmt.text), source)
+    if head[:2] in (('DROP', 'TABLE'), ('DROP', 'INDEX')):
+        return _drop(schema, significant_tokens(stmt.text))
+    if head[:2] == ('DROP', 'POLICY'):
+        return _drop_on(schema, schema.policies, stmt, policy_signature(stmt), 'policy', source)
+    if head[:2] == ('DROP', 'TRIGGER'):
+        return _drop_on(schema, schema.triggers, stmt, trigger_signature(stmt), 'trigger', source)
+    if head[:2] in (('DROP', 'FUNCTION'), ('DROP', 'PROCEDURE')):
+        name = function_name(significant_tokens(stmt.text, limit=16))
+        if name is None:
+            return False
+        if schema.functions.pop(name, None) is None and head[2:4] != ('IF', 'EXISTS'):
+            schema.conflicts.append((source, f'function {name} does not exist'))
+        return True
+    return False
+
+
+def iter_ddl(sql, first_line=1, block=False):
+    """Yield (Statement, line) for every statement that runs at migration time.
+
+    DO block bodies are descended into, as are the halves of nested
+    DO $$ blocks that show up at the top level; function bodies are not.
+    """
+    for stmt in split_block(sql) if block else split_statements(sql):
+        if stmt.kind == 'trivia':
+            continue
+        line = first_line + stmt.line - 1
+        if stmt.kind == 'do':
+            if stmt.body is not None:
+                body_line = line + stmt.text.count('\n', 0, stmt.bodies[0][0])
+                yield from iter_ddl(stmt.body, body_line, block=True)
+            continue
+        if stmt.head[:1] in (('BEGIN',), ('IF',), ('ELSE',), ('ELSIF',)) and not block:
+            yield from iter_ddl(stmt.text, line, block=True)
+            continue
+        yield stmt, line
+
+
+def apply_sql(schema, sql, file_path=None):
+    for stmt, line in iter_ddl(sql):
+        if not apply_statement(schema, stmt, Source(file_path, line)):
+            if stmt.head[:2] in (('ALTER', 'TABLE'), ('DROP', 'TABLE'), ('DROP', 'INDEX')) or (
+                    stmt.head[:1] == ('CREATE',) and ('TABLE' in stmt.head[1:3] or 'INDEX' in stmt.head[1:3])):
+                schema.skipped.append(Source(file_path, line))
+    return schema
+
+
+def find_migrations(migration_dir=MIGRATION_DIR):
+    return sorted(glob.glob(os.path.join(migration_dir, "*.sql")))
+
+
+def load_schema(migration_dir=MIGRATION_DIR, files=None):
+    """Schema after replaying every migration in chronological order"""
+    schema = Schema()
+    for file_path in files if files is not None else find_migrations(migration_dir):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            apply_sql(schema, f.read(), file_path)
+    return schema
+
+
+def index_name(table, columns):
+    """idx_<table>_<columns>, shortened with a hash if Postgres would truncate it"""
+    name = f'idx_{table}_{"_".join(columns)}'
+    if len(name) <= MAX_IDENTIFIER:
+        return name
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+    return f'{name[:MAX_IDENTIFIER - 9]}_{digest}'
+
+
+def migration_path(migration_dir, name):
+    """Path for a new migration, timestamped so it sorts after the existing ones"""
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+    return os.path.join(migration_dir, f'{stamp}_{name}.sql')
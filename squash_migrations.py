@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""Squash the migrations into one baseline migration with the net final state.
+
+`supabase db reset` and the ephemeral test databases replay every migration,
+including objects later migrations drop and re-create. This replays the
+migrations up to --to (default: all of them) through the sql_schema model,
+with the existence checks resolved the way static_setup resolves them for an
+empty database, and writes one baseline with the net result:
+- every table with all of its columns and constraints folded in,
+- the final indexes, RLS settings, functions, policies and triggers,
+- the statements the model does not cover, in their original order.
+The baseline is replayed again and compared with the model before anything
+is written; since the uncovered statements run against the final schema,
+an INSERT, UPDATE or DELETE naming a table or column that no longer
+exists stops the squash too. It takes the version of the last migration it replaces, so
+databases that already applied that migration skip it. The superseded files
+are moved to --archive.
+
+The range always starts at the first migration: a baseline has to create
+everything, so it cannot start in the middle of the history.
+"""
+import os
+import re
+import sys
+import shutil
+import argparse
+
+from sql_lexer import significant_tokens, split_statements
+from sql_schema import (MIGRATION_DIR, Schema, Source, alter_table_actions, apply_statement, check_name,
+                        dml_target, find_migrations, iter_ddl)
+from static_setup import Stats, render_sql
+
+ARCHIVE_DIR = "supabase/migrations_archive"
+
+# Unmodelled statements that other objects may depend on; they go first
+_SETUP = (('CREATE', 'EXTENSION'), ('CREATE', 'SCHEMA'), ('CREATE', 'TYPE'), ('CREATE', 'SEQUENCE'),
+          ('CREATE', 'DOMAIN'))
+_BLOCK_WORDS = (('BEGIN',), ('END',), ('END', ';'))
+_IDENTIFIER = re.compile(r'[a-z_][a-z0-9_$]*\Z')
+_WORD = re.compile(r'[A-Za-z_][\w$]*')
+
+
+def replay(files):
+    """(Schema, [(Source, statement text)] of the statements the model does not cover)"""
+    guards = Schema()
+    stats = Stats()
+    schema = Schema()
+    others = []
+    for file_path in files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            sql = f.read()
+        replay_sql(render_sql(sql, guards, file_path, stats), schema, others, file_path)
+    return schema, others
+
+
+def _validates_only(stmt):
+    """True for ALTER TABLE ... VALIDATE CONSTRAINT; the baseline creates every constraint valid"""
+    if not stmt.starts_with('ALTER', 'TABLE'):
+        return False
+    _, actions = alter_table_actions(significant_tokens(stmt.text))
+    return bool(actions) and all(a[0].text.upper() == 'VALIDATE' for a in actions)
+
+
+def replay_sql(sql, schema, others, file_path=None):
+    """Apply plain DDL to schema, collecting what it does not model into others"""
+    for stmt in split_statements(sql):
+        if stmt.kind == 'trivia':
+            continue
+        source = Source(file_path, stmt.line)
+        if stmt.kind == 'do' or stmt.head[:1] in (('BEGIN',), ('IF',), ('ELSE',), ('ELSIF',)):
+            modelled = True
+            for inner, line in iter_ddl(stmt.text, stmt.line):
+                if not apply_statement(schema, inner, Source(file_path, line)) and inner.head not in _BLOCK_WORDS:
+                    modelled = False
+            # A block of nothing but modelled DDL is folded into the baseline objects
+            if not modelled:
+                others.append((source, stmt.text))
+        elif not apply_statement(schema, stmt, source) and not _validates_only(stmt):
+            others.append((source, stmt.text))
+
+
+def _ident(name):
+    return name if _IDENTIFIER.match(name) else '"' + name.replace('"', '""') + '"'
+
+
+def _statement(sql):
+    return sql.rstrip().rstrip(';').rstrip() + ';'
+
+
+def render_table(table):
+    if table.partition_of:
+        sql = f'CREATE TABLE {table.name} PARTITION OF {table.partition_of} {table.partition_bound};'
+        if table.rls:
+            sql += f'\nALTER TABLE {table.name} ENABLE ROW LEVEL SECURITY;'
+        return sql
+    lines = []
+    for c in table.columns.values():
+        line = f'  {_ident(c.name)} {c.type}'
+        if c.generated:
+            line += f' {c.generated}'
+        if c.default is not None:
+            line += f' DEFAULT {c.default}'
+        if c.not_null and not (c.generated and 'IDENTITY' in c.generated.upper()):
+            line += ' NOT NULL'
+        lines.append(line)
+    if table.primary_key:
+        lines.append(f'  PRIMARY KEY ({", ".join(map(_ident, table.primary_key))})')
+    for key in table.uniques:
+        lines.append(f'  UNIQUE ({", ".join(map(_ident, key))})')
+    for fk in table.foreign_keys:
+        line = f'  FOREIGN KEY ({", ".join(map(_ident, fk.columns))}) REFERENCES {fk.ref_table}'
+        if fk.ref_columns:
+            line += f' ({", ".join(map(_ident, fk.ref_columns))})'
+        if fk.on_delete:
+            line += f' ON DELETE {fk.on_delete}'
+        lines.append(line)
+    for check in table.checks:
+        lines.append(f'  {check}')
+    sql = f'CREATE TABLE {table.name} (\n' + ',\n'.join(lines) + '\n)'
+    sql += f' PARTITION BY {table.partition_by};' if table.partition_by else ';'
+    if table.rls:
+        sql += f'\nALTER TABLE {table.name} ENABLE ROW LEVEL SECURITY;'
+    return sql
+
+
+def render_index(index):
+    sql = f'CREATE {"UNIQUE " if index.unique else ""}INDEX {index.name} ON {index.table}'
+    if index.method != 'btree':
+        sql += f' USING {index.method}'
+    sql += f' ({", ".join(index.elements)})'
+    if index.where:
+        sql += f' WHERE {index.where}'
+    return sql + ';'
+
+
+def _mentions(sql, names):
+    """Which of names appear as words in sql"""
+    words = {w.lower() for w in _WORD.findall(sql)} | {m.lower() for m in re.findall(r'[\w$]+\.[\w$]+', sql)}
+    return {name for name in names if name.lower() in words}
+
+
+def baseline_objects(schema):
+    """[(Source, key, sql, dependency keys)] for every object of the schema"""
+    objects = []
+    tables = {f'table:{name}': name for name in schema.tables}
+    functions = {f'function:{name}': name for name in schema.functions}
+    table_keys = {name: key for key, name in tables.items()}
+    function_keys = {name: key for key, name in functions.items()}
+
+    def depends(sql, own_tables=()):
+        deps = {table_keys[t] for t in _mentions(sql, table_keys) if t not in own_tables}
+        deps |= {function_keys[f] for f in _mentions(sql, function_keys)}
+        return deps
+
+    for name, table in schema.tables.items():
+        sql = render_table(table)
+        deps = {table_keys[fk.ref_table] for fk in table.foreign_keys if fk.ref_table in table_keys and fk.ref_table != name}
+        if table.partition_of in table_keys:
+            deps.add(table_keys[table.partition_of])
+        expressions = ' '.join(filter(None, [c.default for c in table.columns.values()]
+                                      + [c.generated for c in table.columns.values()] + table.checks))
+        deps |= {function_keys[f] for f in _mentions(expressions, function_keys)}
+        objects.append((table.source, f'table:{name}', sql, deps))
+    for name, function in schema.functions.items():
+        # A function body may use the tables; only its signature has to resolve when it is created
+        signature = function.sql.split('$', 1)[0]
+        objects.append((function.source, f'function:{name}', _statement(function.sql), depends(signature)))
+    for index in schema.indexes.values():
+        deps = {table_keys[index.table]} if index.table in table_keys else set()
+        deps |= {function_keys[f] for f in _mentions(' '.join(index.elements), function_keys)}
+        objects.append((index.source, f'index:{index.name}', render_index(index), deps))
+    for (table, name), policy in schema.policies.items():
+        deps = {table_keys[table]} if table in table_keys else set()
+        objects.append((policy.source, f'policy:{table}:{name}', _statement(policy.sql), deps | depends(policy.sql, (table,))))
+    for (table, name), trigger in schema.triggers.items():
+        deps = {table_keys[table]} if table in table_keys else set()
+        objects.append((trigger.source, f'trigger:{table}:{name}', _statement(trigger.sql), deps | depends(trigger.sql, (table,))))
+    return objects
+
+
+def order_objects(objects, files):
+    """objects in migration order, each moved after the objects it depends on"""
+    position = {f: n for n, f in enumerate(files)}
+    pending = sorted(objects, key=lambda o: (position.get(o[0].file, -1), o[0].line) if o[0] else (-1, 0))
+    emitted = set()
+    ordered = []
+    while pending:
+        for n, obj in enumerate(pending):
+            if obj[3] <= emitted | {obj[1]}:
+                break
+        else:
+            # A dependency cycle: fall back to migration order
+            n = 0
+        obj = pending.pop(n)
+        emitted.add(obj[1])
+        ordered.append(obj)
+    return ordered
+
+
+def render_baseline(schema, others, files):
+    setup = [sql for _, sql in others if any(split_statements(sql)[0].starts_with(*h) for h in _SETUP)]
+    rest = [sql for _, sql in others if sql not in setup]
+    names = ', '.join(os.path.basename(f) for f in files)
+    sections = [f'-- Baseline squashed by squash_migrations.py from {len(files)} migrations:\n-- {names}']
+    if setup:
+        sections.append('\n'.join(_statement(sql) for sql in setup))
+    sections.append('\n\n'.join(sql for _, _, sql, _ in order_objects(baseline_objects(schema), files)))
+    if rest:
+        sections.append('-- Statements the schema model does not cover, in migration order\n'
+                        + '\n\n'.join(_statement(sql) for sql in rest))
+    return '\n\n'.join(sections) + '\n'
+
+
+def _normalize(sql):
+    return re.sub(r'\s+', ' ', sql.strip().rstrip(';')).lower()
+
+
+def fingerprint(schema):
+    """Comparable description of a schema, without where each object came from"""
+    tables = {}
+    for name, t in schema.tables.items():
+        tables[name] = (
+            tuple((c.name, _normalize(c.type), c.not_null, c.default and _normalize(c.default),
+                   c.generated and _normalize(c.generated)) for c in t.columns.values()),
+            tuple(t.primary_key), frozenset(map(tuple, t.uniques)),
+            frozenset((fk.columns, fk.ref_table, fk.ref_columns, fk.on_delete) for fk in t.foreign_keys),
+            frozenset((check_name(t, c), _normalize(c.split('CHECK', 1)[-1] if 'CHECK' in c else c))
+                      for c in t.checks),
+            t.rls,
+            t.partition_by and _normalize(t.partition_by),
+            t.partition_of, t.partition_bound and _normalize(t.partition_bound),
+        )
+    return {
+        'tables': tables,
+        'indexes': {n: (i.table, tuple(map(_normalize, i.elements)), i.unique, i.method, i.where and _normalize(i.where))
+                    for n, i in schema.indexes.items()},
+        'policies': {k: _normalize(p.sql) for k, p in schema.policies.items()},
+        'triggers': {k: _normalize(t.sql) for k, t in schema.triggers.items()},
+        'functions': {k: _normalize(f.sql) for k, f in schema.functions.items()},
+    }
+
+
+def _creates_relation(stmt):
+    """True for the unmodelled CREATE statements that make something an INSERT can target, like views"""
+    words = stmt.head[:6]
+    return words[:1] == ('CREATE',) and ('VIEW' in words or 'TABLE' in words)
+
+
+def check_dml(schema, others):
+    """Data statements among others that name a table or column the schema lacks, as messages.
+
+    The baseline runs them after the final schema, not at their place in
+    the history, so a row written to a column a later migration drops
+    would fail on a fresh database.
+    """
+    problems = []
+    # Views and CREATE TABLE AS are not modelled; leave the names they create alone
+    created = ' '.join(stmt.text for _, sql in others for stmt, _ in iter_ddl(sql) if _creates_relation(stmt))
+    for source, sql in others:
+        for stmt, line in iter_ddl(sql, source.line):
+            if stmt.head[:1] not in (('INSERT',), ('UPDATE',), ('DELETE',)):
+                continue
+            target = dml_target(significant_tokens(stmt.text))
+            if target is None:
+                continue
+            name, columns = target
+            verb = stmt.head[0]
+            table = schema.table(name)
+            if table is None:
+                # Other schemas (auth.users) and views are not modelled
+                if '.' not in name and not _mentions(created, {name}):
+                    problems.append(f'{verb} at baseline line {line}: table {name} is not in the final schema')
+                continue
+            if columns and columns[0] is None:
+                if len(columns) > len(table.columns):
+                    problems.append(f'{verb} at baseline line {line}: {len(columns)} values for the '
+                                    f'{len(table.columns)} columns of {name}')
+                continue
+            for column in columns:
+                if column not in table.columns:
+                    problems.append(f'{verb} at baseline line {line}: column {name}.{column} is not in the final schema')
+    return problems
+
+
+def verify(schema, baseline):
+    """Differences between schema and the schema the baseline builds, as messages"""
+    rebuilt = Schema()
+    others = []
+    replay_sql(baseline, rebuilt, others)
+    expected, actual = fingerprint(schema), fingerprint(rebuilt)
+    problems = []
+    for kind in expected:
+        for key in sorted(set(expected[kind]) | set(actual[kind]), key=str):
+            if key not in actual[kind]:
+                problems.append(f'{kind[:-1]} {key} is missing from the baseline')
+            elif key not in expected[kind]:
+                problems.append(f'{kind[:-1]} {key} is only in the baseline')
+            elif expected[kind][key] != actual[kind][key]:
+                problems.append(f'{kind[:-1]} {key} differs')
+    problems.extend(f'baseline conflict: {message}' for _, message in rebuilt.conflicts)
+    problems.extend(check_dml(rebuilt, others))
+    return problems
+
+
+def _version(file_path):
+    return os.path.basename(file_path).split('_', 1)[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Squash the migrations into one baseline migration.")
+    parser.add_argument('--dir', default=MIGRATION_DIR, help=f"migration directory (default: {MIGRATION_DIR})")
+    parser.add_argument('--to', help="last migration version to squash (default: all of them)")
+    parser.add_argument('--archive', default=ARCHIVE_DIR, help=f"where superseded files go (default: {ARCHIVE_DIR})")
+    parser.add_argument('--dry-run', action='store_true', help="print the baseline instead of writing it")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.dir):
+        print(f"Migration directory {args.dir} not found!")
+        return 1
+    files = [f for f in find_migrations(args.dir) if args.to is None or _version(f) <= args.to]
+    if len(files) < 2:
+        print("Nothing to squash.")
+        return 0
+
+    schema, others = replay(files)
+    baseline = render_baseline(schema, others, files)
+    problems = verify(schema, baseline)
+    if problems:
+        print("The baseline does not rebuild the replayed schema; nothing written or archived:")
+        for problem in problems:
+            print(f"  ✗ {problem}")
+        return 1
+    print(f"Squashed {len(files)} migrations: {len(schema.tables)} tables, {len(schema.indexes)} indexes, "
+          f"{len(schema.policies)} policies, {len(schema.functions)} functions, {len(schema.triggers)} triggers, "
+          f"{len(others)} other statements. Verified against the replayed schema.")
+    if args.dry_run:
+        print()
+        print(baseline)
+        return 0
+
+    os.makedirs(args.archive, exist_ok=True)
+    for file_path in files:
+        shutil.move(file_path, os.path.join(args.archive, os.path.basename(file_path)))
+    output = os.path.join(args.dir, f'{_version(files[-1])}_baseline.sql')
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(baseline)
+    print(f"Archived {len(files)} migrations to {args.archive}")
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
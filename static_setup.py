@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""Render the migrations as plain DDL for setting up a fresh database.
+
+The idempotent migrations guard every policy, column, table and index: DO
+blocks that look in pg_policies or information_schema before creating
+something, and IF [NOT] EXISTS clauses. Applying the full history to an
+empty database runs every one of those lookups. This replays the migrations
+through the sql_schema model instead and answers each existence check when
+the file is generated. A guard whose object is missing is unwrapped to its
+DDL, one whose object exists is dropped, and IF [NOT] EXISTS clauses are
+dropped or resolved the same way. Because those answers only hold for an
+empty database, the output starts with a single guarded preamble that
+refuses to run anywhere else. Guards the model cannot answer (other
+schemas, EXECUTE, conditions it does not parse) are kept as they are.
+"""
+import os
+import re
+import sys
+import argparse
+import textwrap
+
+from sql_lexer import join_segments, policy_signature, significant_tokens, split_block, split_statements, \
+    trigger_signature
+from sql_schema import (MIGRATION_DIR, Schema, Source, alter_table_actions, apply_statement, find_migrations,
+                        function_name, iter_ddl, normalize_name)
+
+OUTPUT = "supabase/fresh_setup.sql"
+
+# DO $$ BEGIN IF [NOT] EXISTS (SELECT 1 FROM <catalog> WHERE a = 'x' AND ...) THEN <ddl> END IF; END $$
+_GUARD = re.compile(r'''\A\s*BEGIN\s+IF\s+(NOT\s+)?EXISTS\s*\(\s*SELECT\s+1\s+FROM\s+([\w.]+)\s+WHERE\s+([^()]*?)\)\s*
+    THEN\b(.*)\bEND\s+IF\s*;\s*END\s*;?\s*\Z''', re.IGNORECASE | re.DOTALL | re.VERBOSE)
+_CONDITION = re.compile(r"\s*(\w+)\s*=\s*'((?:[^']|'')*)'\s*\Z")
+
+# Catalog -> (object kind, {column: field})
+CATALOGS = {
+    'pg_policies': ('policy', {'tablename': 'table', 'policyname': 'name', 'polname': 'name', 'schemaname': 'schema'}),
+    'information_schema.columns': ('column', {'table_name': 'table', 'column_name': 'name', 'table_schema': 'schema'}),
+    'information_schema.tables': ('table', {'table_name': 'name', 'table_schema': 'schema'}),
+    'pg_indexes': ('index', {'indexname': 'name', 'tablename': 'table', 'schemaname': 'schema'}),
+    'pg_trigger': ('trigger', {'tgname': 'name'}),
+    'pg_proc': ('function', {'proname': 'name'}),
+}
+
+# Statements of a guard body that only make sense inside PL/pgSQL
+_PLPGSQL = frozenset(('EXECUTE', 'RAISE', 'PERFORM', 'IF', 'ELSIF', 'ELSE', 'END', 'BEGIN', 'DECLARE', 'RETURN',
+                      'LOOP', 'FOR', 'WHILE', 'GET', 'NULL', 'EXCEPTION', 'WHEN'))
+
+
+class Stats:
+    """What the rendering resolved statically and what it had to keep"""
+
+    def __init__(self):
+        self.resolved = 0
+        self.kept = []
+        self.tables = []
+
+
+def parse_guard(stmt):
+    """(negated, kind, {field: value}, body, body offset in stmt.body) of an existence-guarded DO block, or None"""
+    if stmt.kind != 'do' or len(stmt.bodies) != 1:
+        return None
+    match = _GUARD.match(stmt.body)
+    if not match:
+        return None
+    negated, catalog, where, body = match.groups()
+    if catalog.lower() not in CATALOGS:
+        return None
+    kind, columns = CATALOGS[catalog.lower()]
+    fields = {}
+    for condition in re.split(r'\s+AND\s+', where.strip(), flags=re.IGNORECASE):
+        m = _CONDITION.match(condition)
+        if not m or m.group(1).lower() not in columns:
+            return None
+        fields[columns[m.group(1).lower()]] = m.group(2).replace("''", "'")
+    if 'name' not in fields or fields.get('schema', 'public') != 'public':
+        return None
+    return bool(negated), kind, fields, body, match.start(4)
+
+
+def object_exists(schema, kind, fields):
+    """True/False if the model knows whether the object exists, None if it cannot tell"""
+    name = fields['name']
+    table = fields.get('table')
+    if kind == 'policy':
+        return any(n == name and (table is None or t == table) for t, n in schema.policies)
+    if kind == 'trigger':
+        return any(n == name for _, n in schema.triggers)
+    if kind == 'function':
+        return name in schema.functions
+    if kind == 'index':
+        return name in schema.indexes
+    if kind == 'table':
+        # Only a table pinned to public is known to be missing; other schemas are not modelled
+        return True if schema.table(name) else (False if fields.get('schema') == 'public' else None)
+    if kind == 'column':
+        t = schema.table(table) if table else None
+        return None if t is None else name in t.columns
+    return None
+
+
+def _cut(text, tokens, i, n):
+    """text without the n tokens starting at tokens[i] and the space after them"""
+    return text[:tokens[i].start] + text[tokens[i + n].start:]
+
+
+def _words(tokens):
+    return [tok.text.upper() if tok.kind == 'word' else tok.text for tok in tokens]
+
+
+def resolve_if_exists(stmt, schema):
+    """Plain form of a CREATE ... IF NOT EXISTS / DROP ... IF EXISTS statement.
+
+    Returns the statement without the clause, '' if it would do nothing, or
+    None if there is no clause or the model cannot tell.
+    """
+    head = stmt.head
+    tokens = significant_tokens(stmt.text)
+    words = _words(tokens)
+    if head[:1] == ('CREATE',) and ('TABLE' in head[1:3] or 'INDEX' in head[1:4]):
+        i = next((k for k in range(2, 5) if words[k:k + 3] == ['IF', 'NOT', 'EXISTS']), None)
+        if i is None or '.' in words[i + 3:i + 5] and words[i + 3].lower() != 'public':
+            return None
+        name = normalize_name(tokens[i + 3].text.strip('"'))
+        exists = schema.table(name) is not None if 'TABLE' in head[1:3] else name in schema.indexes
+        return '' if exists else _cut(stmt.text, tokens, i, 3)
+    if head[:1] == ('DROP',) and head[2:4] == ('IF', 'EXISTS') and ',' not in words:
+        kind = head[1]
+        if kind == 'POLICY':
+            signature = policy_signature(stmt)
+            exists = signature and (normalize_name(signature[1]), signature[0]) in schema.policies
+        elif kind == 'TRIGGER':
+            signature = trigger_signature(stmt)
+            exists = signature and (normalize_name(signature[1]), signature[0]) in schema.triggers
+        elif kind in ('FUNCTION', 'PROCEDURE'):
+            exists = function_name(tokens) in schema.functions
+        elif kind in ('TABLE', 'INDEX'):
+            if '.' in words[4:6] and words[4].lower() != 'public':
+                return None
+            name = normalize_name(tokens[4].text.strip('"'))
+            exists = schema.table(name) is not None if kind == 'TABLE' else name in schema.indexes
+        else:
+            return None
+        return _cut(stmt.text, tokens, 2, 2) if exists else ''
+    if head[:2] == ('ALTER', 'TABLE'):
+        name, actions = alter_table_actions(tokens)
+        table = schema.table(name)
+        if table is None or not actions or not all(_words(a[:1]) == ['ADD'] for a in actions):
+            return None
+        kept = []
+        changed = False
+        for action in actions:
+            j = 2 if _words(action[1:2]) == ['COLUMN'] else 1
+            if _words(action[j:j + 3]) != ['IF', 'NOT', 'EXISTS']:
+                if j == 1 and _words(action[1:2])[0] in ('CONSTRAINT', 'PRIMARY', 'UNIQUE', 'CHECK', 'FOREIGN',
+                                                          'EXCLUDE'):
+                    return None
+                kept.append(stmt.text[action[0].start:action[-1].start + len(action[-1].text)])
+                continue
+            changed = True
+            column = action[j + 3].text.strip('"')
+            if column not in table.columns:
+                end = action[-1].start + len(action[-1].text)
+                kept.append(stmt.text[action[0].start:action[j].start] + stmt.text[action[j + 3].start:end])
+        if not changed:
+            return None
+        if not kept:
+            return ''
+        prefix = stmt.text[:actions[0][0].start]
+        separator = ',\n  ' if '\n' in stmt.text else ', '
+        return prefix.rstrip() + (' ' if separator == ', ' else '\n  ') + separator.join(kept) + ';'
+    return None
+
+
+def render_sql(sql, schema, file_path, stats, first_line=1):
+    """sql with every existence check the model can answer resolved, replaying it into schema"""
+    out = []
+    for stmt in split_statements(sql):
+        if stmt.kind == 'trivia':
+            out.append(stmt)
+            continue
+        line = first_line + stmt.line - 1
+        source = Source(file_path, line)
+        guard = parse_guard(stmt)
+        if guard is not None:
+            negated, kind, fields, body, offset = guard
+            exists = object_exists(schema, kind, fields)
+            inner = [s for s in split_block(body) if s.kind != 'trivia']
+            if exists is not None and inner and not any(s.head[0] in _PLPGSQL for s in inner):
+                stats.resolved += 1
+                if exists == negated:
+                    out.append('')
+                    continue
+                # Line of the first statement inside the guard
+                tag_length = len(stmt.text[stmt.bodies[0][0]:].split('$', 2)[1]) + 2
+                body_start = stmt.bodies[0][0] + tag_length + offset
+                body_line = line + stmt.text.count('\n', 0, body_start) + body[:len(body) - len(body.lstrip())].count('\n')
+                out.append(render_sql(textwrap.dedent(body).strip(), schema, file_path, stats, body_line))
+                continue
+        if stmt.kind == 'do' or stmt.head[:1] in (('BEGIN',), ('IF',), ('ELSE',), ('ELSIF',)):
+            # Kept as is; replay what it may create
+            stats.kept.append(source)
+            for inner, inner_line in iter_ddl(stmt.text, line):
+                apply_statement(schema, inner, Source(file_path, inner_line))
+            out.append(stmt)
+            continue
+        text = resolve_if_exists(stmt, schema) if stmt.kind == 'statement' else None
+        if text is not None:
+            stats.resolved += 1
+        if text != '':
+            before = set(schema.tables)
+            apply_statement(schema, stmt, source)
+            stats.tables.extend(t for t in schema.tables if t not in before and '.' not in t)
+        out.append(stmt if text is None else text)
+    return join_segments(out, squeeze=True)
+
+
+def render_preamble(tables, count):
+    header = f'''-- Fresh-database setup rendered by static_setup.py from {count} migrations.
+-- Every existence check of the migrations was answered when this file was
+-- generated, which only holds for an empty database: this block refuses to
+-- run anywhere else. Apply supabase/migrations to existing databases.
+'''
+    if not tables:
+        return header
+    names = ', '.join(f"'{t}'" for t in dict.fromkeys(tables))
+    return header + f'''DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_schema = 'public' AND table_name IN ({names})) THEN
+    RAISE EXCEPTION 'fresh_setup.sql only applies to an empty database';
+  END IF;
+END $$;
+'''
+
+
+def render_setup(files):
+    """(setup SQL, Schema, Stats) for the migrations in files, in order"""
+    schema = Schema()
+    stats = Stats()
+    sections = []
+    for file_path in files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            sql = f.read()
+        rendered = render_sql(sql, schema, file_path, stats).strip()
+        sections.append(f'-- ===== {os.path.basename(file_path)} =====\n{rendered}\n')
+    return render_preamble(stats.tables, len(files)) + '\n' + '\n'.join(sections), schema, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the migrations as plain DDL for a fresh database.")
+    parser.add_argument('--dir', default=MIGRATION_DIR, help=f"migration directory (default: {MIGRATION_DIR})")
+    parser.add_argument('--output', default=OUTPUT, help=f"setup file to write (default: {OUTPUT})")
+    parser.add_argument('--dry-run', action='store_true', help="print the setup SQL instead of writing it")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.dir):
+        print(f"Migration directory {args.dir} not found!")
+        return 1
+    files = find_migrations(args.dir)
+    sql, schema, stats = render_setup(files)
+    if args.dry_run:
+        print(sql)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(sql)
+    print(f"Resolved {stats.resolved} existence checks statically, kept {len(stats.kept)} blocks it cannot answer",
+          file=sys.stderr if args.dry_run else sys.stdout)
+    for source, message in schema.conflicts:
+        print(f"  ✗ {source.file}:{source.line}: {message}", file=sys.stderr)
+    if not args.dry_run:
+        print(f"Wrote {args.output}")
+    return 1 if schema.conflicts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
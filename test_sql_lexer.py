@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Checks for sql_lexer and the fixers built on it.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+import os
+
+import pytest
+
+import migrate_fix
+import squash_migrations
+from sql_lexer import (closes_nested_do, join_segments, opens_nested_do, significant_tokens, split_statements,
+                       tokenize)
+from sql_schema import MIGRATION_DIR, find_migrations
+from ultimate_migration_fixer import fix_functions_and_triggers
+from validate_migrations import check_sql
+
+SAMPLES = [
+    "SELECT 1;\nSELECT 2",
+    "SELECT $tag$ a $$ ; b $tag$; SELECT $1;",
+    "/* a /* b */ ; */ SELECT 1; -- x ; y\nSELECT 2;\n",
+    "SELECT 'it''s ; $$', \"a;b\", E'it\\'s;';",
+    "DO $$\nBEGIN\n  DO $$\n  BEGIN\n    NULL;\n  END $$;\nEND $$;\n",
+    "CREATE FUNCTION f() RETURNS trigger LANGUAGE plpgsql AS $fn$\nBEGIN\n  RETURN NEW;\nEND;\n$fn$;\n",
+    "",
+    "   \n-- only a comment",
+]
+
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), MIGRATION_DIR)
+
+
+def migrations():
+    return find_migrations(MIGRATIONS) if os.path.isdir(MIGRATIONS) else []
+
+
+def _read(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('sql', SAMPLES + [_read(f) for f in migrations()])
+def test_round_trip(sql):
+    assert ''.join(tok.text for tok in tokenize(sql)) == sql
+    assert join_segments(split_statements(sql)) == sql
+
+
+def test_dollar_quotes():
+    tokens = significant_tokens("SELECT $tag$ a $$ ; b $tag$; SELECT $1;")
+    assert [tok.kind for tok in tokens] == ['word', 'dollar', 'semicolon', 'word', 'param', 'semicolon']
+    assert tokens[1].text == '$tag$ a $$ ; b $tag$'
+    assert [s.head for s in split_statements("SELECT $tag$ ; $tag$; SELECT 2;") if s.kind != 'trivia'] == [
+        ('SELECT', '$tag$', ';'), ('SELECT', '2', ';')]
+
+
+def test_comments_and_strings_do_not_split():
+    statements = [s for s in split_statements(SAMPLES[2]) if s.kind != 'trivia']
+    assert [s.text for s in statements] == ['SELECT 1;', 'SELECT 2;']
+    assert statements[1].line == 2
+    assert len([s for s in split_statements(SAMPLES[3]) if s.kind != 'trivia']) == 1
+
+
+def test_nested_do():
+    statements = [s for s in split_statements(SAMPLES[4]) if s.kind != 'trivia']
+    # The inner $$ ends the outer body; "$$;\nEND $$" lexes as one string, so END ... ; closes it
+    assert [opens_nested_do(s) for s in statements] == [True, False]
+    assert [closes_nested_do(s) for s in statements] == [False, True]
+    # A function body that happens to end in DO is not a nested block
+    assert not opens_nested_do(split_statements("CREATE FUNCTION f() AS $$ SELECT 1 $$;")[0])
+
+
+def test_fix_functions_and_triggers_leaves_nested_do_alone():
+    assert fix_functions_and_triggers(SAMPLES[4]) == SAMPLES[4]
+    assert len(check_sql(fix_functions_and_triggers(SAMPLES[4]))) == len(check_sql(SAMPLES[4]))
+
+
+@pytest.mark.parametrize('file_path', migrations())
+def test_migrate_fix_fixed_point(file_path):
+    passes = migrate_fix.select_passes()
+    once = migrate_fix.run_passes(_read(file_path), passes)
+    assert migrate_fix.run_passes(once, passes) == once
+
+
+def test_squash_refuses_dml_on_dropped_column(tmp_path):
+    migration_dir = tmp_path / 'migrations'
+    archive = tmp_path / 'archive'
+    migration_dir.mkdir()
+    (migration_dir / '001_a.sql').write_text("CREATE TABLE t (id int PRIMARY KEY, legacy text NOT NULL);\n"
+                                            "INSERT INTO t (id, legacy) VALUES (1,'x');\n")
+    (migration_dir / '002_b.sql').write_text("ALTER TABLE t DROP COLUMN legacy;\nUPDATE t SET id=id;\n")
+    files = find_migrations(str(migration_dir))
+    schema, others = squash_migrations.replay(files)
+    problems = squash_migrations.verify(schema, squash_migrations.render_baseline(schema, others, files))
+    assert any('t.legacy' in problem for problem in problems)
+
+    assert squash_migrations.main(['--dir', str(migration_dir), '--archive', str(archive)]) == 1
+    assert sorted(os.listdir(migration_dir)) == ['001_a.sql', '002_b.sql']
+    assert not archive.exists()
+
+
+def test_squash_archives_when_dml_fits(tmp_path):
+    migration_dir = tmp_path / 'migrations'
+    migration_dir.mkdir()
+    (migration_dir / '001_a.sql').write_text("CREATE TABLE t (id int PRIMARY KEY, legacy text);\n"
+                                            "INSERT INTO t (id) VALUES (1);\n")
+    (migration_dir / '002_b.sql').write_text("ALTER TABLE t DROP COLUMN legacy;\nUPDATE t SET id=id;\n")
+    archive = tmp_path / 'archive'
+    assert squash_migrations.main(['--dir', str(migration_dir), '--archive', str(archive)]) == 0
+    assert sorted(os.listdir(archive)) == ['001_a.sql', '002_b.sql']
+    assert os.listdir(migration_dir) == ['002_baseline.sql']
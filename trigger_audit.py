@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""Inventory the row-level triggers of the migrations and guard the ones that fire on no-op updates.
+
+A row-level UPDATE trigger without a WHEN clause runs for every row an
+UPDATE touches, even when nothing changed - and an updated_at trigger then
+makes the row differ by bumping the timestamp. Such triggers are given a
+WHEN (OLD.* IS DISTINCT FROM NEW.*) guard. Only triggers whose function
+does nothing but assign NEW columns are guarded unless --all is given,
+since skipping a trigger with side effects changes what it does.
+
+A guard stops the trigger, not the UPDATE: Postgres still writes a new
+row version for an unchanged row. --suppress adds the built-in
+suppress_redundant_updates_trigger() to a table, which skips those writes
+altogether, at the cost of RETURNING and the row count no longer
+including the unchanged rows.
+
+The fan-out report counts, per table and event, the row triggers that run
+for one row, following the tables their functions write to.
+"""
+import os
+import sys
+import argparse
+from collections import namedtuple
+
+from sql_lexer import join_segments, rewrite_statements, significant_tokens, split_block, split_statements, trigger_signature
+from sql_schema import MIGRATION_DIR, Schema, apply_sql, find_migrations, load_schema, migration_path, normalize_name
+
+GUARD = 'WHEN (OLD.* IS DISTINCT FROM NEW.*)'
+
+# BEFORE triggers fire in name order; the suppressing one has to see the row after the others
+SUPPRESS_TRIGGER = 'zz_suppress_redundant_updates'
+
+# Column types without an equality operator; comparing OLD.* and NEW.* fails on rows that have one
+NO_EQUALITY = frozenset(('json', 'xml', 'point', 'line', 'lseg', 'box', 'path', 'polygon', 'circle'))
+
+EVENTS = ('INSERT', 'UPDATE', 'DELETE', 'TRUNCATE')
+
+# One CREATE TRIGGER; events is a tuple of EVENTS, columns the UPDATE OF list
+TriggerInfo = namedtuple('TriggerInfo', 'name table timing events columns level when function constraint source')
+
+# One row-level trigger that runs on no-op updates; guard is the rewritten statement, or None with the reason
+Finding = namedtuple('Finding', 'trigger guard reason')
+
+
+def _words(tokens):
+    return [tok.text.upper() if tok.kind == 'word' else tok.text for tok in tokens]
+
+
+def _name(tokens, i):
+    """(possibly schema-qualified name at tokens[i], index after it)"""
+    parts = [tokens[i].text.strip('"')]
+    i += 1
+    while i + 1 < len(tokens) and tokens[i].text == '.':
+        parts.append(tokens[i + 1].text.strip('"'))
+        i += 2
+    return '.'.join(parts), i
+
+
+def parse_trigger(sql, source=None):
+    """TriggerInfo of a CREATE TRIGGER statement, or None"""
+    stmt = split_statements(sql)
+    stmt = next((s for s in stmt if s.kind != 'trivia'), None)
+    signature = stmt and stmt.starts_with('CREATE') and trigger_signature(stmt)
+    if not signature:
+        return None
+    tokens = significant_tokens(sql)
+    words = _words(tokens)
+    i = words.index('TRIGGER') + 2
+    if words[i:i + 2] == ['INSTEAD', 'OF']:
+        timing, i = 'INSTEAD OF', i + 2
+    else:
+        timing, i = words[i], i + 1
+    events = []
+    columns = ()
+    while i < len(words) and words[i] in EVENTS:
+        events.append(words[i])
+        i += 1
+        if words[i - 1] == 'UPDATE' and words[i:i + 1] == ['OF']:
+            i += 1
+            names = []
+            while i < len(words) and words[i] not in ('OR', 'ON'):
+                if words[i] != ',':
+                    names.append(tokens[i].text.strip('"'))
+                i += 1
+            columns = tuple(names)
+        if words[i:i + 1] == ['OR']:
+            i += 1
+    level = 'STATEMENT'
+    when = function = None
+    for j in range(i, len(words)):
+        if words[j] == 'FOR':
+            k = j + 2 if words[j + 1:j + 2] == ['EACH'] else j + 1
+            if words[k:k + 1] in (['ROW'], ['STATEMENT']):
+                level = words[k]
+        elif words[j] == 'WHEN' and when is None and function is None:
+            when = j
+        elif words[j] == 'EXECUTE' and words[j + 1:j + 2] in (['FUNCTION'], ['PROCEDURE']) and j + 2 < len(words):
+            function = normalize_name(_name(tokens, j + 2)[0])
+            break
+    when_text = None
+    if when is not None:
+        execute = next(j for j in range(when, len(words)) if words[j] == 'EXECUTE')
+        when_text = sql[tokens[when].start:tokens[execute].start].strip()
+    return TriggerInfo(signature[0], normalize_name(signature[1]), timing, tuple(events), columns, level, when_text,
+                       function, 'CONSTRAINT' in words[:4], source)
+
+
+def _function_statements(function_sql):
+    """The statements of a PL/pgSQL function body between its outer BEGIN and END, or None"""
+    stmt = next((s for s in split_statements(function_sql) if s.kind == 'function'), None)
+    if stmt is None or stmt.body is None:
+        return None
+    body = [s for s in split_block(stmt.body) if s.kind != 'trivia']
+    if not body or body[0].head[:1] != ('BEGIN',) or body[-1].head[:1] != ('END',):
+        return None
+    return body[1:-1]
+
+
+def touched_columns(function_sql):
+    """NEW columns a trigger function assigns if that is all it does before RETURN NEW, else None"""
+    statements = _function_statements(function_sql)
+    if statements is None:
+        return None
+    columns = []
+    for stmt in statements:
+        head = stmt.head
+        if head[:2] == ('RETURN', 'NEW') and head[2:] == (';',):
+            continue
+        if head[:2] != ('NEW', '.') or len(head) < 4 or head[3] not in ('=', ':'):
+            return None
+        if 'SELECT' in head or 'PERFORM' in head:
+            return None
+        columns.append(significant_tokens(stmt.text)[2].text.strip('"'))
+    return columns if statements and statements[-1].head[:2] == ('RETURN', 'NEW') else None
+
+
+def function_writes(function_sql):
+    """[(event, table)] for every INSERT, UPDATE and DELETE in a function body"""
+    stmt = next((s for s in split_statements(function_sql) if s.kind == 'function'), None)
+    if stmt is None or stmt.body is None:
+        return []
+    tokens = significant_tokens(stmt.body)
+    words = _words(tokens)
+    writes = []
+    for i, word in enumerate(words[:-1]):
+        if word == 'INSERT' and words[i + 1] == 'INTO' and i + 2 < len(words):
+            target = normalize_name(_name(tokens, i + 2)[0])
+            writes.append(('INSERT', target))
+        elif word == 'UPDATE' and words[i - 1:i] == ['DO'] and writes and writes[-1][0] == 'INSERT':
+            # INSERT ... ON CONFLICT DO UPDATE updates the insert's own table
+            writes.append(('UPDATE', writes[-1][1]))
+        elif word == 'UPDATE' and tokens[i + 1].kind == 'word' and words[i + 1] != 'SET' and words[i - 1:i] != ['FOR']:
+            writes.append(('UPDATE', normalize_name(_name(tokens, i + 1)[0])))
+        elif word == 'DELETE' and words[i + 1] == 'FROM' and i + 2 < len(words):
+            writes.append(('DELETE', normalize_name(_name(tokens, i + 2)[0])))
+    return list(dict.fromkeys(writes))
+
+
+def _incomparable(table):
+    """Columns of a Table whose type has no equality operator"""
+    found = []
+    for column in table.columns.values():
+        base = column.type.lower().split('(')[0].rstrip('[] ')
+        if base in NO_EQUALITY:
+            found.append(column.name)
+    return found
+
+
+def add_guard(sql):
+    """CREATE TRIGGER text with the change-detection guard before its EXECUTE, laid out like the rest"""
+    tokens = significant_tokens(sql)
+    execute = next(tok for tok in tokens if tok.kind == 'word' and tok.text.upper() == 'EXECUTE')
+    line_start = sql.rfind('\n', 0, execute.start) + 1
+    prefix = sql[line_start:execute.start]
+    if prefix.strip():
+        # "FOR EACH ROW EXECUTE ..." on one line
+        return f'{sql[:execute.start]}{GUARD} {sql[execute.start:]}'
+    return f'{sql[:execute.start]}{GUARD}\n{prefix}{sql[execute.start:]}'
+
+
+def check_trigger(trigger, sql, schema, include_all=False):
+    """Finding for a trigger that runs on no-op updates, or None if it skips them already"""
+    if (trigger.level != 'ROW' or 'UPDATE' not in trigger.events or trigger.when or trigger.columns
+            or trigger.timing == 'INSTEAD OF'):
+        return None
+    if trigger.constraint:
+        return Finding(trigger, None, 'constraint trigger')
+    if trigger.events != ('UPDATE',):
+        other = ' and '.join(e for e in trigger.events if e != 'UPDATE')
+        return Finding(trigger, None, f'also fires on {other}; give UPDATE a trigger of its own to guard it')
+    table = schema.tables.get(trigger.table)
+    if table is None:
+        return Finding(trigger, None, f'table {trigger.table} is not created by the migrations')
+    incomparable = _incomparable(table)
+    if incomparable:
+        return Finding(trigger, None, f'OLD.* and NEW.* cannot be compared: no equality for {", ".join(incomparable)}')
+    function = schema.functions.get(trigger.function)
+    if not include_all:
+        if function is None:
+            return Finding(trigger, None, f'function {trigger.function} is not created by the migrations')
+        if touched_columns(function.sql) is None:
+            return Finding(trigger, None, f'{trigger.function} does more than set NEW columns (--all guards it anyway)')
+    return Finding(trigger, add_guard(sql), None)
+
+
+def guard_triggers(content, schema, include_all=False, keep=None):
+    """Add the guard to every CREATE TRIGGER that needs one, top level or inside a DO block.
+
+    Returns (new content, [Finding]) with a Finding for every trigger that
+    runs on no-op updates, guarded or not. With keep, a TriggerInfo ->
+    bool, the triggers it rejects are neither reported nor rewritten.
+    """
+    findings = []
+
+    def rewrite_trigger(stmt, line):
+        trigger = parse_trigger(stmt.text, line)
+        if trigger and keep is not None and not keep(trigger):
+            return None
+        finding = trigger and check_trigger(trigger, stmt.text, schema, include_all)
+        if not finding:
+            return None
+        findings.append(finding)
+        return finding.guard
+
+    def rewrite_block(block, first_line):
+        segments = []
+        changed = False
+        for piece in split_block(block):
+            line = first_line + piece.line - 1
+            new = None
+            if piece.starts_with('CREATE'):
+                new = rewrite_trigger(piece, line)
+            elif piece.kind == 'do' and piece.body is not None:
+                body = rewrite_block(piece.body, line + piece.text.count('\n', 0, piece.bodies[0][0]))
+                new = None if body is None else piece.replace_body(body)
+            changed = changed or new is not None
+            segments.append(piece if new is None else new)
+        return join_segments(segments) if changed else None
+
+    def rewrite(stmt):
+        if stmt.kind == 'trivia' or 'TRIGGER' not in stmt.text.upper():
+            return None
+        if stmt.starts_with('CREATE'):
+            return rewrite_trigger(stmt, stmt.line)
+        return rewrite_block(stmt.text, stmt.line)
+
+    return rewrite_statements(content, rewrite), findings
+
+
+def inventory(schema):
+    """TriggerInfo of every trigger left after the migrations, by table"""
+    tables = {}
+    for (table, _), trigger in sorted(schema.triggers.items()):
+        info = parse_trigger(trigger.sql, trigger.source)
+        if info is not None:
+            tables.setdefault(table, []).append(info)
+    return tables
+
+
+def fan_out(schema, triggers=None):
+    """{(table, event): (direct row triggers, row triggers run in total)} following what trigger functions write"""
+    triggers = triggers if triggers is not None else inventory(schema)
+    writes = {name: function_writes(f.sql) for name, f in schema.functions.items()}
+
+    def fired(table, event):
+        return [t for t in triggers.get(table, ()) if t.level == 'ROW' and event in t.events]
+
+    def total(table, event, seen):
+        count = 0
+        for t in fired(table, event):
+            count += 1
+            for target in writes.get(t.function, ()):
+                if target not in seen:
+                    count += total(target[1], target[0], seen | {target})
+        return count
+
+    result = {}
+    for table in triggers:
+        for event in EVENTS[:3]:
+            direct = len(fired(table, event))
+            if direct:
+                result[(table, event)] = (direct, total(table, event, {(event, table)}))
+    return result
+
+
+def format_inventory(triggers):
+    lines = []
+    for table, infos in triggers.items():
+        lines.append(f'  {table}')
+        for t in infos:
+            events = ' OR '.join(e + (f' OF {", ".join(t.columns)}' if e == 'UPDATE' and t.columns else '')
+                                 for e in t.events)
+            when = f' {t.when}' if t.when else ''
+            lines.append(f'    {t.timing} {events} FOR EACH {t.level}{when}: {t.name} -> {t.function}()')
+    return '\n'.join(lines)
+
+
+def format_findings(findings, file_path=None):
+    lines = []
+    for finding in findings:
+        t = finding.trigger
+        where = f'{file_path}:{t.source}' if file_path else f'line {t.source}'
+        if finding.guard:
+            lines.append(f'  {where}: trigger {t.name} on {t.table}: guarded with {GUARD}')
+        else:
+            lines.append(f'  {where}: trigger {t.name} on {t.table} runs on no-op updates: {finding.reason}')
+    return '\n'.join(lines)
+
+
+def format_fan_out(counts):
+    lines = []
+    for (table, event), (direct, total) in sorted(counts.items(), key=lambda item: (-item[1][1], item[0])):
+        cascade = f', {total} with the triggers its functions set off' if total != direct else ''
+        lines.append(f'  {table} {event}: {direct} row trigger{"s" if direct != 1 else ""} per row{cascade}')
+    return '\n'.join(lines)
+
+
+def guard_update_triggers_sql(content):
+    """Pass form: guard the triggers of one migration, judged by the tables and functions it creates"""
+    schema = apply_sql(Schema(), content)
+    content, findings = guard_triggers(content, schema)
+    guarded = [f for f in findings if f.guard]
+    if guarded:
+        print(format_findings(guarded))
+    return content
+
+
+def guard_migration(schema, findings, suppress):
+    """A migration that re-creates the guarded triggers on a database that ran the old ones"""
+    parts = ['-- Skip row triggers on UPDATEs that change nothing']
+    for finding in findings:
+        if finding.guard:
+            t = finding.trigger
+            parts.append(f'DROP TRIGGER IF EXISTS {t.name} ON {t.table};\n{finding.guard.strip()}')
+    for table in suppress:
+        parts.append(f'DROP TRIGGER IF EXISTS {SUPPRESS_TRIGGER} ON {table};\n'
+                     f'CREATE TRIGGER {SUPPRESS_TRIGGER}\n  BEFORE UPDATE ON {table}\n'
+                     f'  FOR EACH ROW EXECUTE FUNCTION suppress_redundant_updates_trigger();')
+    return '\n\n'.join(parts) + '\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inventory row-level triggers and guard the ones that fire on "
+                                                 "no-op updates.")
+    parser.add_argument('--dir', default=MIGRATION_DIR, help=f"migration directory (default: {MIGRATION_DIR})")
+    parser.add_argument('--all', action='store_true', help="also guard triggers whose functions have side effects")
+    parser.add_argument('--fix', action='store_true', help="add the guards to the CREATE TRIGGER statements in place")
+    parser.add_argument('--migration', action='store_true',
+                        help="write a new migration that re-creates the guarded triggers")
+    parser.add_argument('--suppress', action='append', default=[], metavar='TABLE',
+                        help="with --migration, also skip writing unchanged rows of TABLE "
+                             "(UPDATE ... RETURNING then leaves those rows out)")
+    parser.add_argument('--check', action='store_true', help="exit 1 if a row trigger runs on no-op updates")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.dir):
+        print(f"Migration directory {args.dir} not found!")
+        return 1
+    if args.suppress and not args.migration:
+        parser.error("--suppress needs --migration")
+
+    schema = load_schema(args.dir)
+    triggers = inventory(schema)
+    print(f"Row and statement triggers after {len(find_migrations(args.dir))} migrations:")
+    print(format_inventory(triggers) or '  (none)')
+    print("\nTrigger fan-out:")
+    print(format_fan_out(fan_out(schema, triggers)) or '  (no row triggers)')
+
+    unknown = [t for t in args.suppress if normalize_name(t) not in schema.tables]
+    if unknown:
+        print(f"\n✗ Not created by the migrations: {', '.join(unknown)}")
+        return 1
+
+    print("\nRow triggers that run on no-op updates:")
+    findings = []
+    for file_path in find_migrations(args.dir):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        def survives(trigger):
+            # Only the definition that survives matters; a trigger dropped later is history
+            final = schema.triggers.get((trigger.table, trigger.name))
+            return final is not None and final.source == (file_path, trigger.source)
+
+        new, file_findings = guard_triggers(content, schema, args.all, survives)
+        if not file_findings:
+            continue
+        findings += file_findings
+        print(format_findings(file_findings, file_path))
+        if args.fix and new != content:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(new)
+            print(f"  ✓ Rewrote {file_path}")
+
+    guarded = [f for f in findings if f.guard]
+    print(f"\n{len(findings)} row triggers run on no-op updates, {len(guarded)} can be guarded.")
+    if args.migration and (guarded or args.suppress):
+        path = migration_path(args.dir, 'guard_update_triggers')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(guard_migration(schema, guarded, args.suppress))
+        print(f"✓ Wrote {path}")
+    return 1 if args.check and findings else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,50 +3,99 @@ import os
 import re
 import glob
 
+from sql_lexer import (block_balance, closes_nested_do, join_segments, opens_nested_do, rewrite_statements,
+                       significant_tokens, split_statements, trigger_signature)
+
 def wrap_orphaned_if_not_exists(content):
     # Find orphaned IF NOT EXISTS (not in DO blocks) and wrap in DO $$ ... END $$;
-    pattern = re.compile(r'^(\s*)IF NOT EXISTS \((.*?)\) THEN\s*(.*?);$', re.MULTILINE | re.DOTALL)
-    def replacer(match):
-        indent, condition, statement = match.groups()
-        return (f'{indent}DO $$\n{indent}BEGIN\n{indent}    IF NOT EXISTS ({condition}) THEN\n{indent}        {statement};\n{indent}    END IF;\n{indent}END $$;')
-    return pattern.sub(replacer, content)
+    segments = split_statements(content)
+    out = []
+    skip_end_if = False
+    for stmt in segments:
+        if skip_end_if and stmt.kind != 'trivia':
+            skip_end_if = False
+            if stmt.head == ('END', 'IF', ';'):
+                # The END IF; that closed the orphan now lives inside the DO block
+                if out and out[-1].kind == 'trivia' and not out[-1].text.strip():
+                    out.pop()
+                continue
+        if not stmt.starts_with('IF', 'NOT', 'EXISTS'):
+            out.append(stmt)
+            continue
+        match = re.match(r'IF NOT EXISTS\s*(\(.*\))\s*THEN\s*(.*);\Z', stmt.text, re.DOTALL)
+        if not match:
+            out.append(stmt)
+            continue
+        condition, statement = match.groups()
+        previous = out[-1].text if out and out[-1].kind == 'trivia' else ''
+        indent = previous[previous.rfind('\n') + 1:] if not previous[previous.rfind('\n') + 1:].strip() else ''
+        out.append(f'DO $$\n{indent}BEGIN\n{indent}    IF NOT EXISTS {condition} THEN\n{indent}        {statement};\n{indent}    END IF;\n{indent}END $$;')
+        skip_end_if = True
+    return join_segments(out)
 
 def fix_create_table(content):
     # Standardize CREATE TABLE IF NOT EXISTS with proper spacing
-    content = re.sub(r'CREATE\s+TABLE\s+IFNOTEXISTS', 'CREATE TABLE IF NOT EXISTS', content, flags=re.IGNORECASE)
-    content = re.sub(r'CREATE\s+TABLE\s+IF\s+NOT\s+EXISTS', 'CREATE TABLE IF NOT EXISTS', content, flags=re.IGNORECASE)
-    return content
+    def standardize(stmt):
+        if not stmt.starts_with('CREATE', 'TABLE'):
+            return None
+        return re.sub(r'\ACREATE\s+TABLE\s+IF\s*NOT\s*EXISTS\b', 'CREATE TABLE IF NOT EXISTS', stmt.text, flags=re.IGNORECASE)
+    return rewrite_statements(content, standardize)
+
+def _fix_body(body, terminator):
+    words = [tok.text.upper() for tok in significant_tokens(body) if tok.kind == 'word']
+    if 'BEGIN' not in words:
+        return f'\nBEGIN\n{body.strip()}\n{terminator}'
+    if block_balance(body)['begin'] > 0:
+        # Fix missing END; before $$
+        return f'{body.rstrip()}\n{terminator}'
+    return body
 
 def fix_functions_and_triggers(content):
     # Ensure all functions/triggers have BEGIN ... END;
-    def func_replacer(match):
-        header = match.group(1)
-        body = match.group(2)
-        if not re.search(r'\bBEGIN\b', body, re.IGNORECASE):
-            return f'{header}\nBEGIN\n{body}\nEND;'
-        return match.group(0)
-    # Fix trigger functions
-    content = re.sub(r'(CREATE OR REPLACE FUNCTION [^\(]+\([^\)]*\)\s*RETURNS [^$]+\$\$)(.*?)(END;\s*\$\$)', func_replacer, content, flags=re.DOTALL | re.IGNORECASE)
-    # Fix missing END; before $$
-    content = re.sub(r'(BEGIN[\s\S]*?)(\$\$)', lambda m: m.group(1).rstrip().endswith('END;') and m.group(0) or m.group(1).rstrip() + '\nEND;' + m.group(2), content, flags=re.IGNORECASE)
-    return content
+    in_nested = False
+    def fix_block(stmt):
+        nonlocal in_nested
+        # DO $$ ... DO $$ ends the outer body at the inner $$; its BEGIN is closed
+        # by the top-level pieces up to END $$, so leave the whole block alone
+        if in_nested:
+            in_nested = stmt.kind == 'trivia' or not closes_nested_do(stmt)
+            return None
+        if opens_nested_do(stmt):
+            in_nested = True
+            return None
+        if stmt.kind not in ('function', 'do') or stmt.body is None:
+            return None
+        # Only plpgsql bodies need BEGIN/END; SQL functions are plain statements
+        if stmt.kind == 'function' and 'PLPGSQL' not in stmt.text.upper().replace("'", ''):
+            return None
+        body = _fix_body(stmt.body, 'END;\n' if stmt.kind == 'function' else 'END ')
+        return None if body == stmt.body else stmt.replace_body(body)
+    return rewrite_statements(content, fix_block)
 
 def fix_triggers(content):
     # Ensure all triggers are dropped before created
-    pattern = re.compile(r'CREATE TRIGGER ([^\s]+)', re.IGNORECASE)
-    triggers = pattern.findall(content)
-    for trig in set(triggers):
-        drop_stmt = f'DROP TRIGGER IF EXISTS {trig} '
-        if drop_stmt.strip() not in content:
-            # Find where CREATE TRIGGER occurs and insert DROP before it
-            content = re.sub(rf'(CREATE TRIGGER {trig})', f'{drop_stmt}ON', content, count=1, flags=re.IGNORECASE)
-    return content
+    dropped = set()
+    def add_drop(stmt):
+        signature = trigger_signature(stmt)
+        if not signature:
+            return None
+        if stmt.starts_with('DROP'):
+            dropped.add(signature)
+            return None
+        if signature in dropped:
+            return None
+        trig, table = signature
+        return f'DROP TRIGGER IF EXISTS {trig} ON {table};\n{stmt.text}'
+    return rewrite_statements(content, add_drop)
 
 def fix_semicolons_and_spaces(content):
     # Ensure all statements end with semicolons and proper spacing
-    content = re.sub(r';\s*\n', ';\n', content)
-    content = re.sub(r'\n{3,}', '\n\n', content)
-    return content
+    def tidy(stmt):
+        if stmt.kind != 'trivia':
+            return None
+        text = re.sub(r'\A\s*\n', '\n', stmt.text) if stmt.start else stmt.text
+        return re.sub(r'\n{3,}', '\n\n', text)
+    return rewrite_statements(content, tidy)
 
 def fix_all_migrations():
     migration_dir = "supabase/migrations"
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""Offline structural check of the migrations' PL/pgSQL blocks.
+
+fix_end_if, fix_duplicate_end_if, fix_missing_begin, final_function_fix and
+final_nuclear_cleanup each repair one kind of unbalanced block, and each was
+written after a `supabase db reset` failed on it. This finds the same
+problems without a database: unterminated $$ bodies, strings and comments,
+nested DO blocks that reuse the outer $$ tag, PL/pgSQL outside any body,
+BEGIN/IF/LOOP/CASE and their END that do not pair up, and missing
+semicolons. Diagnostics are file:line, so it fits a pre-commit hook.
+
+--fix applies a repair only when the repaired block then checks clean;
+anything else is left as it is and still reported.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+from collections import namedtuple
+
+from final_nuclear_cleanup import drop_extra_ends
+from fix_duplicate_end_if import drop_extra_end_ifs
+from fix_end_if import close_open_ifs
+from sql_lexer import (block_balance, block_event, closes_nested_do, opens_nested_do, significant_tokens, split_block,
+                       split_statements, terminated, tokenize)
+
+MIGRATION_DIR = "supabase/migrations"
+
+Diagnostic = namedtuple('Diagnostic', 'line message')
+
+# A line starting with one of these inside a statement means the ';' before it is missing
+STATEMENT_STARTS = frozenset(('CREATE', 'ALTER', 'DROP', 'INSERT', 'GRANT', 'REVOKE'))
+BODY_STATEMENT_STARTS = STATEMENT_STARTS | {'END', 'RETURN', 'RAISE', 'PERFORM'}
+
+# Statements that only make sense inside a PL/pgSQL body
+PLPGSQL_ONLY = frozenset(('IF', 'ELSIF', 'ELSE', 'LOOP', 'RETURN', 'RAISE', 'PERFORM', 'DECLARE', 'EXCEPTION'))
+
+_OPENERS = {'begin': 'BEGIN', 'if': 'IF', 'loop': 'LOOP', 'case': 'CASE'}
+_CLOSERS = {'end': 'begin', 'end_if': 'if', 'end_loop': 'loop', 'end_case': 'case'}
+
+
+def _line_at(text, offset, first_line):
+    return first_line + text.count('\n', 0, offset)
+
+
+_WHAT = {'string': 'string', 'quoted_ident': 'quoted identifier', 'comment': '/* comment'}
+
+
+def unterminated(sql, segments, first_line=1):
+    """Diagnostic for a string, identifier, comment or $$ body that runs off the end, or None.
+
+    Such a token always runs to the end of the input, so only the tokens of
+    the last of the split_statements() segments need a look.
+    """
+    if not segments:
+        return None
+    last = segments[-1]
+    tok = None
+    for tok in tokenize(last.text):
+        pass
+    if tok is None or terminated(tok):
+        return None
+    what = f"{tok.text[:tok.text.index('$', 1) + 1]} body" if tok.kind == 'dollar' else _WHAT[tok.kind]
+    return Diagnostic(_line_at(sql, last.start + tok.start, first_line), f'unterminated {what} runs to the end of the file')
+
+
+def missing_semicolons(text, starts, first_line):
+    """[(offset to insert ';' at, Diagnostic)] for lines inside one statement that start a new statement"""
+    found = []
+    depth = case_depth = 0
+    previous = None
+    for tok in significant_tokens(text):
+        word = tok.text.upper() if tok.kind == 'word' else None
+        if (previous is not None and word in starts and not depth and not case_depth
+                and '\n' in text[previous.start + len(previous.text):tok.start]
+                and not (word == 'END' and previous.kind == 'word' and previous.text.upper() == 'END')):
+            end = previous.start + len(previous.text)
+            found.append((end, Diagnostic(_line_at(text, end, first_line), f"missing ';' before {word}")))
+        if tok.text == '(':
+            depth += 1
+        elif tok.text == ')':
+            depth = max(depth - 1, 0)
+        elif word == 'CASE' and not (previous is not None and previous.text.upper() == 'END'):
+            case_depth += 1
+        elif word == 'END' and case_depth:
+            case_depth -= 1
+        previous = tok
+    return found
+
+
+def _insert_semicolons(text, found):
+    for offset, _ in sorted(found, reverse=True):
+        text = text[:offset] + ';' + text[offset:]
+    return text
+
+
+def language(stmt):
+    """Lower-cased LANGUAGE of a function or DO statement, None when it has no LANGUAGE clause"""
+    offset, length = stmt.bodies[0]
+    words = [tok.text for tok in significant_tokens(stmt.text[:offset] + ' ' + stmt.text[offset + length:])]
+    for a, b in zip(words, words[1:]):
+        if a.upper() == 'LANGUAGE':
+            return b.strip("'\"").lower()
+    return None
+
+
+def check_body(body, first_line=1):
+    """Diagnostics for a PL/pgSQL block body that starts on line first_line"""
+    diagnostics = []
+    statements = [stmt for stmt in split_block(body) if stmt.kind != 'trivia']
+    if not statements:
+        return [Diagnostic(first_line, 'empty block body')]
+    first = statements[0].head
+    if first[:2] == ('<', '<') and '>' in first:
+        first = first[first.index('>') + 2:]
+    if first[:1] not in (('BEGIN',), ('DECLARE',)):
+        diagnostics.append(Diagnostic(_line_at(body, statements[0].start, first_line),
+                                      f'block starts with {statements[0].head[0]} instead of BEGIN or DECLARE'))
+    stack = []
+    closed = False
+    for stmt in statements:
+        line = _line_at(body, stmt.start, first_line)
+        if closed:
+            diagnostics.append(Diagnostic(line, "statement after the block's final END"))
+            break
+        for _, diagnostic in missing_semicolons(stmt.text, BODY_STATEMENT_STARTS, line):
+            diagnostics.append(diagnostic)
+        if stmt.kind == 'do' and stmt.body is not None:
+            diagnostics.extend(check_sql(stmt.text, line))
+            continue
+        event = block_event(stmt)
+        if event in _OPENERS:
+            stack.append((event, line))
+        elif event in _CLOSERS:
+            expected = _CLOSERS[event]
+            closer = 'END' if event == 'end' else f'END {expected.upper()}'
+            if any(kind == expected for kind, _ in stack):
+                while stack[-1][0] != expected:
+                    kind, opened = stack.pop()
+                    diagnostics.append(Diagnostic(line, f'{closer} closes {_OPENERS[expected]} while the '
+                                                        f'{_OPENERS[kind]} from line {opened} is still open'))
+                stack.pop()
+                closed = not stack and event == 'end'
+            else:
+                diagnostics.append(Diagnostic(line, f'{closer} without an open {_OPENERS[expected]}'))
+    for kind, opened in reversed(stack):
+        diagnostics.append(Diagnostic(opened, f'{_OPENERS[kind]} is never closed'))
+    return diagnostics
+
+
+def top_level(segments):
+    """Yield (Statement, nested) for the top-level statements of split_statements() segments.
+
+    nested is True for a DO block that opens_nested_do(); the statements up to
+    the one that closes it belong to it and are not yielded.
+    """
+    in_nested = False
+    for stmt in segments:
+        if stmt.kind == 'trivia':
+            continue
+        if in_nested:
+            in_nested = not closes_nested_do(stmt)
+            continue
+        in_nested = opens_nested_do(stmt)
+        yield stmt, in_nested
+
+
+def check_sql(sql, first_line=1):
+    """Diagnostics for a migration (or a nested DO statement) that starts on line first_line"""
+    segments = split_statements(sql)
+    problem = unterminated(sql, segments, first_line)
+    if problem:
+        return [problem]
+    diagnostics = []
+    statements = list(top_level(segments))
+    for stmt, nested in statements:
+        line = _line_at(sql, stmt.start, first_line)
+        if nested:
+            diagnostics.append(Diagnostic(line, 'nested DO block reuses the outer $$ tag, which ends the outer body '
+                                                'early; give the inner block its own tag'))
+            continue
+        for _, diagnostic in missing_semicolons(stmt.text, STATEMENT_STARTS, line):
+            diagnostics.append(diagnostic)
+        if not stmt.text.endswith(';') and stmt is statements[-1][0]:
+            diagnostics.append(Diagnostic(line, "last statement does not end with ';'"))
+        if stmt.kind in ('do', 'function'):
+            diagnostics.extend(_check_routine(stmt, line))
+        elif _stray(stmt):
+            diagnostics.append(Diagnostic(line, f'{" ".join(stmt.head[:2])} outside a DO block or function body'))
+    return diagnostics
+
+
+def _stray(stmt):
+    """True for PL/pgSQL statements at the top level of a migration"""
+    head = stmt.head
+    if head[:1] == ('BEGIN',):
+        # BEGIN; and BEGIN TRANSACTION/WORK are transaction control
+        return head[1:2] not in ((';',), ('TRANSACTION',), ('WORK',), ('ISOLATION',))
+    if head[:1] == ('END',):
+        return head[1:2] in (('IF',), ('LOOP',), ('CASE',)) or closes_nested_do(stmt)
+    return head[:1] != () and head[0] in PLPGSQL_ONLY
+
+
+def _check_routine(stmt, line):
+    if stmt.body is None:
+        if stmt.kind == 'do':
+            return [Diagnostic(line, 'DO without a dollar-quoted body')]
+        return []
+    lang = language(stmt)
+    if lang is None and stmt.kind == 'function':
+        return [Diagnostic(line, 'function has no LANGUAGE clause')]
+    if (lang or 'plpgsql') != 'plpgsql':
+        return []
+    return check_body(stmt.body, _line_at(stmt.text, stmt.bodies[0][0], line))
+
+
+def _add_begin(body):
+    """Put back a missing BEGIN when the body starts without one and has exactly one END too many"""
+    first = next((stmt for stmt in split_block(body) if stmt.kind != 'trivia'), None)
+    if first is None or first.head[:1] in (('BEGIN',), ('DECLARE',), ('<',)) or block_balance(body)['begin'] != -1:
+        return body
+    return '\nBEGIN\n  ' + body.lstrip()
+
+
+def _add_final_end(body):
+    """Close a body whose only imbalance is its missing final END"""
+    balance = block_balance(body)
+    if balance['begin'] <= 0 or any(balance[kind] for kind in ('if', 'loop', 'case')):
+        return body
+    return body.rstrip() + '\n' + 'END;\n' * balance['begin']
+
+
+def _body_semicolons(body):
+    found = []
+    for stmt in split_block(body):
+        if stmt.kind != 'trivia':
+            found.extend((stmt.start + offset, d) for offset, d in missing_semicolons(stmt.text, BODY_STATEMENT_STARTS, 1))
+    return _insert_semicolons(body, found)
+
+
+# Tried in order; each is kept when it leaves fewer problems, and the result only when none are left
+BODY_REPAIRS = (_body_semicolons, drop_extra_end_ifs, _add_begin, drop_extra_ends, _add_final_end, close_open_ifs)
+
+
+def repair_body(body):
+    """Repaired body, or None when the repairs cannot make it check clean"""
+    problems = len(check_body(body))
+    for repair in BODY_REPAIRS:
+        if not problems:
+            break
+        candidate = repair(body)
+        if candidate != body:
+            remaining = len(check_body(candidate))
+            if remaining < problems:
+                body, problems = candidate, remaining
+    return body if not problems else None
+
+
+def fix_sql(sql):
+    """sql with every provable repair applied"""
+    segments = split_statements(sql)
+    if unterminated(sql, segments):
+        return sql
+    found = []
+    statements = [stmt for stmt, nested in top_level(segments) if not nested]
+    for stmt in statements:
+        found.extend((stmt.start + offset, d) for offset, d in missing_semicolons(stmt.text, STATEMENT_STARTS, 1))
+    if statements and not statements[-1].text.endswith(';'):
+        found.append((statements[-1].end, None))
+    sql = _insert_semicolons(sql, found)
+
+    out = []
+    last = 0
+    for stmt, nested in top_level(split_statements(sql)):
+        if nested or stmt.kind not in ('do', 'function') or stmt.body is None:
+            continue
+        if (language(stmt) or ('plpgsql' if stmt.kind == 'do' else None)) != 'plpgsql' or not check_body(stmt.body):
+            continue
+        body = repair_body(stmt.body)
+        if body is not None:
+            out.append(sql[last:stmt.start])
+            out.append(stmt.replace_body(body))
+            last = stmt.end
+    out.append(sql[last:])
+    return ''.join(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the PL/pgSQL block structure of the migrations offline.")
+    parser.add_argument('files', nargs='*', help="migration files (default: every *.sql in --dir)")
+    parser.add_argument('--dir', default=MIGRATION_DIR, help=f"migration directory (default: {MIGRATION_DIR})")
+    parser.add_argument('--fix', action='store_true', help="apply the repairs that make a block check clean")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    migration_files = sorted(args.files or glob.glob(os.path.join(args.dir, "*.sql")))
+    total = 0
+    fixed = 0
+    for file_path in migration_files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        diagnostics = check_sql(content)
+        if diagnostics and args.fix:
+            new = fix_sql(content)
+            if new != content:
+                remaining = check_sql(new)
+                fixed += len(diagnostics) - len(remaining)
+                diagnostics = remaining
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(new)
+                print(f"✓ {file_path}: repaired")
+        for diagnostic in diagnostics:
+            print(f"{file_path}:{diagnostic.line}: {diagnostic.message}")
+        total += len(diagnostics)
+
+    elapsed = (time.perf_counter() - started) * 1000
+    summary = f"{total} problems in {len(migration_files)} files ({elapsed:.0f} ms)"
+    if args.fix:
+        summary += f", {fixed} repaired"
+    print(summary)
+    return 1 if total else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())